@@ -0,0 +1,146 @@
+import asyncio
+import time
+import chatlib
+import server_log
+from server_log import logger
+
+server = None  # the running server module whose handlers and globals are reused, bound by run()
+REAP_INTERVAL = 1.0  # max seconds between timer checks (a new session or room may be due before the soonest one)
+waiters = {}  # paused sessions to the future their connection coroutine waits on until the login completes
+
+
+class StreamConnection:
+    """
+    socket-like adaptor over an asyncio stream pair, so sessions of this engine can be handled by the
+    server.handle_*_message functions unchanged (they only need send() and close())
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    def send(self, data):
+        """
+        queue data on the transport, which writes it (also after close())
+        :return: number of bytes queued (all of them)
+        """
+        if self.closed:
+            return 0
+        self.writer.write(data)
+        return len(data)
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+async def handle_connection(reader, writer):
+    """
+    serve one client: read messages, dispatch them to server.handle_client_message and write back the replies.
+    The coroutine sleeps in reader.read() while the client is idle, so idle players cost no CPU.
+    :param reader: asyncio.StreamReader
+    :param writer: asyncio.StreamWriter
+    :return:
+    """
+    if server.is_full():
+        logger.info("refusing client %s: %d connections", writer.get_extra_info("peername"),
+                    len(server.sessions))
+        writer.write(server.refuse_message())
+        writer.close()
+        return
+    server.set_keepalive(writer.get_extra_info("socket"))
+    conn = StreamConnection(reader, writer)
+    session = server.add_session(conn, writer.get_extra_info("socket").fileno(), writer.get_extra_info("peername"))
+    try:
+        while not conn.closed:
+            received = await reader.read(chatlib.READER_BUFFER_SIZE)
+            if not received:  # client closed the connection
+                raise ConnectionResetError
+            session.last_active = time.monotonic()
+            session.reader.feed(received)
+            for cmd, data in session.reader:
+                if conn.closed:  # logged out by a previous message
+                    break
+                if server_log.tracing and server_log.sampled():
+                    server_log.trace_logger.debug("[CLIENT] %s %s %s", session.peername, cmd, data)
+                server.handle_client_message(session, cmd, data)
+                if session.paused:  # the login is being verified, the next messages wait for its result
+                    waiters[session] = asyncio.get_running_loop().create_future()
+                    await waiters[session]
+            server.store.commit()
+            if session.outbox and not conn.closed:
+                writer.write(session.outbox.take())
+                await writer.drain()
+    except ConnectionError:
+        if not conn.closed:
+            logger.info("client %s forced disconnect", session.peername)
+            server.handle_logout_message(session)
+    return
+
+
+def resume_sessions():
+    """
+    reader callback of the verifier: complete the verified logins and wake up the connection coroutines
+    of their sessions
+    :return:
+    """
+    server.verifier.run_completed()
+    while server.resumed:
+        waiter = waiters.pop(server.resumed.popleft(), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+    return
+
+
+async def run_timers():
+    """
+    close the sessions that timed out and run the rooms' rounds, waking up at the soonest timer.
+    Then write the messages the rounds pushed, which no connection coroutine is waiting to write
+    :return:
+    """
+    while True:
+        timeout = server.timers.timeout(time.monotonic())
+        await asyncio.sleep(REAP_INTERVAL if timeout is None else min(timeout, REAP_INTERVAL))
+        server.run_timers(time.monotonic())
+        for session in server.pushed:
+            if session.outbox and not session.conn.closed:
+                session.conn.writer.write(session.outbox.take())
+        server.pushed.clear()
+        server.store.commit()
+
+
+async def serve(server_ip, server_port, reuse_port=False):
+    """
+    asyncio engine: one coroutine per connection on top of asyncio.start_server
+    :param server_ip: ip to listen on
+    :param server_port: port to listen on
+    :param reuse_port: let other processes listen on the same port
+    :return:
+    """
+    logger.info("Setting up server...")
+    async_server = await asyncio.start_server(handle_connection, server_ip, server_port, reuse_port=reuse_port)
+    logger.info("Listening for clients... IP: %s PORT: %s", server_ip, server_port)
+    timers = asyncio.create_task(run_timers())
+    asyncio.get_running_loop().add_reader(server.verifier.fileno(), resume_sessions)
+    async with async_server:
+        await async_server.serve_forever()
+    timers.cancel()
+
+
+def run(server_module, server_ip, server_port, reuse_port=False):
+    """
+    run the asyncio engine until interrupted
+    :param server_module: server module (its handlers and globals are shared with the select engine)
+    :param server_ip: ip to listen on
+    :param server_port: port to listen on
+    :param reuse_port: let other processes listen on the same port
+    :return:
+    """
+    global server
+    server = server_module
+    try:
+        asyncio.run(serve(server_ip, server_port, reuse_port))
+    except KeyboardInterrupt:
+        pass
+    return
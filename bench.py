@@ -0,0 +1,223 @@
+import argparse
+import os
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import chatlib
+import user_store
+from trivia_client import TriviaClient, TriviaError
+
+BENCH_USERS_JSON = "bench_users.json"
+DEFAULT_MIX = "GET_QUESTION=4,SEND_ANSWER=4,MY_SCORE=1,HIGHSCORE=1"
+THREAD_STACK_SIZE = 256 * 1024  # players are threads, keep their stacks small so thousands fit
+SERVER_START_TIMEOUT = 10.0  # seconds to wait for a started server to accept connections
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def bench_user(i):
+    return "bench%d" % i, "pass%d" % i
+
+
+def write_users(users_json, players):
+    """
+    write a scratch users json with one account per player
+    :param users_json: users json file name
+    :param players: number of players
+    :return:
+    """
+    users = {}
+    for i in range(players):
+        username, password = bench_user(i)
+        users[username] = {"password": password, "score": 0, "questions_asked": [], "questions_answered": []}
+    user_store.write_users_atomic(users_json, users)
+    user_store.remove_journal(users_json)
+    return
+
+
+def parse_mix(mix):
+    """
+    :param mix: comma separated cmd=weight pairs, e.g. DEFAULT_MIX
+    :return: list of commands, list of their weights
+    """
+    commands, weights = [], []
+    for pair in mix.split(","):
+        cmd, weight = pair.split("=")
+        if cmd not in (chatlib.get_question_msg, chatlib.send_answer_msg, chatlib.my_score_msg,
+                       chatlib.highscore_msg, chatlib.logged_msg):
+            raise ValueError("unsupported command in mix: " + cmd)
+        commands.append(cmd)
+        weights.append(float(weight))
+    return commands, weights
+
+
+def timed_request(client, latencies, errors, cmd, data=""):
+    """
+    send one request and record its latency
+    :param client: TriviaClient
+    :return: cmd, data of the reply
+    """
+    started = time.perf_counter()
+    reply_cmd, reply_data = client.request(cmd, data)
+    latencies.setdefault(cmd, []).append(time.perf_counter() - started)
+    if reply_cmd == chatlib.error_msg:
+        errors[cmd] = errors.get(cmd, 0) + 1
+    return reply_cmd, reply_data
+
+
+def timed_login(client, latencies, errors, username, password):
+    """
+    log in and record the latency
+    :return: True if logged in
+    """
+    started = time.perf_counter()
+    try:
+        client.login(username, password)
+        return True
+    except TriviaError:
+        errors[chatlib.login_msg] = errors.get(chatlib.login_msg, 0) + 1
+        return False
+    finally:
+        latencies.setdefault(chatlib.login_msg, []).append(time.perf_counter() - started)
+
+
+def play(server_ip, server_port, player, requests, commands, weights, seed, protocol):
+    """
+    one simulated player: log in, send requests drawn from the mix and log out
+    :return: dictionary of cmd to list of latencies (seconds), dictionary of cmd to error count
+    """
+    latencies, errors = {}, {}
+    rng = random.Random(seed + player)
+    with TriviaClient(server_ip, server_port, protocol) as client:
+        if not timed_login(client, latencies, errors, *bench_user(player)):
+            return latencies, errors
+        question = None  # qid of the last question, answered by the next SEND_ANSWER
+        for cmd in rng.choices(commands, weights, k=requests):
+            if cmd == chatlib.send_answer_msg and question is None:
+                cmd = chatlib.get_question_msg
+            if cmd == chatlib.send_answer_msg:
+                timed_request(client, latencies, errors, cmd, chatlib.build_answer(question, rng.randint(1, 4)))
+                question = None
+            else:
+                reply_cmd, reply_data = timed_request(client, latencies, errors, cmd)
+                if reply_cmd == chatlib.your_question_msg:
+                    question = chatlib.parse_question(reply_data)[0]
+        client.logout()
+    return latencies, errors
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def report(latencies, errors, elapsed):
+    """
+    :param latencies: dictionary of cmd to list of latencies (seconds)
+    :param errors: dictionary of cmd to error count
+    :param elapsed: wall time of the run (seconds)
+    :return: report (str): overall requests/s, then per command count, errors, requests/s and latency percentiles
+    """
+    total = sum(len(values) for values in latencies.values())
+    lines = ["%d requests in %.2fs: %.0f requests/s" % (total, elapsed, total / elapsed),
+             "%-16s %8s %7s %9s %8s %8s %8s" % ("cmd", "count", "errors", "req/s", "p50_ms", "p95_ms", "p99_ms")]
+    for cmd, values in sorted(latencies.items()):
+        values.sort()
+        lines.append("%-16s %8d %7d %9.0f " % (cmd, len(values), errors.get(cmd, 0), len(values) / elapsed) +
+                     " ".join("%8.2f" % (percentile(values, fraction) * 1e3) for fraction in PERCENTILES))
+    return "\n".join(lines)
+
+
+def run(server_ip, server_port, players, requests, mix, seed, protocol=chatlib.PROTOCOL_V1):
+    """
+    run players concurrently against a server whose users include the bench accounts
+    :return: report (str)
+    """
+    commands, weights = parse_mix(mix)
+    threading.stack_size(THREAD_STACK_SIZE)
+    latencies, errors = {}, {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=players) as executor:
+        results = [executor.submit(play, server_ip, server_port, player, requests, commands, weights, seed, protocol)
+                   for player in range(players)]
+        for result in results:
+            player_latencies, player_errors = result.result()
+            for cmd, values in player_latencies.items():
+                latencies.setdefault(cmd, []).extend(values)
+            for cmd, count in player_errors.items():
+                errors[cmd] = errors.get(cmd, 0) + count
+    return report(latencies, errors, time.perf_counter() - started)
+
+
+def start_server(server_port, users_json, server_args):
+    """
+    start server.py on localhost serving the bench users and wait until it accepts connections
+    :return: subprocess.Popen of the server
+    """
+    process = subprocess.Popen([sys.executable, "server.py", "--ip", "127.0.0.1", "-p", str(server_port),
+                                "--users", users_json] + server_args)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", server_port)).close()
+            return process
+        except ConnectionError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise
+            time.sleep(0.1)
+
+
+def raise_open_files_limit():
+    """
+    every player holds a socket (and so does the server for each of them when started here)
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="trivia server load generator")
+    parser.add_argument("-p", "--port", type=int, default=5678, help="server port")
+    parser.add_argument("--ip", type=str, default="127.0.0.1", help="server ip")
+    parser.add_argument("--players", type=int, default=100, help="number of simulated players")
+    parser.add_argument("--requests", type=int, default=100, help="requests of every player after login")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX,
+                        help="comma separated cmd=weight pairs of GET_QUESTION, SEND_ANSWER, MY_SCORE, "
+                             "HIGHSCORE and LOGGED")
+    parser.add_argument("--users", type=str, default=BENCH_USERS_JSON,
+                        help="scratch users json to generate the players' accounts into")
+    parser.add_argument("--start-server", action="store_true",
+                        help="start server.py on localhost with the scratch users for the run")
+    parser.add_argument("--server-args", type=str, default="--log-level=WARNING --max-connections=0",
+                        help="extra arguments of the started server, e.g. \"--engine=asyncio\"")
+    parser.add_argument("--protocol", type=int, choices=[chatlib.PROTOCOL_V1, chatlib.PROTOCOL_V2],
+                        default=chatlib.PROTOCOL_V1, help="protocol version the players ask for at login")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the players")
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    if args.start_server or not os.path.exists(args.users):  # don't overwrite the users of a running server
+        write_users(args.users, args.players)
+    server = None
+    if args.start_server:
+        server = start_server(args.port, args.users, args.server_args.split())
+    else:
+        print("players log in with the accounts in", args.users, "- the server must run with --users", args.users)
+    try:
+        print(run(args.ip, args.port, args.players, args.requests, args.mix, args.seed, args.protocol))
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
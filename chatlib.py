@@ -3,6 +3,11 @@ MSG_COMPONENTS = 3  # Exact number of components in every message: (conn, cmd, d
 ANS_DATA_COMPONENTS = 2  # Exact number of components in every answer data (qid#ans)
 LOGIN_DATA_COMPONENTS = 2  # Exact number of components in every login data (username#password)
 QUESTION_DATA_COMPONENTS = 6  # Exact number of components in every question data (qid#question#ans1#...#ans4)
+RESULT_DATA_COMPONENTS = 2  # Exact number of components of every answer result (result cmd#result data)
+MAX_BATCH_SIZE = 10  # Max number of questions of GET_QUESTIONS / answers of SEND_ANSWERS
+ROUND_QUESTION_DATA_COMPONENTS = 2 + QUESTION_DATA_COMPONENTS  # round#seconds#qid#question#ans1#...#ans4
+ROUND_RESULT_DATA_COMPONENTS = 4  # round#correct answer#correct players#answering players
+MAX_ROOM_NAME_LENGTH = 32  # Max length of a room name
 CMD_FIELD_LENGTH = 16  # Exact length of cmd field (in bytes)
 LENGTH_FIELD_LENGTH = 4  # Exact length of length field (in bytes)
 MAX_DATA_LENGTH = 10 ** LENGTH_FIELD_LENGTH - 1  # Max size of data field according to protocol
@@ -11,6 +16,11 @@ MAX_MSG_LENGTH = MSG_HEADER_LENGTH + MAX_DATA_LENGTH  # Max size of total messag
 DELIMITER = "|"  # Delimiter character in protocol
 DATA_DELIMITER = "#"  # Delimiter in the data part of the message
 ERROR_RETURN = None  # returned in case of an error
+READER_BUFFER_SIZE = 2 ** 14  # Initial capacity (in bytes) of a MessageReader ring buffer
+PROTOCOL_V1 = 1  # ascii framing: padded cmd field, decimal length field, #-joined data
+PROTOCOL_V2 = 2  # binary framing: opcode byte, varint length, varint length-prefixed utf-8 fields
+MAX_FRAME_DATA_LENGTH = 2 ** 24 - 1  # Max size of the data (fields) of a v2 frame
+MAX_VARINT_LENGTH = 4  # Max size of a varint length (enough for MAX_FRAME_DATA_LENGTH)
 
 # Protocol Client Commands
 login_msg = "LOGIN"
@@ -20,8 +30,15 @@ get_question_msg = "GET_QUESTION"
 send_answer_msg = "SEND_ANSWER"
 my_score_msg = "MY_SCORE"
 highscore_msg = "HIGHSCORE"
+stats_msg = "STATS"
+get_questions_msg = "GET_QUESTIONS"
+send_answers_msg = "SEND_ANSWERS"
+join_room_msg = "JOIN_ROOM"
+leave_room_msg = "LEAVE_ROOM"
+round_answer_msg = "ROUND_ANSWER"
 CLIENT_COMMANDS = [login_msg, logout_msg, logged_msg, get_question_msg, send_answer_msg,
-                   my_score_msg, my_score_msg, highscore_msg]
+                   my_score_msg, my_score_msg, highscore_msg, stats_msg, get_questions_msg, send_answers_msg,
+                   join_room_msg, leave_room_msg, round_answer_msg]
 
 # Protocol Server Commands
 login_ok_msg = "LOGIN_OK"
@@ -33,89 +50,441 @@ wrong_answer_msg = "WRONG_ANSWER"
 your_score_msg = "YOUR_SCORE"
 all_score_msg = "ALL_SCORE"
 no_questions_msg = "NO_QUESTIONS"
+stats_report_msg = "STATS_REPORT"
+your_questions_msg = "YOUR_QUESTIONS"
+answers_result_msg = "ANSWERS_RESULT"
+room_joined_msg = "ROOM_JOINED"
+room_left_msg = "ROOM_LEFT"
+answer_received_msg = "ANSWER_RECEIVED"
+round_question_msg = "ROUND_QUESTION"
+round_result_msg = "ROUND_RESULT"
 SERVER_COMMANDS = [login_ok_msg, error_msg, logged_answer_msg, your_question_msg,
                    correct_answer_msg,
-                   wrong_answer_msg, your_score_msg, all_score_msg, no_questions_msg]
+                   wrong_answer_msg, your_score_msg, all_score_msg, no_questions_msg, stats_report_msg,
+                   your_questions_msg, answers_result_msg, room_joined_msg, room_left_msg, answer_received_msg,
+                   round_question_msg, round_result_msg]
+PUSH_COMMANDS = {round_question_msg, round_result_msg}  # sent by the server on its own, not replies to a request
+
+# Protocol v2 opcodes. Never renumber an opcode, new commands get new ones
+OPCODES = {
+    login_msg: 1, logout_msg: 2, logged_msg: 3, get_question_msg: 4, send_answer_msg: 5, my_score_msg: 6,
+    highscore_msg: 7, stats_msg: 8, get_questions_msg: 9, send_answers_msg: 10, join_room_msg: 11,
+    leave_room_msg: 12, round_answer_msg: 13,
+    login_ok_msg: 64, error_msg: 65, logged_answer_msg: 66, your_question_msg: 67, correct_answer_msg: 68,
+    wrong_answer_msg: 69, your_score_msg: 70, all_score_msg: 71, no_questions_msg: 72, stats_report_msg: 73,
+    your_questions_msg: 74, answers_result_msg: 75, room_joined_msg: 76, room_left_msg: 77,
+    answer_received_msg: 78, round_question_msg: 79, round_result_msg: 80,
+}
+
+
+# Lookup tables built once from the command lists above
+COMMANDS = frozenset(CLIENT_COMMANDS + SERVER_COMMANDS)
+_LENGTH_START = CMD_FIELD_LENGTH + 1  # offset of the length field in a message
+_LENGTH_END = _LENGTH_START + LENGTH_FIELD_LENGTH
+_FAST_LENGTHS = 1024  # data lengths whose length fields are precomputed, longer data is formatted on the fly
+_HEADER_PREFIXES = {cmd: cmd.ljust(CMD_FIELD_LENGTH) + DELIMITER for cmd in COMMANDS}  # "LOGIN" -> "LOGIN  ...|"
+_HEADER_PREFIX_BYTES = {cmd: prefix.encode() for cmd, prefix in _HEADER_PREFIXES.items()}
+_HEADER_CMDS = {prefix: cmd for cmd, prefix in _HEADER_PREFIXES.items()}  # "LOGIN  ...|" -> "LOGIN"
+_HEADER_CMD_BYTES = {prefix: cmd for cmd, prefix in _HEADER_PREFIX_BYTES.items()}
+_LENGTH_FIELDS = ["%04d|" % n for n in range(_FAST_LENGTHS)]  # 9 -> "0009|"
+_LENGTH_FIELD_BYTES = [field.encode() for field in _LENGTH_FIELDS]
+_LENGTH_VALUES = {field: n for n, field in enumerate(_LENGTH_FIELDS)}  # "0009|" -> 9
+_LENGTH_VALUE_BYTES = {field: n for n, field in enumerate(_LENGTH_FIELD_BYTES)}
+_DELIMITER_BYTE = ord(DELIMITER)
+_OPCODE_BYTES = {cmd: bytes((opcode,)) for cmd, opcode in OPCODES.items()}  # "LOGIN" -> b"\x01"
+_OPCODE_CMDS = [None] * 256  # 1 -> "LOGIN"
+for _cmd, _opcode in OPCODES.items():
+    _OPCODE_CMDS[_opcode] = _cmd
+del _cmd, _opcode
+
+
+def encode_varint(n):
+    """
+    :param n: non negative int
+    :return: n as a varint (bytes): 7 bits per byte, least significant first, high bit set on all but the last
+    """
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def decode_varint(buffer, offset=0):
+    """
+    :param buffer: bytes holding a varint at offset
+    :return: value (int), offset after the varint. None, None if the varint is incomplete or longer than
+             MAX_VARINT_LENGTH (check len(buffer) to tell them apart)
+    """
+    value = 0
+    for i in range(MAX_VARINT_LENGTH):
+        if offset + i >= len(buffer):
+            return ERROR_RETURN, ERROR_RETURN
+        byte = buffer[offset + i]
+        value |= (byte & 0x7f) << (7 * i)
+        if byte < 0x80:
+            return value, offset + i + 1
+    return ERROR_RETURN, ERROR_RETURN
+
+
+_VARINTS = [encode_varint(n) for n in range(_FAST_LENGTHS)]  # 9 -> b"\x09"
 
 
 def split_data(data, expected_fields):
     """
     Helper method. gets a string and number of expected fields in it. Splits the string
 	using protocol's data field delimiter (#) and validates that there are correct number of fields.
-    :param data: data (str) to split
+    :param data: data (str) to split, or the list of fields of a v2 message
     :param expected_fields: number of expected fields to split to
     :return: list of fields if all ok. If some error occurred, returns None
     """
-    data_error = [ERROR_RETURN for _ in range(expected_fields)]
-    data = data.split(DATA_DELIMITER)
+    if data.__class__ is not list:  # v2 messages arrive already split
+        data = data.split(DATA_DELIMITER)
     if len(data) != expected_fields:
-        return data_error
+        return [ERROR_RETURN] * expected_fields
     return data
 
 
+def data_fields(data):
+    """
+    Helper method. Gets message data of any protocol version and returns its fields
+    :param data: data (str) of a v1 message or list of fields of a v2 message
+    :return: list of fields, empty for empty data
+    """
+    if data.__class__ is list:
+        return data
+    return data.split(DATA_DELIMITER) if data else []
+
+
 def join_data(data):
     """
     Helper method. Gets a list, joins all of it's fields to one string divided by the data delimiter
     :param data: list of data fields to join using data delimiter (#)
     :return: string that looks like cell1#cell2#cell3
     """
-    return DATA_DELIMITER.join([str(elem) for elem in data])
+    return DATA_DELIMITER.join(map(str, data))
 
 
 def build_message(cmd, data):
     """
-    build and return message matching the protocol
+    build and return message matching the protocol.
+    The length field counts the bytes of the utf-8 encoded data, as encode_message does
     :param cmd: command (str) matching the defined protocol
     :param data: content (str) to send, can be empty ("")
     :return: message matching the defined protocol
     """
-    data = str(data)
+    prefix = _HEADER_PREFIXES.get(cmd)
+    if data.__class__ is not str:
+        data = str(data)
+    data_length = len(data) if data.isascii() else len(data.encode())
+    if prefix is None or data_length > MAX_DATA_LENGTH:
+        return ERROR_RETURN
+    if data_length < _FAST_LENGTHS:
+        return prefix + _LENGTH_FIELDS[data_length] + data
+    return "%s%04d|%s" % (prefix, data_length, data)
+
+
+def encode_message(cmd, data):
+    """
+    build message matching the protocol as bytes ready to be sent.
+    The length field counts the bytes of the utf-8 encoded data, so framing also holds for non-ascii data
+    :param cmd: command (str) matching the defined protocol
+    :param data: content (str, list of fields or already encoded bytes) to send, can be empty ("")
+    :return: message (bytes) matching the defined protocol. If some error occurred, returns None
+    """
+    prefix = _HEADER_PREFIX_BYTES.get(cmd)
+    if data.__class__ is not bytes:
+        if data.__class__ is not str:
+            data = join_data(data) if data.__class__ is list else str(data)
+        data = data.encode()
     data_length = len(data)
-    if data_length > MAX_DATA_LENGTH or cmd not in SERVER_COMMANDS + CLIENT_COMMANDS:
+    if prefix is None or data_length > MAX_DATA_LENGTH:
         return ERROR_RETURN
-    for _ in range(CMD_FIELD_LENGTH - len(cmd)):
-        cmd += ' '
-    for _ in range(LENGTH_FIELD_LENGTH - len(str(data_length))):
-        data_length = '0' + str(data_length)
-    return DELIMITER.join([cmd, data_length, data])
+    if data_length < _FAST_LENGTHS:
+        return b"".join((prefix, _LENGTH_FIELD_BYTES[data_length], data))
+    return b"%s%04d|%s" % (prefix, data_length, data)
+
+
+def encode_frame(cmd, data):
+    """
+    build a protocol v2 frame: opcode byte, varint length of the data, then the data - every field as a
+    varint length followed by its utf-8 bytes. Fields are never joined nor padded
+    :param cmd: command (str) matching the defined protocol
+    :param data: list of fields, or a single field (str, bytes or int). "" sends no fields
+    :return: frame (bytes). If some error occurred, returns None
+    """
+    opcode = _OPCODE_BYTES.get(cmd)
+    if data.__class__ is not list:
+        data = [data] if data != "" else []
+    parts = []
+    for field in data:
+        if field.__class__ is not bytes:
+            field = (field if field.__class__ is str else str(field)).encode()
+        field_length = len(field)
+        parts.append(_VARINTS[field_length] if field_length < _FAST_LENGTHS else encode_varint(field_length))
+        parts.append(field)
+    data = b"".join(parts)
+    data_length = len(data)
+    if opcode is None or data_length > MAX_FRAME_DATA_LENGTH:
+        return ERROR_RETURN
+    return b"".join((opcode, _VARINTS[data_length] if data_length < _FAST_LENGTHS else encode_varint(data_length),
+                     data))
+
+
+def decode_fields(data):
+    """
+    split the data of a v2 frame to its fields
+    :param data: bytes
+    :return: list of fields (str). If some error occurred, returns None
+    """
+    fields = []
+    offset = 0
+    while offset < len(data):
+        field_length, offset = decode_varint(data, offset)
+        if field_length is None or offset + field_length > len(data):
+            return ERROR_RETURN
+        try:
+            fields.append(data[offset:offset + field_length].decode())
+        except UnicodeDecodeError:
+            return ERROR_RETURN
+        offset += field_length
+    return fields
 
 
 def parse_message(msg):
     """
-    Parses protocol message and returns command name and data field
+    Parses protocol message and returns command name and data field.
+    The fields are sliced at their fixed offsets, so the data itself may contain the delimiter (|).
+    The length field counts the bytes of the utf-8 encoded data (see build_message)
     :param msg: message (str) to parse
     :return: cmd (str), data (str). If some error occurred, returns None, None
     """
-
-    msg = msg.split(DELIMITER)
-    if len(msg) != MSG_COMPONENTS:
+    cmd = _HEADER_CMDS.get(msg[:_LENGTH_START])
+    data_length = _LENGTH_VALUES.get(msg[_LENGTH_START:MSG_HEADER_LENGTH])
+    if cmd is None or data_length is None:  # slow path: unusual padding, long data or invalid header
+        cmd, data_length = parse_header(msg[:MSG_HEADER_LENGTH])
+        if cmd is None:
+            return ERROR_RETURN, ERROR_RETURN
+    data = msg[MSG_HEADER_LENGTH:]
+    if (len(data) if data.isascii() else len(data.encode())) != data_length:
         return ERROR_RETURN, ERROR_RETURN
+    return cmd, data
 
-    cmd = msg[0]
-    data_length = msg[1]
-    data = msg[2]
 
-    if len(cmd) != CMD_FIELD_LENGTH or len(data_length) != LENGTH_FIELD_LENGTH \
-            or len(data) > MAX_DATA_LENGTH:
-        return ERROR_RETURN, ERROR_RETURN
-    cmd = cmd.replace(" ", "")
+def parse_header(header):
+    """
+    Parses the fixed size header (cmd and length fields) of a protocol message
+    :param header: first MSG_HEADER_LENGTH characters (str) or bytes of a message
+    :return: cmd (str), data length (int). If the header is malformed, returns None, None.
+             If only the command is unknown, returns None, data length so the message can be skipped
+    """
+    is_bytes = header.__class__ is bytes
+    if is_bytes:
+        cmd = _HEADER_CMD_BYTES.get(header[:_LENGTH_START])
+        data_length = _LENGTH_VALUE_BYTES.get(header[_LENGTH_START:])
+    else:
+        cmd = _HEADER_CMDS.get(header[:_LENGTH_START])
+        data_length = _LENGTH_VALUES.get(header[_LENGTH_START:])
+    if cmd is not None and data_length is not None:
+        return cmd, data_length
 
-    try:  # data_length may not be an integer
-        data_length = int(data_length.replace(" ", ""))
-    except ValueError:
+    if len(header) != MSG_HEADER_LENGTH:
         return ERROR_RETURN, ERROR_RETURN
-    if data_length != len(data) or cmd not in SERVER_COMMANDS + CLIENT_COMMANDS:
+    delimiter = _DELIMITER_BYTE if is_bytes else DELIMITER
+    if header[CMD_FIELD_LENGTH] != delimiter or header[-1] != delimiter:
         return ERROR_RETURN, ERROR_RETURN
+    if data_length is None:
+        length_field = header[_LENGTH_START:_LENGTH_END]
+        try:  # data_length may not be an integer
+            data_length = int(length_field)  # int() ignores the padding spaces
+        except ValueError:
+            return ERROR_RETURN, ERROR_RETURN
+        if data_length < 0:
+            return ERROR_RETURN, ERROR_RETURN
+    if cmd is None:  # command padded on the left or unknown
+        cmd = header[:CMD_FIELD_LENGTH]
+        if is_bytes:
+            cmd = cmd.decode(errors="replace")
+        cmd = cmd.replace(" ", "")
+        if cmd not in COMMANDS:
+            return ERROR_RETURN, data_length
+    return cmd, data_length
 
-    return cmd, data
 
+class MessageReader:
+    """
+    Incremental parser for a stream of protocol messages.
+    Received bytes are kept in a ring buffer (filled with feed() or directly by recv_from()) and complete
+    messages are taken out with read_message() or by iterating the reader. One recv may therefore hold
+    several pipelined messages or only part of one, and messages up to MAX_MSG_LENGTH are supported.
+    Setting protocol to PROTOCOL_V2 switches to v2 frames from the next message on.
+    A v2 frame is accepted up to max_data_length bytes of data: the server reads client commands with
+    MAX_DATA_LENGTH, so a header claiming a huge frame can't make it grow the buffer before any data arrived.
+    """
+
+    def __init__(self, capacity=READER_BUFFER_SIZE, protocol=PROTOCOL_V1, max_data_length=MAX_FRAME_DATA_LENGTH):
+        self.protocol = protocol
+        self.max_data_length = max_data_length
+        self._buffer = bytearray(capacity)
+        self._start = 0  # index of the first unread byte
+        self._size = 0  # number of unread bytes
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """
+        yield (cmd, data) of every complete message in the buffer
+        """
+        while True:
+            message = self.read_message()
+            if message is None:
+                return
+            yield message
+
+    def _grow(self, needed):
+        data = self._peek(0, self._size)
+        self._buffer = bytearray(max(2 * len(self._buffer), needed))
+        self._buffer[:len(data)] = data
+        self._start = 0
+
+    def _free_region(self):
+        """
+        :return: memoryview of the largest contiguous free region after the unread bytes
+        """
+        if self._size == len(self._buffer):
+            self._grow(2 * len(self._buffer))
+        if self._size == 0:
+            self._start = 0
+        capacity = len(self._buffer)
+        end = (self._start + self._size) % capacity
+        stop = capacity if end >= self._start else self._start
+        return memoryview(self._buffer)[end:stop]
 
-def build_login_data(username, password):
-    return username + "#" + password
+    def _peek(self, offset, length):
+        """
+        :return: bytes [offset, offset + length) of the unread data, joined across the ring's wrap point
+        """
+        capacity = len(self._buffer)
+        first = (self._start + offset) % capacity
+        if first + length <= capacity:
+            return bytes(self._buffer[first:first + length])
+        return bytes(self._buffer[first:]) + bytes(self._buffer[:length - (capacity - first)])
+
+    def _consume(self, length):
+        self._start = (self._start + length) % len(self._buffer)
+        self._size -= length
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+    def unread(self):
+        """
+        :return: the received bytes not taken out as messages yet (left in the buffer)
+        """
+        return self._peek(0, self._size)
+
+    def feed(self, data):
+        """
+        append received bytes to the buffer
+        :param data: bytes
+        :return:
+        """
+        data = memoryview(data)
+        while data:
+            with self._free_region() as region:
+                n = min(len(region), len(data))
+                region[:n] = data[:n]
+            self._size += n
+            data = data[n:]
+
+    def recv_from(self, conn):
+        """
+        receive bytes from conn straight into the ring buffer
+        :param conn: socket object
+        :return: number of bytes received, 0 if the peer closed the connection
+        """
+        with self._free_region() as region:
+            n = conn.recv_into(region)
+        self._size += n
+        return n
+
+    def read_message(self):
+        """
+        take the next complete message out of the buffer
+        :return: cmd (str), data (str, or list of fields for PROTOCOL_V2) of the message, or None if no complete
+                 message is buffered yet. A message with an unknown command returns None, None and is skipped.
+                 A malformed header returns None, None and discards the buffer (the stream can't be resynced)
+        """
+        if self.protocol == PROTOCOL_V2:
+            return self._read_frame()
+        if self._size < MSG_HEADER_LENGTH:
+            return None
+        cmd, data_length = parse_header(self._peek(0, MSG_HEADER_LENGTH))
+        if data_length is None:
+            self.clear()
+            return ERROR_RETURN, ERROR_RETURN
+        if self._size < MSG_HEADER_LENGTH + data_length:
+            if MSG_HEADER_LENGTH + data_length > len(self._buffer):
+                self._grow(MSG_HEADER_LENGTH + data_length)
+            return None
+        data = self._peek(MSG_HEADER_LENGTH, data_length)
+        self._consume(MSG_HEADER_LENGTH + data_length)
+        try:
+            data = data.decode()
+        except UnicodeDecodeError:
+            return ERROR_RETURN, ERROR_RETURN
+        if cmd is None:
+            return ERROR_RETURN, ERROR_RETURN
+        return cmd, data
+
+    def _read_frame(self):
+        """
+        read_message() of PROTOCOL_V2
+        """
+        if self._size < 2:
+            return None
+        header = self._peek(0, min(self._size, 1 + MAX_VARINT_LENGTH))
+        data_length, data_start = decode_varint(header, 1)
+        if data_length is None:
+            if len(header) <= MAX_VARINT_LENGTH:  # length not received yet
+                return None
+            self.clear()
+            return ERROR_RETURN, ERROR_RETURN
+        if data_length > self.max_data_length:
+            self.clear()
+            return ERROR_RETURN, ERROR_RETURN
+        if self._size < data_start + data_length:
+            if data_start + data_length > len(self._buffer):
+                self._grow(data_start + data_length)
+            return None
+        data = self._peek(data_start, data_length)
+        self._consume(data_start + data_length)
+        cmd = _OPCODE_CMDS[header[0]]
+        fields = decode_fields(data)
+        if cmd is None or fields is None:
+            return ERROR_RETURN, ERROR_RETURN
+        return cmd, fields
+
+
+def build_login_data(username, password, protocol=PROTOCOL_V1):
+    """
+    :param protocol: highest protocol version the client supports. A client asking for PROTOCOL_V2 switches
+                     to it after a LOGIN_OK whose data is "2" (v1 servers reject the login as invalid input)
+    """
+    if protocol == PROTOCOL_V1:
+        return username + "#" + password
+    return join_data([username, password, protocol])
+
+
+def build_question_fields(q_num, question, answers):
+    return [q_num, question] + answers
 
 
 def build_question(q_num, question, answers):
-    return join_data([q_num] + [question] + answers), q_num
+    return join_data(build_question_fields(q_num, question, answers)), q_num
 
 
 def parse_answer(data):
@@ -126,9 +495,87 @@ def parse_login(data):
     return split_data(data, LOGIN_DATA_COMPONENTS)
 
 
+def parse_login_protocol(data):
+    """
+    :param data: username#password, or username#password#version to negotiate a protocol version
+    :return: username, password and the protocol version to use (the highest both sides support).
+             If some error occurred, returns None, None, None
+    """
+    fields = data_fields(data)
+    if len(fields) == LOGIN_DATA_COMPONENTS:
+        return fields[0], fields[1], PROTOCOL_V1
+    if len(fields) == LOGIN_DATA_COMPONENTS + 1 and fields[2].isdecimal() and int(fields[2]) >= PROTOCOL_V1:
+        return fields[0], fields[1], min(int(fields[2]), PROTOCOL_V2)
+    return ERROR_RETURN, ERROR_RETURN, ERROR_RETURN
+
+
 def parse_question(question):
     return split_data(question, QUESTION_DATA_COMPONENTS)
 
 
 def build_answer(qid, answer):
     return join_data([qid, answer])
+
+
+def split_groups(data, group_size):
+    """
+    Helper method. Splits data made of several groups of group_size fields (e.g. several questions)
+    :param data: data (str) or list of fields of a v2 message
+    :param group_size: number of fields of every group
+    :return: list of groups (lists of fields). If the fields don't divide to groups, returns None
+    """
+    fields = data_fields(data)
+    if len(fields) % group_size:
+        return ERROR_RETURN
+    return [fields[i:i + group_size] for i in range(0, len(fields), group_size)]
+
+
+def build_answers(answers):
+    """
+    :param answers: list of (qid, answer)
+    :return: SEND_ANSWERS data: qid#answer#qid#answer...
+    """
+    return join_data([field for answer in answers for field in answer])
+
+
+def parse_answers(data):
+    """
+    :param data: SEND_ANSWERS data
+    :return: list of [qid, answer] (str). If some error occurred, returns None
+    """
+    return split_groups(data, ANS_DATA_COMPONENTS)
+
+
+def parse_questions(data):
+    """
+    :param data: YOUR_QUESTIONS data: the fields of every question one after the other
+    :return: list of question fields [qid, question, ans1, ..., ans4]. If some error occurred, returns None
+    """
+    return split_groups(data, QUESTION_DATA_COMPONENTS)
+
+
+def parse_answers_result(data):
+    """
+    :param data: ANSWERS_RESULT data: a result cmd (CORRECT_ANSWER, WRONG_ANSWER or ERROR) and its data
+                 for every answer, in the order of the answers
+    :return: list of [cmd, data]. If some error occurred, returns None
+    """
+    return split_groups(data, RESULT_DATA_COMPONENTS)
+
+
+def parse_round_question(data):
+    """
+    :param data: ROUND_QUESTION data: round#seconds#qid#question#ans1#...#ans4
+    :return: round, seconds to answer and the question fields [qid, question, ans1, ..., ans4].
+             If some error occurred, all of them are None
+    """
+    fields = split_data(data, ROUND_QUESTION_DATA_COMPONENTS)
+    return fields[0], fields[1], fields[2:]
+
+
+def parse_round_result(data):
+    """
+    :param data: ROUND_RESULT data: round#correct answer#number of correct players#number of answering players
+    :return: list of the 4 fields. If some error occurred, the fields are None
+    """
+    return split_data(data, ROUND_RESULT_DATA_COMPONENTS)
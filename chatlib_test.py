@@ -28,6 +28,94 @@ def check_parse(msg_str, expected_output):
 		print(".....\t FAILED, output: ", output)		
 
 
+def check_encode(input_cmd, input_data, expected_output):
+	print("Input: ", input_cmd, input_data, "\nExpected output: ", expected_output)
+	try:
+		output = chatlib.encode_message(input_cmd, input_data)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_frame(input_cmd, input_data, expected_output):
+	print("Input: ", input_cmd, input_data, "\nExpected output: ", expected_output)
+	try:
+		output = chatlib.encode_frame(input_cmd, input_data)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_groups(input_data, group_size, expected_output):
+	print("Input: ", input_data, group_size, "\nExpected output: ", expected_output)
+	try:
+		output = chatlib.split_groups(input_data, group_size)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_login(input_data, expected_output):
+	print("Input: ", input_data, "\nExpected output: ", expected_output)
+	try:
+		output = chatlib.parse_login_protocol(input_data)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_reader(chunks, expected_output, protocol=chatlib.PROTOCOL_V1, max_data_length=chatlib.MAX_FRAME_DATA_LENGTH):
+	print("Input: ", chunks, "\nExpected output: ", expected_output)
+
+	try:
+		reader = chatlib.MessageReader(capacity=32, protocol=protocol, max_data_length=max_data_length)
+		output = []
+		for chunk in chunks:
+			reader.feed(chunk)
+			output.extend(reader)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_unread(chunks, expected_output):
+	print("Input: ", chunks, "\nExpected output: ", expected_output)
+
+	try:
+		reader = chatlib.MessageReader(capacity=32)
+		for chunk in chunks:
+			reader.feed(chunk)
+			reader.read_message()
+		output = reader.unread()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
 def main():
 
 	# BUILD
@@ -38,12 +126,15 @@ def main():
 	check_build("LOGIN", "aaaabbbb", "LOGIN           |0008|aaaabbbb")
 	# Zero-length message
 	check_build("LOGIN", "", "LOGIN           |0000|")
+	# Non ascii data: the length counts utf-8 bytes, as on the wire
+	check_build("LOGIN", "\u00e9#b", "LOGIN           |0004|\u00e9#b")
 	
 	# Invalid inputs
 	# cmd too long
 	check_build("0123456789ABCDEFG", "", None)
 	# msg too long
 	check_build("A", "A" * (chatlib.MAX_DATA_LENGTH + 1), None)
+	check_build("LOGIN", "\u00e9" * (chatlib.MAX_DATA_LENGTH // 2 + 1), None)
 
 	# PARSE
 	
@@ -56,6 +147,8 @@ def main():
 	check_parse("LOGIN           |0009|aaaa#bbbb", ("LOGIN", "aaaa#bbbb"))
 	check_parse("LOGIN           |9   | aaa#bbbb", ("LOGIN", " aaa#bbbb"))
 	check_parse("LOGIN           |   4|data", ("LOGIN", "data"))
+	check_parse("LOGIN           |0004|\u00e9#b", ("LOGIN", "\u00e9#b"))
+	check_parse(chatlib.encode_message("LOGIN", "\u00e9#b").decode(), ("LOGIN", "\u00e9#b"))
 
 	# Invalid inputs
 	check_parse("", (None, None))
@@ -64,6 +157,76 @@ def main():
 	check_parse("LOGIN           |	 -4|data", (None, None))
 	check_parse("LOGIN           |	  z|data", (None, None))
 	check_parse("LOGIN           |	  5|data", (None, None))
+	# A length counting characters instead of bytes
+	check_parse("LOGIN           |0003|\u00e9#b", (None, None))
+
+	# ENCODE
+	check_encode("LOGIN", "aaaa#bbbb", b"LOGIN           |0009|aaaa#bbbb")
+	check_encode("LOGIN", "\u00e9", b"LOGIN           |0002|\xc3\xa9")
+	check_encode("0123456789ABCDEFG", "", None)
+
+	# READER
+	login = b"LOGIN           |0009|aaaa#bbbb"
+	logout = b"LOGOUT          |0000|"
+	# One message per chunk
+	check_reader([login], [("LOGIN", "aaaa#bbbb")])
+	# Pipelined messages in one chunk
+	check_reader([login + logout + login], [("LOGIN", "aaaa#bbbb"), ("LOGOUT", ""), ("LOGIN", "aaaa#bbbb")])
+	# Message split across chunks (and across the ring's wrap point)
+	check_reader([login[:5], login[5:25], login[25:] + logout[:3], logout[3:]], [("LOGIN", "aaaa#bbbb"), ("LOGOUT", "")])
+	# Message larger than the initial capacity
+	check_reader([b"LOGIN           |0100|" + b"a" * 100], [("LOGIN", "a" * 100)])
+	# Non ascii data
+	check_reader([b"LOGIN           |0002|\xc3\xa9"], [("LOGIN", "\u00e9")])
+	# Unknown command is skipped, stream stays in sync
+	check_reader([b"NOPE            |0002|ab" + logout], [(None, None), ("LOGOUT", "")])
+	# Malformed header
+	check_reader([b"LOGIN           x0002|ab" + logout], [(None, None)])
+	# Unread bytes: a message and a half not taken out yet (across the ring's wrap point)
+	check_unread([login[:20], login[20:] + logout + login[:10]], logout + login[:10])
+
+	# GROUPS
+	check_groups("1#2#3#4", 2, [["1", "2"], ["3", "4"]])
+	check_groups(["1", "2#", "3", ""], 2, [["1", "2#"], ["3", ""]])
+	check_groups("CORRECT_ANSWER##WRONG_ANSWER#3", 2, [["CORRECT_ANSWER", ""], ["WRONG_ANSWER", "3"]])
+	check_groups("", 2, [])
+	check_groups("1#2#3", 2, None)
+
+	# LOGIN
+	check_login("aaaa#bbbb", ("aaaa", "bbbb", chatlib.PROTOCOL_V1))
+	check_login("aaaa#bbbb#2", ("aaaa", "bbbb", chatlib.PROTOCOL_V2))
+	# Versions above the highest supported one get the highest
+	check_login("aaaa#bbbb#9", ("aaaa", "bbbb", chatlib.PROTOCOL_V2))
+	check_login("aaaa#bbbb#0", (None, None, None))
+	# Digits int() doesn't read as a number
+	check_login("aaaa#bbbb#\u00b2", (None, None, None))
+
+	# FRAME (protocol v2)
+	check_frame("LOGIN", ["aaaa", "bbbb"], b"\x01\x0a\x04aaaa\x04bbbb")
+	check_frame("YOUR_SCORE", 7, b"\x46\x02\x017")
+	check_frame("LOGOUT", "", b"\x02\x00")
+	check_frame("LOGIN", ["a#b", "\u00e9"], b"\x01\x07\x03a#b\x02\xc3\xa9")
+	check_frame("LOGIN", ["a" * 200], b"\x01\xca\x01\xc8\x01" + b"a" * 200)
+	check_frame("0123456789ABCDEFG", "", None)
+	check_frame("ROUND_RESULT", ["3", "2", "1", "4"], b"\x50\x08\x013\x012\x011\x014")
+
+	# READER (protocol v2)
+	v2 = chatlib.PROTOCOL_V2
+	frame = chatlib.encode_frame("LOGIN", ["aaaa", "bbbb"])
+	check_reader([frame + b"\x02\x00"], [("LOGIN", ["aaaa", "bbbb"]), ("LOGOUT", [])], v2)
+	check_reader([frame[:1], frame[1:6], frame[6:]], [("LOGIN", ["aaaa", "bbbb"])], v2)
+	# Data larger than v1 allows
+	check_reader([chatlib.encode_frame("ALL_SCORE", "a" * 20000)], [("ALL_SCORE", ["a" * 20000])], v2)
+	# Unknown opcode is skipped, stream stays in sync
+	check_reader([b"\xff\x01\x00" + frame], [(None, None), ("LOGIN", ["aaaa", "bbbb"])], v2)
+	# Field longer than the frame
+	check_reader([b"\x01\x02\x05a"], [(None, None)], v2)
+	# Length varint too long
+	check_reader([b"\x01\xff\xff\xff\xff\x01"], [(None, None)], v2)
+	# A header claiming a frame larger than the reader accepts is rejected before its data arrives
+	check_reader([b"\x06\xff\xff\xff\x07"], [], v2)
+	check_reader([b"\x06\xff\xff\xff\x07"], [(None, None)], v2, chatlib.MAX_DATA_LENGTH)
+	check_reader([frame], [("LOGIN", ["aaaa", "bbbb"])], v2, chatlib.MAX_DATA_LENGTH)
 
 
 if __name__ == '__main__':
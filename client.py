@@ -1,60 +1,23 @@
 import argparse
-import socket
 import chatlib
+from trivia_client import TriviaClient, TriviaError
 
 ANSWER_OPTIONS = [1, 2, 3, 4]
 QUESTION_COMPONENTS = {"id": 0, "question": 1, "answer1": 2, "answer2": 3, "answer3": 4, "answer4": 5}
-MAX_MSG_LENGTH = 1024
 
 
-def build_and_send_message(conn, cmd, data=""):
+def connect(server_ip, server_port, protocol=chatlib.PROTOCOL_V2):
     """
-    Builds a new message using chatlib and sends it.
-    :param conn: message destination (socket object)
-    :param cmd: command (str) matching the protocol
-    :param data: content (str) to be sent, may be empty ("")
-    :return:
-    """
-    msg = chatlib.build_message(cmd, data)
-    conn.send(msg.encode())
-    return
-
-
-def recv_message_and_parse(conn):
-    """
-    Receives a new message from given socket, then parses the message using chatlib.
-    :param conn: (socket object)
-    :return: cmd (str) and data (str) of the received message.
-             If error occurred, will return None, None
-    """
-    cmd, data = chatlib.parse_message(conn.recv(MAX_MSG_LENGTH).decode())
-    return cmd, data
-
-
-def build_send_recv_parse(conn, cmd, data=""):
-    """
-    build message, send it and return parsed message
-    :param conn: socket object
-    :param cmd: command matching the protocol
-    :param data: content to be sent, may be empty("")
-    :return: cmd (str), data (str)
-    """
-    build_and_send_message(conn, cmd, data)
-    return recv_message_and_parse(conn)
-
-
-def connect(server_ip, server_port):
-    """
-    connect to the server using pre-defined globals
-    :return: conn (socket object)
+    connect to the server
+    :return: TriviaClient
     """
     print("connecting to server...")
+    client = TriviaClient(server_ip, server_port, protocol)
     try:
-        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        conn.connect((server_ip, server_port))
+        client.connect()
         print("Connected: SERVER_IP:", server_ip, "SERVER PORT:", server_port)
-        return conn
-    except (ConnectionError, TimeoutError):
+        return client
+    except OSError:
         error_and_exit("Connection error\nPlease make sure server is up and running and check server ip/port")
 
 
@@ -63,48 +26,41 @@ def error_and_exit(error_msg="error occurred"):
     exit()
 
 
-def login(conn):
+def login(client):
     """
     Asks for a username and password to login, keep asking until connected successfully
-    :param conn: socket object
+    :param client: TriviaClient
     :return:
     """
-    cmd = ""
-    while cmd != "LOGIN_OK":
+    while True:
         username = input("Please enter username: \n")
         password = input("Please enter password: \n")
-        cmd, data = build_send_recv_parse(conn, chatlib.login_msg, chatlib.build_login_data(username, password))
-        if cmd != "LOGIN_OK":
-            print(data)
+        try:
+            client.login(username, password)
+            break
+        except TriviaError as e:
+            print(e)
     print("Logged in!")
     return
 
 
-def logout(conn):
+def logout(client):
     """
     logout user from connection
-    :param conn: socket object
+    :param client: TriviaClient
     :return:
     """
-    build_and_send_message(conn, chatlib.logout_msg)
+    client.logout()
     print("Logged out")
     return
 
 
-def get_score(conn):
-    cmd, my_score = build_send_recv_parse(conn, chatlib.my_score_msg)
-    if cmd == chatlib.your_score_msg:
-        print("Your score is: " + my_score)
-        return
-    error_and_exit("Error: could not get score")
+def get_score(client):
+    print("Your score is: " + str(client.my_score()))
 
 
-def get_highscore(conn):
-    cmd, highscore = build_send_recv_parse(conn, chatlib.highscore_msg)
-    if cmd == chatlib.all_score_msg:
-        print(highscore)
-        return
-    error_and_exit("Error: could not get highscore")
+def get_highscore(client):
+    print(client.highscore())
 
 
 def print_question(question):
@@ -117,48 +73,78 @@ def print_question(question):
     print(s)
 
 
-def play_question(conn):
+def input_answer(prompt, options):
+    """
+    keep asking until the user chooses one of options
+    :return: chosen option (int)
+    """
+    while True:
+        answer = input(prompt)
+        try:
+            answer = int(answer)
+            if answer in options:
+                return answer
+        except ValueError:
+            pass
+        print("Invalid answer, Please choose again")
+
+
+def play_question(client):
     """
     Get question, send user's answer, get and print feedback
-    :param conn:
+    :param client: TriviaClient
     :return:
     """
-    cmd, question = build_send_recv_parse(conn, chatlib.get_question_msg)
-    if cmd == chatlib.no_questions_msg:
+    question = client.get_question()
+    if question is None:
         print("GAME OVER: No more question to show.")
         return
-    question = chatlib.parse_question(question)
     print_question(question)
 
-    while True:  # get answer from user
-        answer = input("Please choose the correct answer (1-4)\n")
-        try:
-            answer = int(answer)
-            if answer in ANSWER_OPTIONS:
-                break
-            print("Invalid answer, Please choose again")
-            continue
-        except ValueError:
-            print("Invalid answer, Please choose again")
-            continue
+    answer = input_answer("Please choose the correct answer (1-4)\n", ANSWER_OPTIONS)
 
     # send answer and get feedback (correct / wrong)
-    answer = chatlib.build_answer(question[QUESTION_COMPONENTS["id"]], answer)
-    cmd, correct_answer = build_send_recv_parse(conn, chatlib.send_answer_msg, answer)
-    if cmd == chatlib.correct_answer_msg:
+    correct, correct_answer = client.send_answer(question[QUESTION_COMPONENTS["id"]], answer)
+    if correct:
         print("Correct!")
-    elif cmd == chatlib.wrong_answer_msg:
-        print("Wrong answer, Correct answer is: " + question[1 + int(correct_answer)])
     else:
-        error_and_exit("Error playing question")
+        print("Wrong answer, Correct answer is: " + question[1 + correct_answer])
 
 
-def get_logged_user(conn):
-    cmd, data = build_send_recv_parse(conn, chatlib.logged_msg)
-    if cmd == chatlib.logged_answer_msg:
-        print(data)
-        return
-    error_and_exit("Error getting logged users")
+def play_rounds(client):
+    """
+    Join a room and play its live rounds: print every pushed question, send user's answer before the round
+    closes and print the round's result, until the user chooses to leave
+    :param client: TriviaClient
+    :return:
+    """
+    name = input("Please enter room name: \n")
+    print("Joined room " + name + ", players: " + str(client.join_room(name)))
+    print("Waiting for the next round...")
+    while True:
+        cmd, data = client.next_push()
+        if cmd == chatlib.round_result_msg:
+            round_number, correct_answer, correct, answers = chatlib.parse_round_result(data)
+            print("Round " + round_number + " is over, correct answer: " + correct_answer + ". " + correct + "/" +
+                  answers + " players answered correctly\n")
+            continue
+        round_number, seconds, question = chatlib.parse_round_question(data)
+        print("Round " + round_number + " (" + seconds + " seconds):")
+        print_question(question)
+        answer = input_answer("Please choose the correct answer (1-4), 0 to leave the room\n", [0] + ANSWER_OPTIONS)
+        if answer == 0:
+            client.leave_room()
+            print("Left room " + name)
+            return
+        try:
+            client.round_answer(round_number, answer)
+            print("Answer received, waiting for the round to close...")
+        except TriviaError as e:
+            print(e)
+
+
+def get_logged_user(client):
+    print(", ".join(client.logged_users()))
 
 
 def main():
@@ -167,29 +153,39 @@ def main():
     parser.add_argument("-p", "--port", type=int, default=5678, help="Server port to connect")
     parser.add_argument("--ip", type=str, default="127.0.0.1", help="Server ip to connect. Input using apostrophes, "
                                                                     "example: --ip=\"127.0.0.1\"")
+    parser.add_argument("--protocol", type=int, choices=[chatlib.PROTOCOL_V1, chatlib.PROTOCOL_V2],
+                        default=chatlib.PROTOCOL_V2, help="highest protocol version to use (2 falls back to 1 "
+                                                          "with servers that don't support it)")
     args = parser.parse_args()
 
     server_ip = args.ip
     server_port = args.port
 
-    conn = connect(server_ip, server_port)
-    login(conn)
-    while True:
-        c = input("Please select an action:\n1 - Play a trivia question\n2 - Show My Score\n"
-                  "3 - Show Highscore\n4 - Show Logged Users\n5 - Logout\n")
-        if c == "1":
-            play_question(conn)
-        elif c == "2":
-            get_score(conn)
-        elif c == "3":
-            get_highscore(conn)
-        elif c == "4":
-            get_logged_user(conn)
-        elif c == "5":
-            logout(conn)
-            return
-        else:
-            print("Invalid option")
+    client = connect(server_ip, server_port, args.protocol)
+    try:
+        login(client)
+        while True:
+            c = input("Please select an action:\n1 - Play a trivia question\n2 - Show My Score\n"
+                      "3 - Show Highscore\n4 - Show Logged Users\n5 - Logout\n6 - Play live rounds\n")
+            if c == "1":
+                play_question(client)
+            elif c == "2":
+                get_score(client)
+            elif c == "3":
+                get_highscore(client)
+            elif c == "4":
+                get_logged_user(client)
+            elif c == "5":
+                logout(client)
+                return
+            elif c == "6":
+                play_rounds(client)
+            else:
+                print("Invalid option")
+    except TriviaError as e:
+        error_and_exit("Error: " + str(e))
+    except ConnectionError:
+        error_and_exit("Connection error\nLost connection to the server")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,97 @@
+import json
+import os
+import socket
+import struct
+
+MAX_FDS = 250  # file descriptors passed per SCM_RIGHTS message (the kernel allows 253)
+TIMEOUT = 10.0  # seconds either process waits for the other during a handoff
+HEADER = struct.Struct("!I")  # count of the fds of a batch (0 ends them), then the length of the snapshot
+ACK = b"\x01"  # sent by the new process once it adopted the sockets
+
+
+def listen(path):
+    """
+    :param path: unix socket path (a stale socket file left there is replaced)
+    :return: non-blocking unix socket listening on path for a new server process to connect and take over
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1)
+    sock.setblocking(False)
+    return sock
+
+
+def connect(path):
+    """
+    :param path: unix socket path the running server listens on (listen())
+    :return: connection to the running server, blocking with TIMEOUT
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(TIMEOUT)
+    conn.connect(path)
+    return conn
+
+
+def recv_exact(conn, length):
+    """
+    :return: exactly length bytes received from conn
+    :raise ConnectionError: the peer closed the connection before
+    """
+    data = bytearray()
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            raise ConnectionResetError("handoff connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send(conn, socks, snapshot):
+    """
+    pass sockets and a snapshot of the server state to the new process: the fds go over SCM_RIGHTS in
+    batches of MAX_FDS, then the snapshot as length prefixed json
+    :param conn: connection of the new process (accepted from the listen() socket), blocking
+    :param socks: socket objects, received in the same order
+    :param snapshot: json serializable server state
+    :return:
+    """
+    fds = [sock.fileno() for sock in socks]
+    for i in range(0, len(fds), MAX_FDS):
+        batch = fds[i:i + MAX_FDS]
+        socket.send_fds(conn, [HEADER.pack(len(batch))], batch)
+    payload = json.dumps(snapshot).encode()
+    conn.sendall(HEADER.pack(0) + HEADER.pack(len(payload)) + payload)
+    return
+
+
+def receive(conn):
+    """
+    receive what send() sent
+    :param conn: connection to the old process (connect())
+    :return: list of socket objects (in the order sent), snapshot
+    """
+    socks = []
+    try:
+        while True:
+            data, fds, flags, address = socket.recv_fds(conn, HEADER.size, MAX_FDS)
+            socks.extend(socket.socket(fileno=fd) for fd in fds)
+            if not data:
+                raise ConnectionResetError("handoff connection closed")
+            if flags & socket.MSG_CTRUNC:
+                raise OSError("handoff lost file descriptors (fd limit reached?)")
+            (count,) = HEADER.unpack(data + recv_exact(conn, HEADER.size - len(data)))
+            if count == 0:
+                break
+            if len(fds) != count:
+                raise OSError("handoff expected %d file descriptors, got %d" % (count, len(fds)))
+        (length,) = HEADER.unpack(recv_exact(conn, HEADER.size))
+        snapshot = json.loads(recv_exact(conn, length))
+    except BaseException:
+        for sock in socks:  # copies of the fds: the old process keeps serving its own
+            sock.close()
+        raise
+    return socks, snapshot
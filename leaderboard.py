@@ -0,0 +1,100 @@
+import bisect
+import chatlib
+
+
+class Leaderboard:
+    """
+    Users ranked by score, kept up to date as scores change.
+    Usernames are bucketed by score (buckets keep the order users reached the score in) and the distinct
+    scores are kept in a sorted list, so the top of the ranking can be read without sorting all users.
+    A score change costs O(1) unless it creates or empties a bucket, which costs an O(log S) search plus an
+    O(S) list shift for S distinct scores (a memmove, S is small next to the number of users).
+    The full ALL_SCORE payload is cached until a score changes.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # score -> dict of usernames (used as an insertion ordered set)
+        self._scores = []  # distinct scores, ascending
+        self._user_scores = {}  # username -> score
+        self._payloads = {}  # size limit -> cached full ranking payload
+
+    def __len__(self):
+        return len(self._user_scores)
+
+    def load(self, users):
+        """
+        rank all users of the users dictionary
+        :param users: users dictionary
+        :return:
+        """
+        for username, value in users.items():
+            self.set_score(username, value["score"])
+        return
+
+    def set_score(self, username, score):
+        """
+        update the score of username (adds username if it isn't ranked yet)
+        :param username: username
+        :param score: new score (int)
+        :return:
+        """
+        old_score = self._user_scores.get(username)
+        if old_score == score:
+            return
+        if old_score is not None:
+            bucket = self._buckets[old_score]
+            del bucket[username]
+            if not bucket:
+                del self._buckets[old_score]
+                del self._scores[bisect.bisect_left(self._scores, old_score)]
+        bucket = self._buckets.get(score)
+        if bucket is None:
+            bucket = self._buckets[score] = {}
+            bisect.insort(self._scores, score)
+        bucket[username] = None
+        self._user_scores[username] = score
+        self._payloads.clear()
+        return
+
+    def ranked(self, offset=0):
+        """
+        iterate the ranking from the top
+        :param offset: number of top users to skip
+        :return: generator of (username, score)
+        """
+        for score in reversed(self._scores):
+            bucket = self._buckets[score]
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+            for username in bucket:
+                if offset:
+                    offset -= 1
+                    continue
+                yield username, score
+
+    def payload(self, offset=0, count=None, limit=chatlib.MAX_DATA_LENGTH):
+        """
+        build the ALL_SCORE data ("user: score" lines), cut at a line boundary to fit limit
+        :param offset: number of top users to skip
+        :param count: max number of users to include, None for all
+        :param limit: max size in bytes (chatlib.MAX_FRAME_DATA_LENGTH for protocol v2 clients)
+        :return: str
+        """
+        full = offset == 0 and count is None
+        if full and limit in self._payloads:
+            return self._payloads[limit]
+        lines = []
+        size = 0
+        for i, (username, score) in enumerate(self.ranked(offset)):
+            if count is not None and i >= count:
+                break
+            line = str(username) + ": " + str(score) + "\n"
+            size += len(line.encode())
+            if size > limit:
+                break
+            lines.append(line)
+        payload = "".join(lines)
+        if full:
+            self._payloads[limit] = payload
+        return payload
@@ -0,0 +1,53 @@
+from leaderboard import Leaderboard
+
+
+def check_ranking(scores, offset, count, limit, expected_output):
+	"""
+	:param scores: list of (username, score) set in order
+	:param expected_output: payload for offset, count and limit
+	"""
+	print("Input: ", scores, offset, count, limit, "\nExpected output: ", expected_output)
+
+	try:
+		leaderboard = Leaderboard()
+		for username, score in scores:
+			leaderboard.set_score(username, score)
+		output = leaderboard.payload(offset, count, limit)
+		if leaderboard.payload(offset, count, limit) != output:
+			output = "cached payload differs"
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	scores = [("a", 5), ("b", 10), ("c", 5), ("d", 0)]
+	# RANKING
+	# Highest score first, ties in the order the users reached the score
+	check_ranking(scores, 0, None, 1000, "b: 10\na: 5\nc: 5\nd: 0\n")
+	# A changed score moves the user, reaching a tie again puts it after the others
+	check_ranking(scores + [("a", 11), ("a", 5)], 0, None, 1000, "b: 10\nc: 5\na: 5\nd: 0\n")
+	check_ranking(scores + [("d", 20), ("b", 5)], 0, None, 1000, "d: 20\na: 5\nc: 5\nb: 5\n")
+	# Empty
+	check_ranking([], 0, None, 1000, "")
+
+	# PAGES
+	check_ranking(scores, 0, 2, 1000, "b: 10\na: 5\n")
+	# A page starting inside a bucket
+	check_ranking(scores, 2, 1, 1000, "c: 5\n")
+	check_ranking(scores, 1, 10, 1000, "a: 5\nc: 5\nd: 0\n")
+	# Past the end
+	check_ranking(scores, 4, 2, 1000, "")
+	check_ranking(scores, 0, 0, 1000, "")
+	# Cut at a line boundary to fit the size limit
+	check_ranking(scores, 0, None, 12, "b: 10\na: 5\n")
+	check_ranking(scores, 0, None, 5, "")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,235 @@
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+import chatlib
+import server
+import user_store
+from leaderboard import Leaderboard
+from session import Session
+
+USER_SIZES = (1000, 10000, 100000)
+QUESTION_SIZES = (10000, 100000)
+DATA_SIZES = (0, 100, 1000)  # bytes of message data
+REPEAT = 5  # timing repetitions of every benchmark, the fastest is kept
+HISTORY_LENGTH = 20  # questions asked / answered by every generated user
+REGRESSION_THRESHOLD = 0.10  # slowdown (fraction) reported as a regression by --compare
+
+
+def make_questions(count):
+    return {str(qid): {"question": "Question number %d?" % qid,
+                       "answers": ["Answer %d" % i for i in range(1, 5)], "correct": qid % 4 + 1}
+            for qid in range(count)}
+
+
+def make_users(count, question_count):
+    """
+    :return: users dictionary (in-memory form) with random scores and question history
+    """
+    rng = random.Random(count)
+    users = {}
+    for i in range(count):
+        history = set(str(rng.randrange(question_count)) for _ in range(HISTORY_LENGTH))
+        users["user%d" % i] = {"password": "pass%d" % i, "score": rng.randrange(1000),
+                               "questions_asked": history, "questions_answered": set(history)}
+    return users
+
+
+def setup_server(users, questions):
+    """
+    load the generated users and questions into the server module globals, dropping the state of the
+    previous sizes (a leaderboard ranking their users, sessions, rooms)
+    """
+    server.users = users
+    server.questions = questions
+    server.question_ids = list(questions)
+    server.question_pools.clear()
+    server.question_frame.cache_clear()
+    server.sessions.clear()
+    server.logged_sessions.clear()
+    server.rooms.clear()
+    server.pushed.clear()
+    server.leaderboard = Leaderboard()
+    server.leaderboard.load(users)
+    server.store = user_store.UserStore(os.devnull)  # never loaded: mark_dirty() only records the username
+    return
+
+
+def chatlib_benchmarks():
+    """
+    :return: list of (name, stmt, setup) of the chatlib benchmarks
+    """
+    benchmarks = []
+    for size in DATA_SIZES:
+        data = "x" * size
+        msg = chatlib.build_message(chatlib.your_question_msg, data)
+        fields = ["x" * (size // 6)] * 6
+        joined = chatlib.join_data(fields)
+        benchmarks += [
+            ("chatlib.build_message[data=%d]" % size,
+             lambda data=data: chatlib.build_message(chatlib.your_question_msg, data), None),
+            ("chatlib.encode_message[data=%d]" % size,
+             lambda data=data: chatlib.encode_message(chatlib.your_question_msg, data), None),
+            ("chatlib.parse_message[data=%d]" % size, lambda msg=msg: chatlib.parse_message(msg), None),
+            ("chatlib.join_data[data=%d]" % size, lambda fields=fields: chatlib.join_data(fields), None),
+            ("chatlib.split_data[data=%d]" % size,
+             lambda joined=joined: chatlib.split_data(joined, chatlib.QUESTION_DATA_COMPONENTS), None),
+        ]
+    return benchmarks
+
+
+def server_benchmarks(user_sizes, question_sizes, json_dir):
+    """
+    :return: list of (name, stmt, setup) of the server benchmarks. The users and questions are generated
+             lazily, when a benchmark of their size runs
+    """
+    benchmarks = []
+    generated = {}
+
+    def use(user_count, question_count):
+        key = (user_count, question_count)
+        if key not in generated:
+            generated.clear()  # keep one generated set in memory
+            generated[key] = (make_users(user_count, question_count), make_questions(question_count))
+        setup_server(*generated[key])
+        server.leaderboard.payload()  # build the cached ranking outside of the timing
+
+    session = Session(None, -1, ("127.0.0.1", 0))
+
+    def highscore(data=""):
+        server.handle_highscore_message(session, data)
+        session.outbox.clear()
+
+    def draw():
+        if server.create_random_question("user0")[0] is None:  # the pool ran out, start a new one
+            server.question_pools.clear()
+
+    players = collections.deque()  # sessions of every user, asked questions in turn
+
+    def question():
+        player = players[0]
+        players.rotate()
+        server.handle_question_message(player)
+        player.outbox.clear()
+
+    def use_question(user_count, question_count):
+        use(user_count, question_count)
+        players.clear()
+        for username, user in server.users.items():
+            player = Session(None, -1, ("127.0.0.1", 0))
+            player.username = username
+            player.user = user
+            players.append(player)
+
+    def round_question():
+        value = server.questions[server.question_ids[0]]
+        fields = chatlib.build_question_fields(server.question_ids[0], value["question"], value["answers"])
+        server.broadcast(players, chatlib.round_question_msg, ["1", "20"] + fields)
+        server.pushed.clear()
+        for player in players:
+            player.outbox.clear()
+
+    def use_stored(user_count, question_count):
+        use(user_count, question_count)
+        generated["stored"] = {username: user_store.encode_user(record)
+                               for username, record in server.users.items()}
+
+    def score_change_and_highscore():
+        server.leaderboard.set_score("user0", random.randrange(1000))
+        highscore()
+
+    for question_count in question_sizes:
+        user_count = user_sizes[0]
+        benchmarks.append(("server.create_random_question[questions=%d]" % question_count,
+                           draw,
+                           lambda user_count=user_count, question_count=question_count: use(user_count,
+                                                                                          question_count)))
+        benchmarks.append(("server.handle_question_message[questions=%d]" % question_count, question,
+                           lambda user_count=user_count, question_count=question_count: use_question(
+                               user_count, question_count)))
+    for user_count in user_sizes:
+        question_count = question_sizes[0]
+        setup = (lambda user_count=user_count, question_count=question_count: use(user_count, question_count))
+        json_name = os.path.join(json_dir, "users_%d.json" % user_count)
+        benchmarks += [
+            ("server.handle_highscore_message[users=%d]" % user_count, highscore, setup),
+            ("server.handle_highscore_message[users=%d,page=10]" % user_count,
+             lambda: highscore("100#10"), setup),
+            ("server.handle_highscore_message[users=%d,score_changed]" % user_count,
+             score_change_and_highscore, setup),
+            ("server.broadcast[players=%d]" % user_count, round_question,
+             lambda user_count=user_count, question_count=question_count: use_question(user_count, question_count)),
+            ("server.update_json[users=%d]" % user_count,
+             lambda json_name=json_name: server.update_json(json_name, generated["stored"]),
+             lambda user_count=user_count, question_count=question_count: use_stored(user_count, question_count)),
+        ]
+    return benchmarks
+
+
+def run(benchmarks, name_filter=None):
+    """
+    time every benchmark whose name contains name_filter
+    :param benchmarks: list of (name, stmt, setup), setup (or None) runs before every timing repetition
+    :return: dictionary of benchmark name to its fastest time per call (seconds)
+    """
+    results = {}
+    for name, stmt, setup in benchmarks:
+        if name_filter is not None and name_filter not in name:
+            continue
+        timer = timeit.Timer(stmt, setup or "pass")
+        number, _ = timer.autorange()
+        results[name] = min(timer.repeat(REPEAT, number)) / number
+        print("%-60s %12.3f us" % (name, results[name] * 1e6))
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    :param results: dictionary of benchmark name to seconds per call
+    :param baseline: dictionary of benchmark name to seconds per call of an earlier run
+    :return: list of the names of the benchmarks slower than the baseline by more than threshold
+    """
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1
+        print("%-60s %+7.1f%%%s" % (name, change * 100, "  REGRESSION" if change > threshold else ""))
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="microbenchmarks of the chatlib and server hot paths")
+    parser.add_argument("-k", "--filter", type=str, default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="only the smallest users and questions sizes")
+    parser.add_argument("--save", type=str, default=None, metavar="JSON", help="write the results to a baseline json")
+    parser.add_argument("--compare", type=str, default=None, metavar="JSON",
+                        help="compare the results to a baseline json, exit with 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown (fraction) reported as a regression")
+    args = parser.parse_args()
+
+    user_sizes = USER_SIZES[:1] if args.quick else USER_SIZES
+    question_sizes = QUESTION_SIZES[:1] if args.quick else QUESTION_SIZES
+    with tempfile.TemporaryDirectory() as json_dir:
+        results = run(chatlib_benchmarks() + server_benchmarks(user_sizes, question_sizes, json_dir), args.filter)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"python": platform.python_version(), "results": results}, f, indent=4)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+COMPACT_OFFSET = 64 * 1024  # sent bytes kept at the buffer head before they are dropped
+
+
+class Outbox:
+    """
+    Outgoing bytes of one connection.
+    Messages are appended to a single bytearray, so several replies queued for the same client go out
+    in one send() call. A partial send only advances the offset; the sent prefix is dropped lazily.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0  # index of the first byte not sent yet
+
+    def __len__(self):
+        return len(self.buffer) - self.offset
+
+    def append(self, data):
+        """
+        queue bytes to be sent
+        :param data: bytes to send
+        :return:
+        """
+        self.buffer += data
+
+    def take(self):
+        """
+        remove and return all pending bytes (for engines that write through their own transport)
+        :return: bytes
+        """
+        data = self.pending()
+        self.clear()
+        return data
+
+    def pending(self):
+        """
+        :return: the pending bytes, left in the outbox
+        """
+        return bytes(self.buffer[self.offset:])
+
+    def clear(self):
+        self.buffer.clear()
+        self.offset = 0
+
+    def flush(self, conn):
+        """
+        send as many pending bytes as conn accepts without blocking
+        :param conn: non-blocking socket object
+        :return: number of bytes sent
+        """
+        if not len(self):
+            return 0
+        try:
+            with memoryview(self.buffer) as view:
+                sent = conn.send(view[self.offset:])
+        except (BlockingIOError, InterruptedError):
+            return 0
+        self.offset += sent
+        if self.offset == len(self.buffer):
+            self.clear()
+        elif self.offset >= COMPACT_OFFSET:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        return sent
@@ -0,0 +1,168 @@
+import base64
+import collections
+import hashlib
+import hmac
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+
+SCRYPT_N = 2 ** 14  # scrypt cost: about 16 MiB and tens of milliseconds per hash
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000  # PBKDF2-HMAC-SHA256 iterations, used when hashlib has no scrypt
+SALT_SIZE = 16
+HASH_SIZE = 32
+MAX_PENDING = 128  # password verifications in flight before new logins are refused
+
+
+# scheme$parameters prefix of the passwords hashed by hash_password
+if hasattr(hashlib, "scrypt"):
+    HASH_PARAMETERS = "scrypt$%d$%d$%d" % (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+else:
+    HASH_PARAMETERS = "pbkdf2_sha256$%d" % PBKDF2_ITERATIONS
+
+
+def hash_password(password, salt=None):
+    """
+    :param password: plaintext password
+    :param salt: salt bytes, random if None
+    :return: stored form of the password: scheme$parameters$salt$hash (salt and hash in base64)
+    """
+    salt = os.urandom(SALT_SIZE) if salt is None else salt
+    if hasattr(hashlib, "scrypt"):
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=HASH_SIZE)
+    else:
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS, HASH_SIZE)
+    return "%s$%s$%s" % (HASH_PARAMETERS, base64.b64encode(salt).decode(), base64.b64encode(digest).decode())
+
+
+def is_hashed(stored):
+    return stored.startswith("scrypt$") or stored.startswith("pbkdf2_sha256$")
+
+
+def needs_rehash(stored):
+    """
+    :return: True if stored is a plaintext password or was hashed with other parameters than hash_password uses
+    """
+    return stored.rsplit("$", 2)[0] != HASH_PARAMETERS
+
+
+def verify_password(password, stored):
+    """
+    check a password against its stored form. Slow on purpose: run it in a Verifier's processes
+    :param password: plaintext password given at login
+    :param stored: stored form (hash_password), or a plaintext password not migrated yet
+    :return: True if the password matches, and the new stored form if it matches but should be rehashed
+             (plaintext or outdated parameters) - None otherwise
+    """
+    if not is_hashed(stored):
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+    else:
+        fields = stored.split("$")
+        salt, digest = base64.b64decode(fields[-2]), base64.b64decode(fields[-1])
+        if fields[0] == "scrypt":
+            n, r, p = (int(field) for field in fields[1:4])
+            computed = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=len(digest))
+        else:
+            computed = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(fields[1]), len(digest))
+        ok = hmac.compare_digest(computed, digest)
+    return ok, hash_password(password) if ok and needs_rehash(stored) else None
+
+
+def hash_plaintext(users, processes=None):
+    """
+    hash every plaintext password of users, in parallel
+    :param users: users dictionary (changed in place)
+    :param processes: number of hashing processes, None for one per cpu
+    :return: list of the usernames whose password was hashed
+    """
+    plaintext = [username for username, record in users.items() if not is_hashed(record["password"])]
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        hashed = pool.map(hash_password, [users[username]["password"] for username in plaintext], chunksize=16)
+        for username, stored in zip(plaintext, hashed):
+            users[username]["password"] = stored
+    return plaintext
+
+
+class Verifier:
+    """
+    Verifies passwords in a pool of processes, so the (slow) hashing of a login never stalls the server loop.
+    At most max_pending verifications are in flight: submit() refuses more, which is the server's
+    backpressure against login storms. A finished verification is queued with its callback and a byte is
+    written to a wakeup socket, which the server loop watches (select / loop.add_reader) and then calls
+    run_completed() to run the callbacks on its own thread.
+    processes=0 verifies on the server thread (still completing through run_completed)
+    """
+
+    def __init__(self, processes=None, max_pending=MAX_PENDING):
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool = None
+        if processes != 0:  # spawn: the server process has threads (log writer, user store writer) unsafe to fork
+            self._pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"))
+        self._completed = collections.deque()  # (callback, result), appended by the pool's thread
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+
+    def fileno(self):
+        """
+        :return: fd readable when verifications completed (so a Verifier can be passed to select)
+        """
+        return self._wakeup_reader.fileno()
+
+    def submit(self, password, stored, callback):
+        """
+        start verifying password
+        :param callback: called by run_completed() with the results of verify_password (ok, rehashed)
+        :return: False if max_pending verifications are already in flight (nothing was started)
+        """
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        if self._pool is None:
+            try:
+                self._complete(callback, verify_password(password, stored))
+            except ValueError:  # a corrupt stored password
+                self._complete(callback, (False, None))
+        else:
+            future = self._pool.submit(verify_password, password, stored)
+            future.add_done_callback(lambda future: self._done(callback, future))
+        return True
+
+    def _done(self, callback, future):
+        if future.cancelled() or future.exception() is not None:  # e.g. a corrupt stored password
+            self._complete(callback, (False, None))
+        else:
+            self._complete(callback, future.result())
+
+    def _complete(self, callback, result):
+        self._completed.append((callback, result))
+        try:
+            self._wakeup_writer.send(b"\0")
+        except BlockingIOError:  # the socket is full of wakeups already
+            pass
+
+    def run_completed(self):
+        """
+        run the callbacks of the finished verifications (on the calling thread)
+        :return:
+        """
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._completed:
+            callback, result = self._completed.popleft()
+            self.pending -= 1
+            callback(*result)
+        return
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+        return
@@ -0,0 +1,130 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import passwords
+import server
+import sqlite_store
+import user_store
+
+SALT = b"0123456789abcdef"
+
+
+def outdated_hash(password):
+	"""
+	:return: stored form of password hashed with fewer iterations than hash_password uses
+	"""
+	digest = hashlib.pbkdf2_hmac("sha256", password.encode(), SALT, 1000, passwords.HASH_SIZE)
+	return "pbkdf2_sha256$1000$%s$%s" % (base64.b64encode(SALT).decode(), base64.b64encode(digest).decode())
+
+
+def check_verify(password, stored, expected_output):
+	"""
+	:param expected_output: whether password matches stored, and whether a new stored form (that matches
+	                        password) is returned to replace stored
+	"""
+	print("Input: ", password, stored, "\nExpected output: ", expected_output)
+
+	try:
+		ok, rehashed = passwords.verify_password(password, stored)
+		output = (ok, rehashed is not None)
+		if rehashed is not None and (passwords.needs_rehash(rehashed) or
+		                             passwords.verify_password(password, rehashed) != (True, None)):
+			output = "rehashed to " + rehashed
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_needs_rehash(stored, expected_output):
+	print("Input: ", stored, "\nExpected output: ", expected_output)
+
+	try:
+		output = passwords.needs_rehash(stored)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_migration(storage, stored_passwords, expected_output):
+	"""
+	run the --hash-passwords migration on users with the given stored passwords
+	:param storage: "json" or "sqlite"
+	:param stored_passwords: dict of username -> (password, stored form before the migration)
+	:param expected_output: usernames whose stored form was replaced (every password must still verify)
+	"""
+	print("Input: ", storage, stored_passwords, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			users_json = os.path.join(tmp, "users.json")
+			db_name = os.path.join(tmp, "trivia.db")
+			with open(users_json, 'w', encoding='utf-8') as f:
+				json.dump({username: {"password": stored, "score": 0, "questions_asked": [], "questions_answered": []}
+				           for username, (password, stored) in stored_passwords.items()}, f)
+			if storage == "sqlite":
+				sqlite_store.import_users(db_name, users_json)
+			server.hash_passwords(argparse.Namespace(storage=storage, users=users_json, db=db_name,
+			                                         login_processes=1))
+			if storage == "sqlite":
+				db_store = sqlite_store.SqliteStore(db_name)
+				migrated = db_store.load()
+				db_store.close()
+			else:
+				migrated = user_store.load_users(users_json)
+			output = sorted(username for username, (password, stored) in stored_passwords.items()
+			                if migrated[username]["password"] != stored)
+			for username, (password, stored) in stored_passwords.items():
+				if not passwords.is_hashed(migrated[username]["password"]):
+					output = "not hashed: " + username
+				elif not passwords.verify_password(password, migrated[username]["password"])[0]:
+					output = "doesn't verify: " + username
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	hashed = passwords.hash_password("pass1")
+
+	# VERIFY
+	check_verify("pass1", hashed, (True, False))
+	check_verify("pass2", hashed, (False, False))
+	check_verify("pass1", passwords.hash_password("pass1", SALT), (True, False))
+	# Legacy plaintext records verify and come back hashed
+	check_verify("pass1", "pass1", (True, True))
+	check_verify("pass2", "pass1", (False, False))
+	# Records hashed with outdated parameters verify and come back rehashed
+	check_verify("pass1", outdated_hash("pass1"), (True, True))
+	check_verify("pass2", outdated_hash("pass1"), (False, False))
+
+	# NEEDS REHASH
+	check_needs_rehash(hashed, False)
+	check_needs_rehash("pass1", True)
+	check_needs_rehash("a$b$c", True)
+	check_needs_rehash(outdated_hash("pass1"), True)
+
+	# MIGRATION (--hash-passwords)
+	# Plaintext passwords are hashed, hashed ones are left as they are
+	stored_passwords = {"user1": ("pass1", "pass1"), "user2": ("pass2", "pass2"), "user3": ("pass1", hashed)}
+	check_migration("json", stored_passwords, ["user1", "user2"])
+	check_migration("sqlite", stored_passwords, ["user1", "user2"])
+
+
+if __name__ == '__main__':
+	main()
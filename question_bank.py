@@ -0,0 +1,187 @@
+import array
+import collections.abc
+import functools
+import json
+import mmap
+import os
+import random
+
+INDEX_SUFFIX = ".idx"  # index file name = bank file name + suffix
+CACHE_SIZE = 1024  # decoded questions kept by a QuestionBank
+_MISSING = -1  # offset stored for question ids that aren't in the bank
+_MAX_ID_DIGITS = 19  # digits of the largest id an index entry can address, longer ids aren't looked up
+
+
+def build_bank(questions, bank_name):
+    """
+    write questions as a line-delimited json file plus a binary offset index.
+    Index layout (native signed 64 bit integers, array typecode 'q'):
+    [count, start of id 0, start of id 1, ..., end of the last line];
+    ids are the question numbers so the entries of missing ids hold _MISSING
+    :param questions: questions dictionary (ids must be non-negative integers as str)
+    :param bank_name: bank file name
+    :return:
+    """
+    ids = sorted(int(qid) for qid in questions)
+    offsets = array.array('q', [_MISSING] * ((ids[-1] + 2) if ids else 1))
+    offset = 0
+    with open(bank_name + ".tmp", 'wb') as f:
+        for qid in ids:
+            line = json.dumps(questions[str(qid)], ensure_ascii=False).encode() + b"\n"
+            offsets[qid] = offset
+            f.write(line)
+            offset += len(line)
+    offsets[-1] = offset
+    with open(bank_name + INDEX_SUFFIX + ".tmp", 'wb') as f:
+        array.array('q', [len(ids)]).tofile(f)
+        offsets.tofile(f)
+    # renamed over the old files, so a running server keeps its mapping of them (see server.py --takeover)
+    os.replace(bank_name + ".tmp", bank_name)
+    os.replace(bank_name + INDEX_SUFFIX + ".tmp", bank_name + INDEX_SUFFIX)
+    return
+
+
+def build_bank_from_json(json_name, bank_name):
+    """
+    (re)build the bank of a questions json if it is missing or older than the json
+    :param json_name: questions json file name
+    :param bank_name: bank file name
+    :return:
+    """
+    index_name = bank_name + INDEX_SUFFIX
+    if os.path.exists(index_name) and os.path.getmtime(index_name) >= os.path.getmtime(json_name):
+        return
+    with open(json_name, 'r', encoding='utf-8') as f:
+        build_bank(json.load(f), bank_name)
+    return
+
+
+class BankIds(collections.abc.Sequence):
+    """
+    the question ids a bank may hold ("0", "1", ...), without materializing them
+    """
+
+    def __init__(self, length):
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return str(i)
+
+
+class QuestionBank(collections.abc.Mapping):
+    """
+    Read-only questions dictionary backed by a bank file (see build_bank).
+    The bank and its index are memory mapped, so opening a bank costs the same for any size and only
+    the pages of questions actually served become resident. A question is decoded on access and the
+    last cache_size decoded questions are kept in an LRU.
+    """
+
+    def __init__(self, bank_name, cache_size=CACHE_SIZE):
+        self._files = [open(bank_name, 'rb'), open(bank_name + INDEX_SUFFIX, 'rb')]
+        self._bank = self._map(self._files[0])
+        self._index = self._map(self._files[1])
+        offsets = memoryview(self._index).cast('q') if self._index else memoryview(array.array('q', [0, 0]))
+        self._count = offsets[0]
+        self._offsets = offsets[1:]
+        self.ids = BankIds(len(self._offsets) - 1)
+        self._decode = functools.lru_cache(maxsize=cache_size)(self._load)
+
+    @staticmethod
+    def _map(f):
+        if os.fstat(f.fileno()).st_size == 0:  # mmap can't map an empty file
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _position(self, qid):
+        """
+        :return: index of qid in the offsets, or None if the bank doesn't hold qid
+        """
+        if not isinstance(qid, str) or not qid.isascii() or not qid.isdigit() or len(qid) > _MAX_ID_DIGITS:
+            return None
+        i = int(qid)
+        if str(i) != qid or i >= len(self._offsets) - 1 or self._offsets[i] == _MISSING:  # e.g. "03"
+            return None
+        return i
+
+    def _load(self, i):
+        start = self._offsets[i]
+        end = next(offset for offset in self._offsets[i + 1:] if offset != _MISSING)
+        return json.loads(self._bank[start:end])
+
+    def __getitem__(self, qid):
+        i = self._position(qid)
+        if i is None:
+            raise KeyError(qid)
+        return self._decode(i)
+
+    def __contains__(self, qid):
+        return self._position(qid) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(len(self._offsets) - 1):
+            if self._offsets[i] != _MISSING:
+                yield str(i)
+
+    def close(self):
+        self._decode.cache_clear()
+        del self._offsets
+        for mapped in (self._bank, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for f in self._files:
+            f.close()
+        return
+
+
+class QuestionPool:
+    """
+    Random draw without replacement from a sequence of question ids, skipping the ids a user was already asked.
+    A lazily materialized Fisher-Yates shuffle: only the positions swapped so far are stored, so creating a
+    pool is O(1) and memory grows with the number of draws, not with the number of questions.
+    """
+
+    def __init__(self, ids, questions, asked):
+        """
+        :param ids: sequence of candidate question ids (supports len() and indexing)
+        :param questions: questions dictionary (ids missing from it are skipped)
+        :param asked: set of question ids to skip
+        """
+        self._ids = ids
+        self._questions = questions
+        self._asked = asked
+        self._remaining = len(ids)
+        self._swapped = {}  # position -> position of the id that was swapped into it
+        self._put_back = []  # drawn ids that weren't asked after all, drawn again first
+
+    def put_back(self, qid):
+        """
+        return a drawn question id that wasn't asked after all (e.g. didn't fit in a message), so it is drawn again
+        """
+        self._put_back.append(qid)
+
+    def draw(self):
+        """
+        :return: a random question id that wasn't drawn nor asked yet, None if no such id is left
+        """
+        while self._put_back:
+            qid = self._put_back.pop()
+            if qid not in self._asked:
+                return qid
+        while self._remaining:
+            i = random.randrange(self._remaining)
+            last = self._remaining - 1
+            position = self._swapped.get(i, i)
+            self._swapped[i] = self._swapped.pop(last, last)
+            self._remaining = last
+            qid = self._ids[position]
+            if qid not in self._asked and qid in self._questions:
+                return qid
+        return None
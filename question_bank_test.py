@@ -0,0 +1,117 @@
+import array
+import os
+import tempfile
+import question_bank
+
+QUESTIONS = {str(qid): {"question": "q" + str(qid), "answers": ["a", "b", "c", "d"], "correct": 1} for qid in (0, 2, 5)}
+
+
+def check_bank(qids, expected_output):
+	"""
+	look question ids up in a bank of QUESTIONS
+	:param expected_output: text of each question, None for ids the bank doesn't hold
+	"""
+	print("Input: ", qids, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			bank_name = os.path.join(tmp, "questions.bank")
+			question_bank.build_bank(QUESTIONS, bank_name)
+			bank = question_bank.QuestionBank(bank_name)
+			output = [bank[qid]["question"] if qid in bank else None for qid in qids]
+			bank.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_layout(expected_output):
+	"""
+	:param expected_output: entries of the index of a bank of QUESTIONS (count, then offsets), len() and ids
+	"""
+	print("Expected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			bank_name = os.path.join(tmp, "questions.bank")
+			question_bank.build_bank(QUESTIONS, bank_name)
+			index = array.array('q')
+			with open(bank_name + question_bank.INDEX_SUFFIX, 'rb') as f:
+				index.frombytes(f.read())
+			bank = question_bank.QuestionBank(bank_name)
+			output = (index.tolist(), len(bank), list(bank))
+			bank.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_pool(ids, asked, put_back, expected_output):
+	"""
+	draw from a QuestionPool of QUESTIONS until it runs out
+	:param ids: candidate ids of the pool
+	:param asked: ids the user was already asked
+	:param put_back: number of draws put back right after they were drawn (before the next draw)
+	:param expected_output: the ids drawn, sorted
+	"""
+	print("Input: ", ids, asked, put_back, "\nExpected output: ", expected_output)
+
+	try:
+		pool = question_bank.QuestionPool(ids, QUESTIONS, set(asked))
+		drawn = []
+		for _ in range(put_back):
+			qid = pool.draw()
+			if qid is not None:
+				pool.put_back(qid)
+		qid = pool.draw()
+		while qid is not None:
+			drawn.append(qid)
+			qid = pool.draw()
+		output = sorted(drawn)
+		if pool.draw() is not None:
+			output = "drew after running out"
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	# BANK
+	# Missing ids hold -1 in the index, the last entry is the end of the last line
+	line = len(b'{"question": "q0", "answers": ["a", "b", "c", "d"], "correct": 1}\n')
+	check_layout(([3, 0, -1, line, -1, -1, 2 * line, 3 * line], 3, ["0", "2", "5"]))
+	# Held ids are decoded, missing ones (in the middle of the index and past its end) aren't held
+	check_bank(["0", "2", "5", "1", "6"], ["q0", "q2", "q5", None, None])
+	# Ids that int() would read as a held id aren't held: leading zeros, non ascii digits, not digits at all
+	check_bank(["02", "\u0662", "\u00b2", "-2", "2" * 30, ""], [None] * 6)
+
+
+	# POOL
+	# Every question is drawn exactly once
+	check_pool(["0", "2", "5"], [], 0, ["0", "2", "5"])
+	check_pool(question_bank.BankIds(6), [], 0, ["0", "2", "5"])
+	# Asked ids are skipped
+	check_pool(["0", "2", "5"], ["2"], 0, ["0", "5"])
+	# A question put back is drawn again, once
+	check_pool(["0", "2", "5"], [], 1, ["0", "2", "5"])
+	check_pool(["0", "2", "5"], [], 3, ["0", "2", "5"])
+	# Nothing to draw
+	check_pool(["0", "2", "5"], ["0", "2", "5"], 1, [])
+	check_pool([], [], 0, [])
+
+
+if __name__ == '__main__':
+	main()
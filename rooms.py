@@ -0,0 +1,72 @@
+ROUND_SECONDS = 20.0  # seconds players have to answer the question of a round
+ROUND_PAUSE = 5.0  # seconds between the result of a round and the next question (and before the first one)
+
+
+class Room:
+    """
+    Players (sessions) playing synchronized rounds: every round the same question is pushed to all of them and
+    answers are collected until the round's deadline, then scored at once and the result pushed. The next
+    round starts round_pause seconds later, for as long as the room has players.
+    The server schedules rooms on its TimerHeap: deadline says when the room should run next (close the
+    open round, or open the next one).
+    """
+
+    def __init__(self, name, new_pool):
+        """
+        :param name: room name
+        :param new_pool: function returning a new question_bank.QuestionPool to draw the room's questions from
+        """
+        self.name = name
+        self.players = {}  # sessions (keys, the values are unused), in join order
+        self.round = 0  # number of the open (or last) round
+        self.qid = None  # question of the open round, None between rounds
+        self.answers = {}  # username -> chosen answer (int) of the open round
+        self.deadline = None  # time.monotonic() the room runs next at
+        self._new_pool = new_pool
+        self._pool = new_pool()
+
+    def __len__(self):
+        return len(self.players)
+
+    def open_round(self, now, seconds):
+        """
+        start the next round with a question the room wasn't asked yet (all questions again once they ran out)
+        :param now: current time.monotonic()
+        :param seconds: seconds players have to answer
+        :return: question id of the round, None if there are no questions (no round was opened)
+        """
+        qid = self._pool.draw()
+        if qid is None:
+            self._pool = self._new_pool()
+            qid = self._pool.draw()
+            if qid is None:
+                return None
+        self.round += 1
+        self.qid = qid
+        self.answers.clear()
+        self.deadline = now + seconds
+        return qid
+
+    def answer(self, username, round_number, choice):
+        """
+        record the answer of a player to the open round (only the first answer counts)
+        :return: error message, None if the answer was recorded
+        """
+        if self.qid is None or round_number != self.round:
+            return "round closed"
+        if username in self.answers:
+            return "You may only answer question once"
+        self.answers[username] = choice
+        return None
+
+    def close_round(self, now, pause):
+        """
+        close the open round, the next one opens pause seconds later
+        :param now: current time.monotonic()
+        :return: question id of the round and its answers (username -> choice)
+        """
+        qid, answers = self.qid, self.answers
+        self.qid = None
+        self.answers = {}
+        self.deadline = now + pause
+        return qid, answers
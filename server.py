@@ -1,90 +1,289 @@
+import base64
+import multiprocessing
+import os
 import select
+import signal
 import socket
+import sys
+import time
+import collections
+import functools
+import logging
 import chatlib
-import random
 import json
 import web_questions_loader
 import argparse
+import user_store
+import question_bank
+import shared_state
+import sqlite_store
+import passwords
+import handoff
+import server_log
+from server_log import logger
+from leaderboard import Leaderboard
+from rooms import Room, ROUND_SECONDS, ROUND_PAUSE
+from session import Session
+from stats import Stats
+from timers import TimerHeap
 
-logged_users = {}  # a dictionary of client hostnames to usernames
-client_sockets = []  # logged users sockets
-messages_to_send = []  # message = (conn, cmd, data)
+sessions = {}  # a dictionary of client socket fds to their Session
+logged_sessions = {}  # a dictionary of logged usernames to their Session (in login order)
 users = {}  # users dictionary to be loaded on init
-questions = {}  # questions dictionary to be loaded on init
+questions = {}  # questions dictionary (or question_bank.QuestionBank) to be loaded on init
+question_ids = []  # sequence of the question ids questions may hold, drawn from by the question pools
+store = None  # user_store.UserStore or sqlite_store.SqliteStore persisting users, created on init
+shared = None  # shared_state.SharedState of a worker process, None when running as a single process
+leaderboard = Leaderboard()  # users ranked by score, loaded on init and updated on every score change
+question_pools = {}  # a dictionary of logged usernames to their question_bank.QuestionPool of unasked questions
+admin_users = set()  # usernames allowed to use admin commands (STATS)
+stats = Stats()  # call / error counters and latency histograms of the dispatched commands
+timers = TimerHeap()  # sessions by the time they may time out at and rooms by their next round, see run_timers
+max_connections = 0  # connections beyond this number are refused, 0 for no limit
+login_timeout = 0  # seconds a client may stay connected without logging in, 0 for no limit
+idle_timeout = 0  # seconds a logged user may stay connected without sending anything, 0 for no limit
+keepalive = None  # TCP keepalive (idle seconds, probe interval seconds, probe count) of client sockets, None for off
+verifier = None  # passwords.Verifier checking login passwords in other processes, created on init
+resumed = collections.deque()  # sessions whose login was verified, their buffered messages wait to be handled
+rooms = {}  # a dictionary of room names to their rooms.Room (rooms without players are removed)
+round_seconds = ROUND_SECONDS  # seconds players have to answer the question of a round
+round_pause = ROUND_PAUSE  # seconds between rounds
+pushed = []  # sessions given messages outside of a request (round pushes) since the engine last wrote them
+handoff_listener = None  # unix socket a new server process connects to for a hot restart, None without one
 
 QUESTIONS_JSON = "questions.json"
+QUESTIONS_BANK = "questions.bank"
 USERS_JSON = "users.json"
-MAX_MSG_LENGTH = 1024
+USERS_BACKUP_JSON = "users_backup.json"
+SELECT_MAX_CONNECTIONS = 1000  # default connection limit of the select engine (select() handles fds < 1024)
+QUESTION_FRAME_CACHE_SIZE = 16384  # encoded YOUR_QUESTION messages kept (of both protocol versions)
 
 
-def build_and_append_to_outbox(conn, cmd, data):
+def build_and_append_to_outbox(session, cmd, data):
     """
-    build message using chatlib.build_message according to the protocol and append to messages_to_send
+    build message using chatlib according to the session's protocol and append it to the outbox of session
+    :param data: str, or list of fields (joined for protocol v1, sent as they are by protocol v2)
     """
-    global messages_to_send
-    msg = chatlib.build_message(cmd, data)
-    messages_to_send.append((conn, msg))
+    if session.protocol == chatlib.PROTOCOL_V2:
+        msg = chatlib.encode_frame(cmd, data)
+    else:
+        msg = chatlib.encode_message(cmd, data)
+    append_to_outbox(session, cmd, msg)
+    return
+
+
+def append_to_outbox(session, cmd, msg):
+    """
+    append an already encoded message to the outbox of session
+    :param cmd: command of the message (for the trace log)
+    :param msg: message (bytes) encoded for the session's protocol
+    """
+    if server_log.tracing and server_log.sampled():
+        server_log.trace_logger.debug("[SERVER] %s %s %s", session.peername, cmd, msg)
+    session.outbox.append(msg)
     return
 
 
 def send_messages(ready_to_write):
     """
-    Send messages to clients who are ready to write
-    message = (conn, cmd, data)
-    :param ready_to_write: list of ready to write clients
+    Flush the outboxes of clients who are ready to write
+    :param ready_to_write: list of ready to write client sockets
     :return:
     """
 
-    global messages_to_send
-    for message in messages_to_send:
-        conn, content = message
-        if conn in ready_to_write:
-            conn.send(content.encode())
-            print("[SERVER] ", conn.getpeername(), content)
-            messages_to_send.remove(message)
+    global sessions
+    for conn in ready_to_write:
+        session = sessions.get(conn.fileno())
+        if session is None:  # logged out earlier in this loop iteration (a closed socket's fileno is -1)
+            continue
+        try:
+            session.outbox.flush(conn)
+        except ConnectionError:
+            logger.info("client %s forced disconnect", session.peername)
+            handle_logout_message(session)
     return
 
 
-def recv_message_and_parse(conn):
+def recv_messages_and_parse(session):
+    """
+    Receives available bytes from the session's socket, then parses every complete message in them using chatlib.
+    A client may pipeline several messages, a message may also arrive split over several calls.
+    Messages are parsed one at a time as they are consumed, so a protocol switched by a message (at login)
+    applies to the messages after it. The bytes are received right away, the messages when consumed
+    :param: session
+    :return: generator of cmd (str) and data (str, or list of fields for protocol v2) of the received messages.
+             A message that couldn't be parsed appears as None, None
+    """
+    if session.reader.recv_from(session.conn) == 0:  # client closed the connection
+        raise ConnectionResetError
+    session.last_active = time.monotonic()
+    return parse_messages(session)
+
+
+def parse_messages(session):
+    """
+    :param: session
+    :return: generator of cmd (str) and data of the messages already received from the session's socket,
+             parsed one at a time as they are consumed (see recv_messages_and_parse)
+    """
+    for cmd, data in session.reader:
+        if server_log.tracing and server_log.sampled():
+            server_log.trace_logger.debug("[CLIENT] %s %s %s", session.peername, cmd, data)
+        yield cmd, data
+
+
+def handle_messages(session, messages):
+    """
+    handle the messages of session until it logs out or is paused by a login (the messages after the login
+    stay in its reader until the login completes)
+    :param session: Session
+    :param messages: generator of cmd, data (recv_messages_and_parse / parse_messages)
+    :return:
+    """
+    for cmd, data in messages:
+        if session.fd not in sessions:  # logged out by a previous message
+            break
+        handle_client_message(session, cmd, data)
+        if session.paused:
+            break
+    return
+
+
+def add_session(conn, fd, peername):
+    """
+    register a new client connection
+    :param conn: socket object (or a socket-like object of another engine)
+    :param fd: file descriptor of the connection
+    :param peername: client address
+    :return: the new Session
+    """
+    global sessions
+    session = Session(conn, fd, peername)
+    sessions[fd] = session
+    schedule_timeout(session)
+    logger.info("New client joined: %s", peername)
+    print_client_sockets()
+    return session
+
+
+def is_full():
+    """
+    :return: True if new connections must be refused (max_connections reached)
+    """
+    return max_connections > 0 and len(sessions) >= max_connections
+
+
+def refuse_message():
+    """
+    :return: the message (bytes) sent to a refused client before closing the connection
+    """
+    return chatlib.encode_message(chatlib.error_msg, "server full, try again later")
+
+
+def set_keepalive(sock):
     """
-    Receives a new message from given socket, then parses the message using chatlib.
-    :param: conn (socket object)
-    :return: cmd (str) and data (str) of the received message.
-             If error occurred, will return None, None
+    enable TCP keepalive on a client socket, so crashed peers and half-open connections are detected
+    by the kernel even while the client is idle
+    :param sock: socket object
+    :return:
     """
-    msg = conn.recv(MAX_MSG_LENGTH).decode()
-    print("[CLIENT] ", conn.getpeername(), msg)  # Debug print
-    cmd, data = chatlib.parse_message(msg)
-    return cmd, data
+    if keepalive is None:
+        return
+    idle, interval, count = keepalive
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, "TCP_KEEPIDLE"):  # not on every platform
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    return
 
 
 def connect_to_client(conn):
-    global client_sockets
     (client_socket, client_address) = conn.accept()
-    client_sockets.append(client_socket)
-    print("New client joined: " + str(client_address))
-    print_client_sockets()
-    return client_sockets
+    if is_full():
+        logger.info("refusing client %s: %d connections", client_address, len(sessions))
+        try:
+            client_socket.send(refuse_message())
+        except OSError:
+            pass
+        client_socket.close()
+        return None
+    client_socket.setblocking(False)
+    set_keepalive(client_socket)
+    return add_session(client_socket, client_socket.fileno(), client_address)
+
+
+def session_deadline(session):
+    """
+    :return: time (time.monotonic()) session times out at: login_timeout after connecting until the user
+             logs in, then idle_timeout after the last message. None if it never times out
+    """
+    if session.username is None:
+        return session.connected_at + login_timeout if login_timeout else None
+    return session.last_active + idle_timeout if idle_timeout else None
+
+
+def schedule_timeout(session):
+    deadline = session_deadline(session)
+    if deadline is not None:
+        timers.push(deadline, session)
+    return
+
+
+def run_timers(now):
+    """
+    run the timers that expired: close the sessions that timed out and run the rooms' rounds
+    :param now: current time.monotonic()
+    :return:
+    """
+    for item in timers.pop_expired(now):
+        if item.__class__ is Room:
+            run_room(item, now)
+        else:
+            reap_session(item, now)
+    return
+
+
+def reap_session(session, now):
+    """
+    close session if it timed out. A session that was active since it was scheduled is scheduled
+    again at its new deadline
+    :param now: current time.monotonic()
+    :return:
+    """
+    if sessions.get(session.fd) is not session:  # already closed
+        return
+    deadline = session_deadline(session)
+    if deadline is None:
+        return
+    if deadline > now:
+        timers.push(deadline, session)
+        return
+    logger.info("client %s timed out", session.peername)
+    handle_logout_message(session)
+    return
 
 
 def print_client_sockets():
-    global client_sockets
-    print("Current clients:")
-    for c in client_sockets:
-        print("\t", c.getpeername())
+    global sessions
+    if logger.isEnabledFor(logging.DEBUG):  # O(clients), only worth it when debugging
+        logger.debug("Current clients: %s", ", ".join(str(session.peername) for session in sessions.values()))
     return
 
 
-def setup_socket(server_ip, server_port):
+def setup_socket(server_ip, server_port, reuse_port=False):
     """
     Creates new listening socket and returns it
+    :param reuse_port: let other processes listen on the same port (the kernel spreads connections between them)
     :return: the socket object
     """
-    print("Setting up server...")
+    logger.info("Setting up server...")
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     server_socket.bind((server_ip, server_port))
     server_socket.listen()
-    print("Listening for clients... IP:", server_ip, "PORT:", server_port)
+    logger.info("Listening for clients... IP: %s PORT: %s", server_ip, server_port)
     return server_socket
 
 
@@ -111,8 +310,9 @@ def update_json(json_name, content):
     return
 
 
-def reset_users_json():
-    update_json(USERS_JSON, load_from_json("users_backup.json"))
+def reset_users_json(users_json=USERS_JSON):
+    update_json(users_json, load_from_json(USERS_BACKUP_JSON))
+    user_store.remove_journal(users_json)
 
 
 # def load_user_database_from_txt():
@@ -136,242 +336,1048 @@ def reset_users_json():
 #     return
 
 
-def get_username(conn):
+def get_question_pool(username):
     """
-    return username matching the conn
-    :param conn: socket object
-    :return: username
+    return the pool of questions username wasn't asked yet, creating it on first use
+    :param username: logged username
+    :return: question_bank.QuestionPool (consumed by create_random_question)
     """
-    global logged_users
-    return logged_users[conn.getpeername()]
+    global question_pools
+    pool = question_pools.get(username)
+    if pool is None:
+        pool = question_bank.QuestionPool(question_ids, questions, users[username]["questions_asked"])
+        question_pools[username] = pool
+    return pool
 
 
 def create_random_question(username):
     """
-    choose a random question from questions (dict) which the user hasn't been asked before
-    :return: question (str), q_num(int) or None, None if no more questions left
+    choose a random question from questions (dict) which the user hasn't been asked before.
+    The user's pool draws from a lazily shuffled permutation of the question ids, so this is O(1)
+    regardless of the bank size and of how many questions the user has already seen
+    :return: question fields (list), q_num or None, None if no more questions left
     """
-    global users
     global questions
-    if set(users[username]["questions_asked"]) == set(questions.keys()):  # check user has unanswered questions
+    q_num = get_question_pool(username).draw()
+    if q_num is None:  # check user has unanswered questions
         return None, None
-    while True:
-        q_num, value = random.choice(list(questions.items()))
-        if q_num not in users[username]["questions_asked"]:
-            question = value["question"]
-            answers = value["answers"]
-            return chatlib.build_question(q_num, question, answers)
+    value = questions[q_num]
+    return chatlib.build_question_fields(q_num, value["question"], value["answers"]), q_num
+
 
+@functools.lru_cache(maxsize=QUESTION_FRAME_CACHE_SIZE)
+def question_frame(q_num, protocol):
+    """
+    the YOUR_QUESTION message of a question, built and encoded once: questions don't change after load
+    (load_questions() clears the cache)
+    :param q_num: question id
+    :param protocol: protocol version to encode for
+    :return: message (bytes)
+    """
+    value = questions[q_num]
+    fields = chatlib.build_question_fields(q_num, value["question"], value["answers"])
+    if protocol == chatlib.PROTOCOL_V2:
+        return chatlib.encode_frame(chatlib.your_question_msg, fields)
+    return chatlib.encode_message(chatlib.your_question_msg, fields)
 
-def handle_question_message(conn):
+
+def handle_question_message(session, data=""):
     """
-    Send question to client using create_random_question()
-    :param conn: socket object
+    Send a random question the user wasn't asked yet, as its cached encoded message (see question_frame())
+    :param session: Session of a logged user
+    :param data: unused
     :return:
     """
-    global questions
-    username = get_username(conn)
-    (question, q_num) = create_random_question(username)
-    if question is None:
-        build_and_append_to_outbox(conn, chatlib.no_questions_msg, "")
+    q_num = get_question_pool(session.username).draw()
+    if q_num is None:  # check user has unanswered questions
+        build_and_append_to_outbox(session, chatlib.no_questions_msg, "")
     else:
-        build_and_append_to_outbox(conn, chatlib.your_question_msg, question)
-        users[username]["questions_asked"].append(q_num)
+        append_to_outbox(session, chatlib.your_question_msg, question_frame(q_num, session.protocol))
+        session.user["questions_asked"].add(q_num)
+        store.mark_dirty(session.username)
     return
 
 
-def handle_answer_message(conn, data):
+def handle_questions_message(session, data):
     """
-    return feedback for user answer: correct / wrong
-    :param conn: socket object
-    :param data: qid#choice
+    Send up to count questions in one message, using create_random_question() like handle_question_message().
+    A v1 message stops before the question that would not fit in chatlib.MAX_DATA_LENGTH
+    :param session: Session of a logged user
+    :param data: count
     :return:
     """
-    global logged_users
-    global users
+    count = int(chatlib.data_fields(data)[0])  # checked by validate_count
+    limit = chatlib.MAX_FRAME_DATA_LENGTH if session.protocol == chatlib.PROTOCOL_V2 else chatlib.MAX_DATA_LENGTH
+    fields = []
+    size = -1  # the first question isn't preceded by a delimiter
+    for _ in range(count):
+        (question, q_num) = create_random_question(session.username)
+        if question is None:
+            break
+        size += len(chatlib.join_data(question).encode()) + 1
+        if size > limit:  # left for the next request
+            get_question_pool(session.username).put_back(q_num)
+            break
+        fields += question
+        session.user["questions_asked"].add(q_num)
+    if not fields:
+        build_and_append_to_outbox(session, chatlib.no_questions_msg, "")
+        return
+    build_and_append_to_outbox(session, chatlib.your_questions_msg, fields)
+    store.mark_dirty(session.username)
+    return
+
+
+def check_answer(session, qid, choice):
+    """
+    check one answer of the session's user, updating the score and the answered questions
+    :param session: Session of a logged user
+    :param qid: id of a question
+    :param choice: chosen answer (int)
+    :return: reply cmd (correct / wrong / error) and its data
+    """
     global questions
-    username = get_username(conn)
+    user = session.user
 
-    qid, choice = chatlib.parse_answer(data)
-    choice = int(choice)
-    print("correct is", questions[qid]["correct"])
-    if qid in users[username]["questions_answered"]:  # ensure user is only submitting one answer for each question
-        handle_error(conn, "You may only answer question once")
+    if qid in user["questions_answered"]:  # ensure user is only submitting one answer for each question
+        result = chatlib.error_msg, "You may only answer question once"
     elif questions[qid]["correct"] == choice:  # correct answer
-        users[username]["score"] += 1
-        build_and_append_to_outbox(conn, chatlib.correct_answer_msg, "")
+        user["score"] += 1
+        leaderboard.set_score(session.username, user["score"])
+        result = chatlib.correct_answer_msg, ""
     else:  # wrong answer
-        build_and_append_to_outbox(conn, chatlib.wrong_answer_msg,
-                                   questions[qid]["correct"])
-    users[username]["questions_answered"].append(qid)
+        result = chatlib.wrong_answer_msg, questions[qid]["correct"]
+    user["questions_answered"].add(qid)
+    store.mark_dirty(session.username)
+    return result
+
+
+def handle_answer_message(session, data):
+    """
+    return feedback for user answer: correct / wrong
+    :param session: Session of a logged user
+    :param data: qid#choice
+    :return:
+    """
+    qid, choice = chatlib.parse_answer(data)  # checked by validate_answer
+    cmd, result = check_answer(session, qid, int(choice))
+    build_and_append_to_outbox(session, cmd, result)
+    return
+
+
+def handle_answers_message(session, data):
+    """
+    return feedback for several answers in one message: a result cmd (as handle_answer_message() would
+    reply) and its data for every answer, in order
+    :param session: Session of a logged user
+    :param data: qid#choice#qid#choice...
+    :return:
+    """
+    fields = []
+    for qid, choice in chatlib.parse_answers(data):  # checked by validate_answers
+        fields += check_answer(session, qid, int(choice))
+    build_and_append_to_outbox(session, chatlib.answers_result_msg, fields)
+    return
+
+
+def broadcast(players, cmd, fields):
+    """
+    push a message to several sessions: it is encoded once per protocol version and the same bytes are
+    appended to every outbox
+    :param players: sessions
+    :param cmd: command
+    :param fields: list of data fields
+    :return:
+    """
+    frames = {}  # protocol -> encoded message
+    for session in players:
+        msg = frames.get(session.protocol)
+        if msg is None:
+            if session.protocol == chatlib.PROTOCOL_V2:
+                msg = frames[session.protocol] = chatlib.encode_frame(cmd, fields)
+            else:
+                msg = frames[session.protocol] = chatlib.encode_message(cmd, fields)
+        append_to_outbox(session, cmd, msg)
+        pushed.append(session)
+    return
+
+
+def run_room(room, now):
+    """
+    timer of a room: close its open round (scoring it and pushing the result) or open the next round
+    (pushing its question), then schedule the room again
+    :param room: rooms.Room
+    :param now: current time.monotonic()
+    :return:
+    """
+    if rooms.get(room.name) is not room:  # removed when its last player left
+        return
+    if room.deadline > now:  # a stale timer
+        timers.push(room.deadline, room)
+        return
+    if room.qid is not None:
+        qid, answers = room.close_round(now, round_pause)
+        correct = questions[qid]["correct"]
+        score_round(answers, correct)
+        broadcast(room.players, chatlib.round_result_msg,
+                  [room.round, correct, sum(choice == correct for choice in answers.values()), len(answers)])
+    else:
+        qid = room.open_round(now, round_seconds)
+        if qid is None:  # no questions, try again later
+            room.deadline = now + round_pause
+        else:
+            value = questions[qid]
+            broadcast(room.players, chatlib.round_question_msg,
+                      [room.round, "%g" % round_seconds] + chatlib.build_question_fields(qid, value["question"],
+                                                                                         value["answers"]))
+    timers.push(room.deadline, room)
+    return
+
+
+def score_round(answers, correct):
+    """
+    update the scores of a closed round at once: a point for every correct answer
+    :param answers: dictionary of usernames to their answer (int)
+    :param correct: the correct answer (int)
+    :return:
+    """
+    for username, choice in answers.items():
+        if choice == correct and username in users:
+            user = users[username]
+            user["score"] += 1
+            leaderboard.set_score(username, user["score"])
+            store.mark_dirty(username)
     return
 
 
-def handle_getscore_message(conn):
+def leave_room(session):
+    """
+    remove session from its room, removing the room when it has no players left
+    :param session: Session playing in a room
+    :return:
+    """
+    room = session.room
+    session.room = None
+    del room.players[session]
+    if not room.players:
+        del rooms[room.name]
+    return
+
+
+def new_room(name):
+    """
+    :return: a new rooms.Room drawing its questions from all the questions
+    """
+    return Room(name, lambda: question_bank.QuestionPool(question_ids, questions, set()))
+
+
+def handle_join_room_message(session, data):
+    """
+    add the session to a room (leaving its current room), creating the room if needed. A new room opens
+    its first round round_pause seconds later
+    :param session: Session of a logged user
+    :param data: room name
+    :return:
+    """
+    name = chatlib.data_fields(data)[0]  # checked by validate_room
+    if session.room is not None:
+        leave_room(session)
+    room = rooms.get(name)
+    if room is None:
+        room = rooms[name] = new_room(name)
+        room.deadline = time.monotonic() + round_pause
+        timers.push(room.deadline, room)
+    room.players[session] = None
+    session.room = room
+    build_and_append_to_outbox(session, chatlib.room_joined_msg, [name, len(room)])
+    return
+
+
+def handle_leave_room_message(session, data=""):
+    if session.room is None:
+        handle_error(session, "not in a room")
+        return
+    name = session.room.name
+    leave_room(session)
+    build_and_append_to_outbox(session, chatlib.room_left_msg, name)
+    return
+
+
+def handle_round_answer_message(session, data):
+    """
+    record the answer of a player to the open round of its room (scored when the round closes)
+    :param session: Session of a logged user
+    :param data: round#choice
+    :return:
+    """
+    round_number, choice = chatlib.parse_answer(data)  # checked by validate_round_answer
+    if session.room is None:
+        handle_error(session, "not in a room")
+        return
+    error = session.room.answer(session.username, int(round_number), int(choice))
+    if error is not None:
+        handle_error(session, error)
+        return
+    build_and_append_to_outbox(session, chatlib.answer_received_msg, round_number)
+    return
+
+
+def handle_getscore_message(session, data=""):
     """
     Send score to user
-    :param conn: socket object
+    :param session: Session of a logged user
+    :param data: unused
     :return:
     """
-    global users
-    username = get_username(conn)
-    build_and_append_to_outbox(conn, chatlib.your_score_msg, users[username]["score"])
+    build_and_append_to_outbox(session, chatlib.your_score_msg, session.user["score"])
 
 
-def handle_highscore_message(conn):
+def handle_highscore_message(session, data=""):
     """
     Send highscore to user
-    :param conn: socket object
+    :param session: Session of a logged user
+    :param data: "" for the whole ranking, "count" for the top count users or "offset#count" for a page
     :return:
     """
-    global users
-    scores = sorted([(user, value["score"]) for user, value in users.items()], key=lambda x: x[1],
-                    reverse=True)
-    s = ''
-    for tup in scores:
-        s = s + str(tup[0]) + ": " + str(tup[1]) + "\n"
-    build_and_append_to_outbox(conn, chatlib.all_score_msg, s)
+    global leaderboard
+    if shared is not None:  # apply the scores other workers changed
+        store.sync_leaderboard(leaderboard)
+    fields = [int(field) for field in chatlib.data_fields(data)]  # checked by validate_highscore
+    limit = chatlib.MAX_FRAME_DATA_LENGTH if session.protocol == chatlib.PROTOCOL_V2 else chatlib.MAX_DATA_LENGTH
+    if len(fields) == 2:
+        s = leaderboard.payload(fields[0], fields[1], limit)
+    elif len(fields) == 1:
+        s = leaderboard.payload(0, fields[0], limit)
+    else:
+        s = leaderboard.payload(limit=limit)
+    build_and_append_to_outbox(session, chatlib.all_score_msg, s)
 
 
-def handle_error(conn, error_msg):
+def handle_error(session, error_msg):
     """
-    Handle error using messages_to_send
-    :param: socket, message error string from called function, messages_to_send
-    :return: messages_to_send
+    Handle error by queueing an error message to the client
+    :param: session, message error string from called function
+    :return:
     """
-    global messages_to_send
-    build_and_append_to_outbox(conn, chatlib.error_msg, error_msg)
+    build_and_append_to_outbox(session, chatlib.error_msg, error_msg)
     return
 
 
-def handle_login_message(conn, data):
+def handle_login_message(session, data):
     """
-    Gets socket and message data of login message. Checks  user and pass exists and match.
-    If not - sends error and finished. If all ok, sends OK message and adds user and address to logged_users
-    :param: socket and data
+    Gets session and message data of login message. Checks the user exists and isn't logged in, then submits
+    the password to the verifier (which hashes it in other processes) and pauses the session until
+    complete_login gets the result. When too many logins are being verified the client gets a busy error.
+    A client asking for protocol v2 gets "2" in the OK message and both sides switch to it after the OK
+    :param: session and data
     :returns:
     """
-    global logged_users
-    global messages_to_send
+    global logged_sessions
     global users
 
-    username, password = chatlib.parse_login(data)
-    if username is None or password is None:
-        handle_error(conn, "invalid input")
-    elif username not in users or password != users[username]["password"]:
-        handle_error(conn, "incorrect username or password")
-    elif username in logged_users.values():
-        handle_error(conn, "user already logged in")
+    username, password, protocol = chatlib.parse_login_protocol(data)  # checked by validate_login
+    if username not in users:
+        handle_error(session, "incorrect username or password")
+    elif username in logged_sessions:
+        handle_error(session, "user already logged in")
+    elif verifier.submit(password, users[username]["password"],
+                         functools.partial(complete_login, session, username, protocol)):
+        session.paused = True  # the messages after the login wait for its result
     else:
-        build_and_append_to_outbox(conn, chatlib.login_ok_msg, "")
-        logged_users[conn.getpeername()] = username
+        handle_error(session, "server busy")
     return
 
 
-def handle_logout_message(conn):
+def complete_login(session, username, protocol, ok, rehashed):
     """
-    Closes the given socket (in later chapters, also remove user from logged_users dictionary)
-    :param: socket
+    verifier callback of a login: sends the OK message and marks the session logged in if the password matched,
+    sends an error if not. Then the session is resumed (appended to resumed) so the engine handles its next messages
+    :param session: Session that sent the login
+    :param username: username of the login
+    :param protocol: protocol version the client asked for
+    :param ok: True if the password matched
+    :param rehashed: new stored password to replace a plaintext (or outdated) one, None to keep it
+    :return:
+    """
+    global logged_sessions
+
+    session.paused = False
+    resumed.append(session)
+    if rehashed is not None and username in users:
+        store.update_password(username, rehashed)
+    if sessions.get(session.fd) is not session:  # disconnected during the verification
+        return
+    if not ok:
+        handle_error(session, "incorrect username or password")
+    elif username in logged_sessions or (shared is not None and not shared.login(username)):
+        handle_error(session, "user already logged in")
+    else:
+        if shared is not None:  # another worker may have changed the user before it logged out there
+            store.refresh(username)
+        build_and_append_to_outbox(session, chatlib.login_ok_msg,
+                                   "" if protocol == chatlib.PROTOCOL_V1 else protocol)
+        session.set_protocol(protocol)
+        session.username = username
+        session.user = users[username]
+        logged_sessions[username] = session
+        schedule_timeout(session)  # the idle timeout from now on
+    return
+
+
+def handle_logout_message(session, data=""):
+    """
+    Closes the session's socket and removes the session (and its user from logged_sessions).
+    Uses only what the session already holds, so it also works after the peer reset the connection
+    :param: session, data (unused)
     :returns:
     """
-    global logged_users
-    global client_sockets
-    global messages_to_send
+    global sessions
+    global logged_sessions
 
-    print("closing connection with client: ", conn.getpeername())
-    logged_users.pop(conn.getpeername())
-    client_sockets.remove(conn)
-    conn.close()
+    logger.info("closing connection with client: %s", session.peername)
+    if session.room is not None:
+        leave_room(session)
+    if session.username is not None:
+        if logged_sessions.get(session.username) is session:
+            del logged_sessions[session.username]
+        question_pools.pop(session.username, None)
+        if shared is not None:  # write the user before another worker may log it in and refresh it
+            store.commit()
+            shared.logout(session.username)
+    if sessions.get(session.fd) is session:
+        del sessions[session.fd]
+    try:  # best effort: the replies to the requests pipelined before the LOGOUT
+        session.outbox.flush(session.conn)
+    except OSError:
+        pass
+    session.conn.close()
     print_client_sockets()
     return
 
 
-def handle_logged_message(conn):
+def handle_logged_message(session, data=""):
     """
     Send logged users to user
-    :param conn: socket
+    :param session: Session of a logged user
+    :param data: unused
     :return:
     """
-    global logged_users
-    users_list = [value for value in logged_users.values()]
+    global logged_sessions
+    if shared is not None:
+        users_list = shared.logged_users()
+    else:
+        users_list = list(logged_sessions)
     s = ", ".join(users_list)
-    build_and_append_to_outbox(conn, chatlib.logged_answer_msg, s)
+    build_and_append_to_outbox(session, chatlib.logged_answer_msg, s)
 
 
-def handle_client_message(conn, cmd, data):
+def handle_stats_message(session, data=""):
     """
-    Gets command and data and calls the matching function to handle
-    :param: socket, cmd and data
-    :returns:
+    Send the command statistics of this server (process) to an admin user
+    :param session: Session of an admin user
+    :param data: unused
+    :return:
     """
-    global logged_users
-    global client_sockets
-    global messages_to_send
-    global users
-    global questions
+    build_and_append_to_outbox(session, chatlib.stats_report_msg, stats.report())
 
-    if cmd == chatlib.login_msg and conn.getpeername() not in logged_users.keys():  # log in user
-        handle_login_message(conn, data)
-    elif conn.getpeername() in logged_users:  # user is logged in
-        if cmd == chatlib.get_question_msg:
-            handle_question_message(conn)
-        elif cmd == chatlib.send_answer_msg:
-            handle_answer_message(conn, data)
-        elif cmd == chatlib.logged_msg:
-            handle_logged_message(conn)
-        elif cmd == chatlib.my_score_msg:
-            handle_getscore_message(conn)
-        elif cmd == chatlib.highscore_msg:
-            handle_highscore_message(conn)
-        else:  # (cmd is None and data is None) or (cmd == chatlib.logout_msg):
-            handle_logout_message(conn)
 
-    else:
-        handle_error(conn, "Error: undefined command")
+def dump_stats(signum, frame):
+    """
+    SIGUSR1 handler, logs the command statistics
+    """
+    logger.info("command stats\n%s", stats.report())
+
+
+def validate_login(data):
+    """
+    :param data: username#password or username#password#version
+    :return: True if data is a valid login payload
+    """
+    username, password, protocol = chatlib.parse_login_protocol(data)
+    return username is not None and password is not None
+
+
+def validate_answer(data):
+    """
+    :param data: qid#choice
+    :return: True if qid is a known question and choice is a number
+    """
+    qid, choice = chatlib.parse_answer(data)
+    return qid is not None and qid in questions and choice.isdecimal()
+
+
+def validate_answers(data):
+    """
+    :param data: qid#choice#qid#choice...
+    :return: True if data holds 1 to chatlib.MAX_BATCH_SIZE answers of known questions
+    """
+    answers = chatlib.parse_answers(data)
+    return (answers is not None and 0 < len(answers) <= chatlib.MAX_BATCH_SIZE and
+            all(qid in questions and choice.isdecimal() for qid, choice in answers))
+
+
+def validate_count(data):
+    """
+    :param data: count
+    :return: True if count is a number from 1 to chatlib.MAX_BATCH_SIZE
+    """
+    fields = chatlib.data_fields(data)
+    return len(fields) == 1 and fields[0].isdecimal() and 0 < int(fields[0]) <= chatlib.MAX_BATCH_SIZE
+
+
+def validate_highscore(data):
+    """
+    :param data: "", "count" or "offset#count"
+    :return: True if data is a valid highscore payload
+    """
+    fields = chatlib.data_fields(data)
+    return len(fields) <= 2 and all(field.isdecimal() for field in fields)
+
+
+def validate_room(data):
+    """
+    :param data: room name
+    :return: True if data is a name of 1 to chatlib.MAX_ROOM_NAME_LENGTH characters
+    """
+    fields = chatlib.data_fields(data)
+    return len(fields) == 1 and 0 < len(fields[0]) <= chatlib.MAX_ROOM_NAME_LENGTH
+
+
+def validate_round_answer(data):
+    """
+    :param data: round#choice
+    :return: True if both are numbers
+    """
+    round_number, choice = chatlib.parse_answer(data)
+    return round_number is not None and round_number.isdecimal() and choice.isdecimal()
+
+
+# who may use a command
+LOGGED_OUT = "logged out"
+LOGGED_IN = "logged in"
+ADMIN = "admin"
+UNKNOWN_COMMAND = "<unknown>"  # stats key of commands without a handler and of messages that couldn't be parsed
+
+# handler (session, data), who may use it and a payload validator (data -> bool, None accepts any payload)
+Command = collections.namedtuple("Command", ["handler", "auth", "validator"])
+COMMAND_HANDLERS = {
+    chatlib.login_msg: Command(handle_login_message, LOGGED_OUT, validate_login),
+    chatlib.logout_msg: Command(handle_logout_message, LOGGED_IN, None),
+    chatlib.get_question_msg: Command(handle_question_message, LOGGED_IN, None),
+    chatlib.send_answer_msg: Command(handle_answer_message, LOGGED_IN, validate_answer),
+    chatlib.get_questions_msg: Command(handle_questions_message, LOGGED_IN, validate_count),
+    chatlib.send_answers_msg: Command(handle_answers_message, LOGGED_IN, validate_answers),
+    chatlib.logged_msg: Command(handle_logged_message, LOGGED_IN, None),
+    chatlib.my_score_msg: Command(handle_getscore_message, LOGGED_IN, None),
+    chatlib.highscore_msg: Command(handle_highscore_message, LOGGED_IN, validate_highscore),
+    chatlib.stats_msg: Command(handle_stats_message, ADMIN, None),
+    chatlib.join_room_msg: Command(handle_join_room_message, LOGGED_IN, validate_room),
+    chatlib.leave_room_msg: Command(handle_leave_room_message, LOGGED_IN, None),
+    chatlib.round_answer_msg: Command(handle_round_answer_message, LOGGED_IN, validate_round_answer),
+}
+
+
+def check_auth(session, auth):
+    """
+    :return: error message if session may not use a command with the given auth, None if it may
+    """
+    if auth == LOGGED_OUT:
+        return "user already logged in" if session.username is not None else None
+    if session.username is None:
+        return "not logged in"
+    if auth == ADMIN and session.username not in admin_users:
+        return "permission denied"
+    return None
+
+
+def handle_client_message(session, cmd, data):
+    """
+    Gets command and data and calls the matching handler of COMMAND_HANDLERS, after checking the session
+    may use it and its payload is valid. Unknown commands and messages that couldn't be parsed get an error.
+    Every call is timed and recorded in stats
+    :param: session, cmd and data
+    :returns:
+    """
+    started = time.perf_counter()
+    command = COMMAND_HANDLERS.get(cmd)
+    failed = True
+    try:
+        auth_error = check_auth(session, command.auth) if command is not None else None
+        if command is None:
+            handle_error(session, "unknown command")
+        elif auth_error is not None:
+            handle_error(session, auth_error)
+        elif command.validator is not None and not command.validator(data):
+            handle_error(session, "invalid input")
+        else:
+            command.handler(session, data)
+            failed = False
+    except Exception:
+        logger.exception("error handling %s from %s", cmd, session.peername)
+        handle_error(session, "internal error")
+    finally:
+        stats.record(cmd if command is not None else UNKNOWN_COMMAND, time.perf_counter() - started, failed)
     return
 
 
 def main():
 
-    global client_sockets
-    global messages_to_send
-    global users
-    global questions
-
     parser = argparse.ArgumentParser(description="trivia game server")
     parser.add_argument("-r", "--reset", action="store_true", help="reset user and questions db")
     parser.add_argument("-p", "--port", type=int, default=5678, help="port to use for server")
     parser.add_argument("--ip", type=str, default="0.0.0.0", help="ip for server to listen")
     parser.add_argument("-q", "--questions", type=int, default=10, help="number of questions to load")
+    parser.add_argument("--questions-url", type=str, default=web_questions_loader.OPENTDB_URL,
+                        help="opentdb compatible api to load questions from on reset")
+    parser.add_argument("--questions-fixture", type=str, default=None,
+                        help="recorded questions json (e.g. data.json) to load questions from on reset, offline")
+    parser.add_argument("--bank", action="store_true",
+                        help="serve questions from a memory mapped bank built from the questions json "
+                             "instead of loading them all to memory")
+    parser.add_argument("--users", type=str, default=USERS_JSON,
+                        help="users json file (e.g. a scratch file generated by bench.py)")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json",
+                        help="storage engine for users and questions")
+    parser.add_argument("--db", type=str, default=sqlite_store.SQLITE_DB, help="database file of the sqlite storage")
+    parser.add_argument("--import-json", action="store_true",
+                        help="import users and questions json files into the sqlite database and exit")
+    parser.add_argument("--export-json", action="store_true",
+                        help="export users and questions of the sqlite database to json files and exit")
+    parser.add_argument("--flush-interval", type=float, default=user_store.FLUSH_INTERVAL,
+                        help="max seconds user changes wait before being written to disk")
+    parser.add_argument("--flush-threshold", type=int, default=user_store.FLUSH_THRESHOLD,
+                        help="number of changed users that forces an early write to disk")
+    parser.add_argument("--engine", choices=["select", "asyncio"], default="select",
+                        help="event loop engine serving the clients")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of worker processes sharing the port (state is shared through sqlite)")
+    parser.add_argument("--log-level", choices=server_log.LEVELS, default="INFO",
+                        help="log level, DEBUG traces every message")
+    parser.add_argument("--log-json", action="store_true", help="log JSON lines instead of plain text")
+    parser.add_argument("--log-file", type=str, default=None, help="file to log to (default stdout)")
+    parser.add_argument("--trace-sample", type=int, default=1, metavar="N",
+                        help="with --log-level=DEBUG trace only one in N messages")
+    parser.add_argument("--max-connections", type=int, default=None,
+                        help="refuse connections beyond this number, 0 for no limit (default %d with the select "
+                             "engine, which can't serve more than about that, no limit with asyncio)"
+                             % SELECT_MAX_CONNECTIONS)
+    parser.add_argument("--login-timeout", type=float, default=60,
+                        help="seconds a client may stay connected without logging in, 0 for no limit")
+    parser.add_argument("--idle-timeout", type=float, default=900,
+                        help="seconds a logged user may stay connected without sending anything, 0 for no limit")
+    parser.add_argument("--keepalive-idle", type=int, default=60,
+                        help="seconds an idle connection waits before TCP keepalive probes, 0 disables keepalive")
+    parser.add_argument("--keepalive-interval", type=int, default=10, help="seconds between TCP keepalive probes")
+    parser.add_argument("--keepalive-count", type=int, default=5,
+                        help="unanswered TCP keepalive probes after which a connection is dropped")
+    parser.add_argument("--admin", action="append", default=[], metavar="USERNAME",
+                        help="user allowed to use admin commands (STATS), may be repeated")
+    parser.add_argument("--login-processes", type=int, default=None,
+                        help="processes verifying login passwords (default one per cpu), 0 verifies in the server "
+                             "process")
+    parser.add_argument("--max-pending-logins", type=int, default=passwords.MAX_PENDING,
+                        help="logins being verified at once, more logins get a busy error")
+    parser.add_argument("--round-seconds", type=float, default=ROUND_SECONDS,
+                        help="seconds players of a room have to answer the question of a round")
+    parser.add_argument("--round-pause", type=float, default=ROUND_PAUSE, help="seconds between the rounds of a room")
+    parser.add_argument("--handoff-socket", type=str, default=None, metavar="PATH",
+                        help="unix socket a new server process started with --takeover connects to for a hot restart")
+    parser.add_argument("--takeover", action="store_true",
+                        help="take over the listening socket, the clients and the sessions of the server listening on "
+                             "--handoff-socket (hot restart), then listen on it for the next restart")
+    parser.add_argument("--hash-passwords", action="store_true",
+                        help="hash the plaintext passwords of the users storage and exit (users logging in with a "
+                             "plaintext password are migrated anyway)")
     args = parser.parse_args()
+    if args.max_connections is None:
+        args.max_connections = SELECT_MAX_CONNECTIONS if args.engine == "select" else 0
+    if args.takeover and args.handoff_socket is None:
+        parser.error("--takeover needs --handoff-socket")
+    if args.handoff_socket is not None and (args.engine != "select" or args.workers > 1):
+        parser.error("--handoff-socket needs the select engine and a single process")
+    if args.takeover and args.reset:
+        parser.error("--takeover can't reset the users of the running server")
+
+    if args.import_json:
+        sqlite_store.import_users(args.db, args.users)
+        sqlite_store.import_questions(args.db, QUESTIONS_JSON)
+        return
+    if args.export_json:
+        sqlite_store.export_users(args.db, args.users)
+        sqlite_store.export_questions(args.db, QUESTIONS_JSON)
+        return
+    if args.hash_passwords:
+        hash_passwords(args)
+        return
+
+    setup_logging(args)
+    try:
+        start(args)
+    finally:
+        server_log.stop()
+
+
+def hash_passwords(args):
+    """
+    hash the plaintext passwords of the users of the storage
+    :param args: parsed command line arguments
+    :return:
+    """
+    if args.storage == "sqlite":
+        db_store = sqlite_store.SqliteStore(args.db)
+        stored_users = db_store.load()
+        for username in passwords.hash_plaintext(stored_users, args.login_processes or None):
+            db_store.update_password(username, stored_users[username]["password"])
+        db_store.close()
+    else:
+        stored_users = user_store.load_users(args.users)
+        passwords.hash_plaintext(stored_users, args.login_processes or None)
+        user_store.write_users_atomic(args.users, stored_users)
+        user_store.remove_journal(args.users)
+    return
+
 
-    server_ip = args.ip
-    server_port = args.port
-    question_to_load = args.questions
+def setup_logging(args):
+    server_log.setup(args.log_level, args.log_json, args.log_file, args.trace_sample)
 
-    print("Welcome to Trivia Server!")
+
+def start(args):
+    """
+    prepare the storage and questions as asked by the command line and serve clients
+    :param args: parsed command line arguments
+    :return:
+    """
+    logger.info("Welcome to Trivia Server!")
     if args.reset:
-        reset_users_json()
-        web_questions_loader.load(question_to_load)
-    server_socket = setup_socket(server_ip, server_port)
-    questions = load_from_json(QUESTIONS_JSON)
-    users = load_from_json(USERS_JSON)
+        if args.storage == "sqlite":
+            sqlite_store.reset(args.db, USERS_BACKUP_JSON)
+        else:
+            reset_users_json(args.users)
+        web_questions_loader.load(args.questions, args.questions_url, args.questions_fixture, QUESTIONS_JSON)
+        if args.storage == "sqlite":
+            sqlite_store.import_questions(args.db, QUESTIONS_JSON)
+    if args.storage == "sqlite" and sqlite_store.is_empty(args.db):  # first run, start from the json files
+        sqlite_store.import_users(args.db, args.users)
+        sqlite_store.import_questions(args.db, QUESTIONS_JSON)
+    if args.bank:
+        question_bank.build_bank_from_json(QUESTIONS_JSON, QUESTIONS_BANK)
+    signal.signal(signal.SIGTERM, stop_server)  # stop like on ctrl-c, so the users store is flushed
+    try:
+        if args.workers > 1:
+            run_workers(args)
+        else:
+            run_server(args)
+    except KeyboardInterrupt:
+        pass
+
+
+def load_questions(args):
+    """
+    load questions from the storage, or open the question bank
+    :param args: parsed command line arguments
+    :return:
+    """
+    global questions
+    global question_ids
+    question_frame.cache_clear()
+    if args.bank:
+        questions = question_bank.QuestionBank(QUESTIONS_BANK)
+        question_ids = questions.ids
+    elif args.storage == "sqlite":
+        questions = sqlite_store.load_questions(args.db)
+        question_ids = list(questions)
+    else:
+        questions = load_from_json(QUESTIONS_JSON)
+        question_ids = list(questions)
+    return
+
+
+def storage_db(args):
+    """
+    :return: the sqlite database holding users for this run (json storage with workers uses a temporary one)
+    """
+    return args.db if args.storage == "sqlite" else shared_state.SHARED_DB
+
+
+def run_server(args, worker_id=None):
+    """
+    load questions and users and serve clients until interrupted
+    :param args: parsed command line arguments
+    :param worker_id: number of the worker process, None when running as a single process
+    :return:
+    """
+    global users
+    global store
+    global shared
+    global verifier
+    global handoff_listener
+
+    global max_connections
+    global login_timeout
+    global idle_timeout
+    global keepalive
+    global round_seconds
+    global round_pause
+
+    admin_users.update(args.admin)
+    max_connections = args.max_connections
+    login_timeout = args.login_timeout
+    idle_timeout = args.idle_timeout
+    round_seconds = args.round_seconds
+    round_pause = args.round_pause
+    if args.keepalive_idle:
+        keepalive = (args.keepalive_idle, args.keepalive_interval, args.keepalive_count)
+    signal.signal(signal.SIGUSR1, dump_stats)
+    load_questions(args)
+    if worker_id is not None or args.storage == "sqlite":
+        store = sqlite_store.SqliteStore(storage_db(args))
+    else:
+        store = user_store.UserStore(args.users, args.flush_interval, args.flush_threshold)
+    if worker_id is not None:
+        shared = shared_state.SharedState(storage_db(args), worker_id)
+    if args.takeover:  # the questions are loaded, the users are loaded once the old process wrote them
+        conn = handoff.connect(args.handoff_socket)
+        socks, state = handoff.receive(conn)
+    users = store.load()
+    leaderboard.load(users)
+    verifier = passwords.Verifier(args.login_processes, args.max_pending_logins)
+    if args.takeover:
+        server_socket = restore_sessions(socks, state)
+        conn.sendall(handoff.ACK)
+        conn.close()
+        logger.info("Took over %d clients, listening for clients...", len(sessions))
+    if args.handoff_socket is not None:
+        handoff_listener = handoff.listen(args.handoff_socket)
+
+    reuse_port = worker_id is not None
+    handed_off = False
+    try:
+        if args.engine == "asyncio":
+            import async_server
+            async_server.run(sys.modules[__name__], args.ip, args.port, reuse_port)
+        else:
+            handed_off = serve(server_socket if args.takeover else setup_socket(args.ip, args.port, reuse_port))
+    finally:
+        verifier.close()
+        store.close()
+        if shared is not None:
+            shared.close()
+        if handoff_listener is not None:
+            handoff_listener.close()
+            if not handed_off:  # else the path is the new process' socket
+                os.unlink(args.handoff_socket)
+
+
+def stop_server(signum, frame):
+    raise KeyboardInterrupt
 
+
+def run_worker(args, worker_id):
+    """
+    worker process entry point. Workers leave SIGINT to the parent, which stops them with SIGTERM
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop_server)
+    setup_logging(args)  # the parent's log writer thread isn't forked
+    try:
+        run_server(args, worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server_log.stop()
+    return
+
+
+def run_workers(args):
+    """
+    serve clients with args.workers processes listening on the same port (SO_REUSEPORT), sharing users
+    through the sqlite storage. With json storage users are imported to a temporary database for the run
+    and written back to the users json at exit
+    :param args: parsed command line arguments
+    :return:
+    """
+    if args.storage == "json":
+        sqlite_store.import_users(shared_state.SHARED_DB, args.users)
+    shared_state.clear_sessions(storage_db(args))
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=run_worker, args=(args, worker_id), name="trivia-worker-%d" % worker_id)
+               for worker_id in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: [os.kill(worker.pid, signum) for worker in workers])
+    logger.info("Started %d workers", len(workers))
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+    finally:
+        if args.storage == "json":
+            sqlite_store.export_users(shared_state.SHARED_DB, args.users)
+    return
+
+
+def resume_sessions():
+    """
+    complete the verified logins and handle the messages their sessions received meanwhile
+    :return:
+    """
+    verifier.run_completed()
+    while resumed:
+        session = resumed.popleft()
+        if not session.paused:  # a later message may have paused it again
+            handle_messages(session, parse_messages(session))
+    return
+
+
+def snapshot():
+    """
+    :return: json serializable state of the sessions and rooms, handed to the new process of a hot restart.
+             Sessions are referred to by their index in the list (the order their sockets are passed in) and
+             times are relative to now
+    """
+    now = time.monotonic()
+    index = {session: i for i, session in enumerate(sessions.values())}
+    return {
+        "sessions": [{"peername": session.peername, "username": session.username, "protocol": session.protocol,
+                      "connected": now - session.connected_at, "idle": now - session.last_active,
+                      "unread": base64.b64encode(session.reader.unread()).decode(),
+                      "outbox": base64.b64encode(session.outbox.pending()).decode()}
+                     for session in sessions.values()],
+        "logged": [index[session] for session in logged_sessions.values()],
+        "rooms": [{"name": room.name, "round": room.round, "qid": room.qid, "answers": room.answers,
+                   "due": room.deadline - now, "players": [index[session] for session in room.players]}
+                  for room in rooms.values()],
+    }
+
+
+def restore_sessions(socks, state):
+    """
+    adopt the sockets, sessions and rooms handed off by the old process of a hot restart
+    :param socks: listening socket, then the client sockets in the order of the sessions of state
+    :param state: snapshot() of the old process
+    :return: the listening socket
+    """
+    now = time.monotonic()
+    adopted = []
+    for conn, saved in zip(socks[1:], state["sessions"]):
+        conn.setblocking(False)
+        session = Session(conn, conn.fileno(), tuple(saved["peername"]))
+        session.connected_at = now - saved["connected"]
+        session.last_active = now - saved["idle"]
+        session.set_protocol(saved["protocol"])
+        session.reader.feed(base64.b64decode(saved["unread"]))
+        session.outbox.append(base64.b64decode(saved["outbox"]))
+        if saved["username"] in users:
+            session.username = saved["username"]
+            session.user = users[session.username]
+        sessions[session.fd] = session
+        schedule_timeout(session)
+        adopted.append(session)
+    for i in state["logged"]:
+        if adopted[i].username is not None:
+            logged_sessions[adopted[i].username] = adopted[i]
+    for saved in state["rooms"]:
+        room = rooms[saved["name"]] = new_room(saved["name"])
+        room.round = saved["round"]
+        if saved["qid"] is not None and saved["qid"] in questions:  # else the question was removed, skip the round
+            room.qid = saved["qid"]
+            room.answers = saved["answers"]
+        room.deadline = now + saved["due"]
+        for i in saved["players"]:
+            room.players[adopted[i]] = None
+            adopted[i].room = room
+        timers.push(room.deadline, room)
+    return socks[0]
+
+
+def hand_off(server_socket):
+    """
+    hot restart: pass the listening socket, the client sockets and a snapshot() of the sessions to the new
+    server process connecting to the handoff socket. The logins being verified are completed and the users
+    are written first, so the new process loads every change. Connections stay open: what clients send
+    meanwhile waits in the sockets for the new process
+    :param server_socket: listening socket
+    :return: True if the new process took over (this one should exit), False if the handoff failed and this
+             process keeps serving
+    """
+    global users
+    try:
+        conn, address = handoff_listener.accept()
+    except BlockingIOError:
+        return False
+    conn.settimeout(handoff.TIMEOUT)
+    logger.info("Handing off %d clients to a new server process...", len(sessions))
+    deadline = time.monotonic() + handoff.TIMEOUT
+    while verifier.pending and time.monotonic() < deadline:  # the paused sessions must be resumed first
+        select.select([verifier], [], [], deadline - time.monotonic())
+        resume_sessions()
+    if verifier.pending:
+        logger.error("handoff failed: %d logins are still being verified", verifier.pending)
+        conn.close()
+        return False
+    send_messages([session.conn for session in sessions.values() if session.outbox])
+    store.flush()
+    try:
+        handoff.send(conn, [server_socket] + [session.conn for session in sessions.values()], snapshot())
+        took_over = conn.recv(1) == handoff.ACK
+    except OSError as e:
+        logger.error("handoff failed: %s", e)
+        took_over = False
+    finally:
+        conn.close()
+    if took_over:
+        logger.info("The new server process took over")
+        return True
+    logger.error("the new server process didn't take over, serving on")
+    users = store.load()
+    leaderboard.load(users)
+    question_pools.clear()
+    for session in logged_sessions.values():
+        session.user = users[session.username]
+    return False
+
+
+def serve(server_socket):
+    """
+    select loop serving clients until interrupted or handed off to a new process. select waits at most until the
+    soonest timer (session timeout or round)
+    :param server_socket: listening socket
+    :return: True if a new server process took over (see hand_off)
+    """
+    listeners = [server_socket, verifier] + ([handoff_listener] if handoff_listener is not None else [])
     while True:
-        ready_to_read, ready_to_write, in_error = select.select([server_socket] + client_sockets,
-                                                                client_sockets, [])
+        client_sockets = [session.conn for session in sessions.values() if not session.paused]
+        waiting_to_write = [session.conn for session in sessions.values() if session.outbox]
+        ready_to_read, ready_to_write, in_error = select.select(listeners + client_sockets,
+                                                                waiting_to_write, [],
+                                                                timers.timeout(time.monotonic()))
         for current_socket in ready_to_read:
             if current_socket is server_socket:  # connect to a new client
                 connect_to_client(current_socket)
-            else:  # read data from existing client
-                try:
-                    cmd, data = recv_message_and_parse(current_socket)
-                    handle_client_message(current_socket, cmd, data)
-                except ConnectionError:
-                    print("client ", current_socket.getpeername(), "forced disconnect")
-                    handle_logout_message(current_socket)
+                continue
+            if current_socket is verifier:  # logins were verified
+                resume_sessions()
+                continue
+            if current_socket is handoff_listener:  # a new server process takes over
+                if hand_off(server_socket):
+                    return True
+                continue
+            session = sessions.get(current_socket.fileno())
+            if session is None or session.paused:  # logged out (or paused) earlier in this loop iteration
+                continue
+            try:  # read data from existing client
+                handle_messages(session, recv_messages_and_parse(session))
+            except ConnectionError:
+                logger.info("client %s forced disconnect", session.peername)
+                handle_logout_message(session)
         send_messages(ready_to_write)
-        update_json(USERS_JSON, users)
+        run_timers(time.monotonic())
+        pushed.clear()  # sessions with pending messages are selected for writing anyway
+        store.commit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(message)s"
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
+logger = logging.getLogger("trivia")  # server events (connections, startup, errors)
+trace_logger = logging.getLogger("trivia.trace")  # per-message traces, logged at DEBUG level
+
+tracing = False  # True when per-message traces are enabled, checked before building a trace
+trace_sample = 1  # one in trace_sample messages is traced
+_trace_count = 0
+_listener = None  # logging.handlers.QueueListener writing the queued records
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    format records as JSON lines: time, level, logger, process and message (plus the exception if any)
+    """
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "process": record.processName, "msg": record.getMessage()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the exception of a record apart from its message: the traceback is formatted on the
+    calling thread (the record must not hold the frames) into exc_text, where the writer's formatter finds it
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_exception_formatter = logging.Formatter()
+
+
+def setup(level="INFO", json_lines=False, log_file=None, sample=1):
+    """
+    send the trivia loggers' records through a queue to a background thread that formats and writes them,
+    so logging never blocks the server loop on stdout / disk. Called again in a forked worker process,
+    where the parent's writer thread doesn't exist
+    :param level: one of LEVELS, DEBUG enables per-message traces
+    :param json_lines: write JSON lines instead of plain text
+    :param log_file: file to append to, None for stdout
+    :param sample: trace one in sample messages
+    :return:
+    """
+    global tracing
+    global trace_sample
+    global _listener
+    if _listener is not None:
+        stop()
+    if log_file is None:
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        handler = logging.FileHandler(log_file, encoding="utf-8")
+    handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(records))
+    logger.setLevel(level)
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    trace_sample = max(sample, 1)
+    tracing = logger.isEnabledFor(logging.DEBUG)
+    return
+
+
+def stop():
+    """
+    write the records still queued and stop the writer thread
+    :return:
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    return
+
+
+def sampled():
+    """
+    :return: True if the current message should be traced (one in trace_sample)
+    """
+    global _trace_count
+    _trace_count += 1
+    return _trace_count % trace_sample == 0
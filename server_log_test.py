@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+import server_log
+
+
+def check_log(json_lines, expected_output):
+	"""
+	log an error with an exception through the queued handler
+	:param expected_output: for JSON lines the keys of the entry and its message, else the lines written
+	"""
+	print("Input: ", json_lines, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			log_file = os.path.join(tmp, "server.log")
+			server_log.setup("INFO", json_lines, log_file)
+			try:
+				1 / 0
+			except ZeroDivisionError:
+				server_log.logger.exception("error handling %s", "LOGIN")
+			server_log.stop()
+			server_log.logger.handlers.clear()
+			with open(log_file, 'r', encoding='utf-8') as f:
+				lines = f.read().splitlines()
+		if json_lines:
+			entry = json.loads(lines[0])
+			output = (sorted(entry), entry["msg"], entry["exc"].splitlines()[-1], len(lines))
+		else:
+			output = [lines[0].split(" ", 4)[-1], lines[1], lines[-1]]
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	# The traceback is its own field of the JSON line, not part of the message
+	check_log(True, (["exc", "level", "logger", "msg", "process", "time"], "error handling LOGIN",
+	                 "ZeroDivisionError: division by zero", 1))
+	# Plain text: the traceback follows the message
+	check_log(False, ["error handling LOGIN", "Traceback (most recent call last):", "ZeroDivisionError: division by zero"])
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,359 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import chatlib
+import handoff
+import passwords
+import server
+import shared_state
+import sqlite_store
+import user_store
+from timers import TimerHeap
+
+
+class FakeConnection:
+	"""
+	socket stand-in: keeps what the server sends and whether it closed the connection
+	"""
+
+	def __init__(self):
+		self.sent = b""
+		self.closed = False
+
+	def send(self, data):
+		self.sent += bytes(data)
+		return len(data)
+
+	def close(self):
+		self.closed = True
+
+
+def setup_server(login_timeout, idle_timeout):
+	server.sessions.clear()
+	server.logged_sessions.clear()
+	server.resumed.clear()
+	server.timers = TimerHeap()
+	server.users = {"user1": {"password": "pass1", "score": 0, "questions_asked": set(), "questions_answered": set()}}
+	server.login_timeout = login_timeout
+	server.idle_timeout = idle_timeout
+
+
+def check_timeout(login_timeout, idle_timeout, login, elapsed, expected_output):
+	"""
+	:param login: log the client in right after it connected
+	:param elapsed: seconds since the client connected (and logged in) when the timers run
+	:param expected_output: True if the connection should be closed by then
+	"""
+	print("Input: ", login_timeout, idle_timeout, login, elapsed, "\nExpected output: ", expected_output)
+
+	try:
+		setup_server(login_timeout, idle_timeout)
+		conn = FakeConnection()
+		session = server.add_session(conn, 1, ("127.0.0.1", 0))
+		if login:
+			server.complete_login(session, "user1", chatlib.PROTOCOL_V1, True, None)
+		server.run_timers(session.last_active + elapsed)
+		output = conn.closed
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_questions_batches(question_size, count, requests, expected_output):
+	"""
+	:param question_size: length of the text of every question
+	:param expected_output: number of questions in the YOUR_QUESTIONS reply to every request (0 for NO_QUESTIONS)
+	"""
+	print("Input: ", question_size, count, requests, "\nExpected output: ", expected_output)
+
+	try:
+		setup_server(0, 0)
+		server.questions = {str(i): {"question": "q" * question_size, "answers": ["a", "b", "c", "d"], "correct": 1}
+		                    for i in range(3)}
+		server.question_ids = list(server.questions)
+		server.question_pools.clear()
+		server.store = user_store.UserStore(os.devnull)  # never loaded: mark_dirty() only records the username
+		session = server.add_session(FakeConnection(), 1, ("127.0.0.1", 0))
+		server.complete_login(session, "user1", chatlib.PROTOCOL_V1, True, None)
+		output = []
+		served = set()
+		for _ in range(requests):
+			session.outbox.clear()
+			server.handle_questions_message(session, str(count))
+			session.reader.feed(session.outbox.pending())
+			cmd, data = session.reader.read_message()
+			questions = chatlib.parse_questions(data) if cmd == chatlib.your_questions_msg else []
+			served.update(question[0] for question in questions)
+			output.append(len(questions))
+		if len(served) != sum(output):
+			output = "served twice: " + str(output)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_command(cmd, data, expected_output):
+	"""
+	send a command of a logged in user through the dispatcher
+	:param expected_output: command of the reply
+	"""
+	print("Input: ", cmd, data, "\nExpected output: ", expected_output)
+
+	try:
+		setup_server(0, 0)
+		server.questions = {"0": {"question": "q", "answers": ["a", "b", "c", "d"], "correct": 1}}
+		server.question_ids = list(server.questions)
+		server.question_pools.clear()
+		server.store = user_store.UserStore(os.devnull)
+		session = server.add_session(FakeConnection(), 1, ("127.0.0.1", 0))
+		server.complete_login(session, "user1", chatlib.PROTOCOL_V1, True, None)
+		session.outbox.clear()
+		server.handle_client_message(session, cmd, data)
+		session.reader.feed(session.outbox.pending())
+		reply, reply_data = session.reader.read_message()
+		output = reply if reply != chatlib.error_msg else reply + " " + reply_data
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def received(session):
+	"""
+	:return: list of cmd, data of the messages in the outbox of session (which is emptied)
+	"""
+	session.reader.feed(session.outbox.pending())
+	session.outbox.clear()
+	return [(cmd, chatlib.join_data(data) if data.__class__ is list else data) for cmd, data in session.reader]
+
+
+def check_room(choices, expected_output):
+	"""
+	user1 (protocol v1) and user2 (protocol v2) play a round of a room with one question, answer 2 is correct
+	:param choices: dict of username -> answer of the round
+	:param expected_output: messages pushed to each player (cmd, data), and their scores after the round
+	"""
+	print("Input: ", choices, "\nExpected output: ", expected_output)
+
+	try:
+		setup_server(0, 0)
+		server.users["user2"] = {"password": "pass2", "score": 0, "questions_asked": set(), "questions_answered": set()}
+		server.questions = {"0": {"question": "q", "answers": ["a", "b", "c", "d"], "correct": 2}}
+		server.question_ids = list(server.questions)
+		server.rooms.clear()
+		server.store = user_store.UserStore(os.devnull)
+		server.round_seconds, server.round_pause = 20, 5
+		players = []
+		for fd, (username, protocol) in enumerate([("user1", chatlib.PROTOCOL_V1), ("user2", chatlib.PROTOCOL_V2)]):
+			session = server.add_session(FakeConnection(), fd, ("127.0.0.1", fd))
+			server.complete_login(session, username, protocol, True, None)
+			server.handle_join_room_message(session, "room")
+			session.outbox.clear()
+			players.append(session)
+		start = time.monotonic()
+		server.run_timers(start + server.round_pause + 1)  # the first round opens
+		output = [received(session) for session in players]
+		for session in players:
+			if session.username in choices:
+				server.handle_round_answer_message(session, chatlib.build_answer(1, choices[session.username]))
+				received(session)
+		server.run_timers(start + server.round_pause + server.round_seconds + 2)  # and closes
+		output = [pushes + received(session) for pushes, session in zip(output, players)]
+		output.append([server.users[session.username]["score"] for session in players])
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_handoff(clients, max_fds, expected_output):
+	"""
+	hand the listening socket and the client sockets over a unix socket pair to a restarted server (the same
+	module with its state reset) the way hand_off / --takeover do, then check the adopted sessions.
+	user1 is logged in on the first client and plays in a room, each client has half a GET_QUESTION
+	message unread and a pending reply
+	:param clients: number of client connections
+	:param max_fds: file descriptors per SCM_RIGHTS message
+	:param expected_output: per adopted session: username, room, message completed by the rest of its bytes,
+	                        what its client reads from the adopted socket
+	"""
+	print("Input: ", clients, max_fds, "\nExpected output: ", expected_output)
+
+	peers = []
+	socks = []
+	saved_max_fds = handoff.MAX_FDS
+	try:
+		setup_server(0, 0)
+		server.rooms.clear()
+		server.questions = {"0": {"question": "q", "answers": ["a", "b", "c", "d"], "correct": 2}}
+		server.question_ids = list(server.questions)
+		listener = socket.create_server(("127.0.0.1", 0))
+		socks.append(listener)
+		get_question = chatlib.encode_message(chatlib.get_question_msg, "")
+		for i in range(clients):
+			conn, peer = socket.socketpair()
+			peers.append(peer)
+			socks.append(conn)
+			session = server.add_session(conn, conn.fileno(), ("127.0.0.1", i))
+			if i == 0:
+				server.complete_login(session, "user1", chatlib.PROTOCOL_V1, True, None)
+				server.handle_join_room_message(session, "room")
+				session.outbox.clear()
+			session.reader.feed(get_question[:10])
+			server.build_and_append_to_outbox(session, chatlib.your_score_msg, i)
+		state = json.loads(json.dumps(server.snapshot()))
+		handoff.MAX_FDS = max_fds
+		old_end, new_end = socket.socketpair()
+		sender = threading.Thread(target=handoff.send, args=(old_end, socks, state))
+		sender.start()
+		adopted, received_state = handoff.receive(new_end)
+		sender.join()
+		old_end.close()
+		new_end.close()
+		socks.extend(adopted)
+		setup_server(0, 0)  # the restarted server
+		server.rooms.clear()
+		if server.restore_sessions(adopted, received_state) is not adopted[0]:
+			raise AssertionError("listening socket not returned")
+		output = []
+		for session, peer in zip(server.sessions.values(), peers):
+			session.reader.feed(get_question[10:])
+			session.outbox.flush(session.conn)
+			peer.settimeout(1)
+			output.append((session.username, session.room.name if session.room is not None else None,
+			               session.reader.read_message(), peer.recv(100)))
+		if server.logged_sessions.get("user1") is not next(iter(server.sessions.values())):
+			output = "user1 not logged in after the handoff"
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+	finally:
+		handoff.MAX_FDS = saved_max_fds
+		for sock in socks + peers:
+			sock.close()
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_worker_login(other_score, local_score, expected_output):
+	"""
+	log user1 in to a worker after another worker changed it, change its score and log it out
+	:param other_score: score the other worker committed while user1 wasn't logged in here
+	:param local_score: score set while logged in here, not committed by the loop before the logout
+	:param expected_output: score seen at login, score the other worker reads after the logout
+	"""
+	print("Input: ", other_score, local_score, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name = os.path.join(tmp, "trivia.db")
+			db = sqlite_store.connect(db_name)
+			with db:
+				db.execute(sqlite_store.INSERT_USER, ("user1", "pass1", 0))
+			db.close()
+			setup_server(0, 0)
+			server.store = sqlite_store.SqliteStore(db_name)
+			server.shared = shared_state.SharedState(db_name, 1)
+			server.verifier = passwords.Verifier(0)
+			server.users = server.store.load()
+			other = sqlite_store.SqliteStore(db_name)
+			other.load()
+			try:
+				other.users["user1"]["score"] = other_score
+				other.mark_dirty("user1")
+				other.commit()
+				session = server.add_session(FakeConnection(), 1, ("127.0.0.1", 0))
+				server.handle_login_message(session, "user1#pass1")
+				server.verifier.run_completed()
+				output = [session.user["score"]]
+				session.user["score"] = local_score
+				server.store.mark_dirty("user1")
+				server.handle_logout_message(session)
+				other.refresh("user1")
+				output.append(other.users["user1"]["score"])
+			finally:
+				other.close()
+				server.verifier.close()
+				server.shared.close()
+				server.store.close()
+				server.shared = None
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	# TIMEOUTS
+	# Logged in client idle beyond the idle timeout, without a login timeout
+	check_timeout(0, 1, True, 2, True)
+	# Idle timeout shorter than the login timeout: checked at the idle deadline, not the login one
+	check_timeout(60, 1, True, 2, True)
+	# Logged in client within the idle timeout
+	check_timeout(0, 1, True, 0.5, False)
+	# Client that didn't log in within the login timeout
+	check_timeout(1, 0, False, 2, True)
+	# No timeouts
+	check_timeout(0, 0, True, 1000, False)
+
+	# GET_QUESTIONS
+	# All questions fit in one v1 message
+	check_questions_batches(10, 3, 2, [3, 0])
+	# The third question doesn't fit: it is served by the next request instead of being lost
+	check_questions_batches(4000, 3, 3, [2, 1, 0])
+
+	# VALIDATION
+	check_command(chatlib.send_answer_msg, "0#1", chatlib.correct_answer_msg)
+	check_command(chatlib.highscore_msg, "1", chatlib.all_score_msg)
+	# Digits int() doesn't read as a number are invalid input, not an internal error
+	check_command(chatlib.send_answer_msg, "0#\u00b2", "ERROR invalid input")
+	check_command(chatlib.highscore_msg, "\u00b2", "ERROR invalid input")
+	check_command(chatlib.get_questions_msg, "\u00b2", "ERROR invalid input")
+	check_command(chatlib.send_answers_msg, "0#\u00b2", "ERROR invalid input")
+	check_command(chatlib.round_answer_msg, "1#\u00b2", "ERROR invalid input")
+
+	# ROOMS
+	# The question and the result are pushed to every player, in its protocol. Correct answers score a point
+	pushes = [(chatlib.round_question_msg, "1#20#0#q#a#b#c#d"), (chatlib.round_result_msg, "1#2#1#2")]
+	check_room({"user1": 2, "user2": 3}, [pushes, pushes, [1, 0]])
+	# Players who don't answer aren't counted
+	pushes = [(chatlib.round_question_msg, "1#20#0#q#a#b#c#d"), (chatlib.round_result_msg, "1#2#1#1")]
+	check_room({"user2": 2}, [pushes, pushes, [0, 1]])
+
+	# HOT RESTART
+	logged = ("user1", "room", (chatlib.get_question_msg, ""), chatlib.encode_message(chatlib.your_score_msg, "0"))
+	check_handoff(1, handoff.MAX_FDS, [logged])
+	# More sockets than fit one SCM_RIGHTS message
+	check_handoff(3, 2, [logged] + [(None, None, (chatlib.get_question_msg, ""),
+	                                 chatlib.encode_message(chatlib.your_score_msg, str(i))) for i in (1, 2)])
+
+	# WORKERS
+	# The login sees the score another worker wrote, the logout writes the user before releasing it
+	check_worker_login(7, 9, [7, 9])
+
+
+if __name__ == '__main__':
+	main()
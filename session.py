@@ -0,0 +1,38 @@
+import time
+import chatlib
+from outbox import Outbox
+
+
+class Session:
+    """
+    State of one client connection: its socket and fd, the peer address (read once at accept, so it is
+    still known after the peer reset the connection), the logged in username and user record (None until
+    login), the outbox of pending replies, the reader of received bytes, the protocol version
+    negotiated at login, when (time.monotonic()) the client connected and last sent something, whether
+    its messages are paused while its login password is verified and the room it plays in (None if none)
+    """
+    __slots__ = ("conn", "fd", "peername", "username", "user", "outbox", "reader", "protocol", "connected_at",
+                 "last_active", "paused", "room")
+
+    def __init__(self, conn, fd, peername):
+        self.conn = conn
+        self.fd = fd
+        self.peername = peername
+        self.username = None
+        self.user = None
+        self.outbox = Outbox()
+        self.reader = chatlib.MessageReader(max_data_length=chatlib.MAX_DATA_LENGTH)  # client commands are small
+        self.protocol = chatlib.PROTOCOL_V1
+        self.connected_at = self.last_active = time.monotonic()
+        self.paused = False
+        self.room = None
+
+    def set_protocol(self, protocol):
+        """
+        switch both directions of the connection to protocol, from the next message on
+        """
+        self.protocol = protocol
+        self.reader.protocol = protocol
+
+    def __repr__(self):
+        return "Session(%s, %s)" % (self.peername, self.username)
@@ -0,0 +1,61 @@
+import sqlite3
+import sqlite_store
+
+SHARED_DB = "trivia_shared.db"  # database of a multi-process run with json storage (users are imported for the run)
+
+
+def clear_sessions(db_name):
+    """
+    forget the sessions of a previous run (workers that were killed can't remove their own)
+    :param db_name: storage database file name
+    :return:
+    """
+    db = sqlite_store.connect(db_name)
+    with db:
+        db.execute("DELETE FROM sessions")
+    db.close()
+    return
+
+
+class SharedState:
+    """
+    Logged in usernames of the worker processes of one server, kept in the sessions table of the storage
+    database (SQLite in WAL mode). A username is logged in to at most one worker at a time.
+    User records themselves are shared through sqlite_store.SqliteStore on the same database.
+    """
+
+    def __init__(self, db_name, worker_id):
+        self.worker_id = worker_id
+        self.db = sqlite_store.connect(db_name)
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE worker = ?", (worker_id,))
+
+    def close(self):
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE worker = ?", (self.worker_id,))
+        self.db.close()
+        return
+
+    def login(self, username):
+        """
+        mark username as logged in to this worker
+        :param username: username
+        :return: True if logged in, False if username is already logged in (to any worker)
+        """
+        try:
+            with self.db:
+                self.db.execute("INSERT INTO sessions (username, worker) VALUES (?, ?)", (username, self.worker_id))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def logout(self, username):
+        with self.db:
+            self.db.execute("DELETE FROM sessions WHERE username = ? AND worker = ?", (username, self.worker_id))
+        return
+
+    def logged_users(self):
+        """
+        :return: list of the usernames logged in to any worker
+        """
+        return [username for (username,) in self.db.execute("SELECT username FROM sessions ORDER BY rowid")]
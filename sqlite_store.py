@@ -0,0 +1,309 @@
+import json
+import sqlite3
+import user_store
+
+SQLITE_DB = "trivia.db"
+BUSY_TIMEOUT = 5.0  # seconds a connection waits for another process' write transaction
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    score INTEGER NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_seq ON users (seq);
+CREATE TABLE IF NOT EXISTS questions_asked (
+    username TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    PRIMARY KEY (username, qid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS questions_answered (
+    username TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    PRIMARY KEY (username, qid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS questions (
+    qid TEXT PRIMARY KEY,
+    question TEXT NOT NULL,
+    answers TEXT NOT NULL,
+    correct INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    username TEXT PRIMARY KEY,
+    worker INTEGER NOT NULL
+);
+"""
+# history field of a user record -> table holding its rows
+HISTORY_TABLES = {"questions_asked": "questions_asked", "questions_answered": "questions_answered"}
+# statements are constants so sqlite3's statement cache reuses their prepared form
+SELECT_USERS = "SELECT username, password, score, seq FROM users ORDER BY rowid"
+SELECT_USER = "SELECT username, password, score, seq FROM users WHERE username = ?"
+SELECT_HISTORY = {field: "SELECT username, qid FROM %s" % table for field, table in HISTORY_TABLES.items()}
+SELECT_USER_HISTORY = {field: "SELECT qid FROM %s WHERE username = ?" % table
+                       for field, table in HISTORY_TABLES.items()}
+INSERT_HISTORY = {field: "INSERT OR IGNORE INTO %s (username, qid) VALUES (?, ?)" % table
+                  for field, table in HISTORY_TABLES.items()}
+INSERT_USER = "INSERT INTO users (username, password, score) VALUES (?, ?, ?)"
+UPDATE_SCORE = "UPDATE users SET score = ?, seq = ? WHERE username = ?"
+UPDATE_PASSWORD = "UPDATE users SET password = ? WHERE username = ?"
+NEXT_SEQ = "SELECT COALESCE(MAX(seq), 0) + 1 FROM users"
+SELECT_CHANGED_SCORES = "SELECT username, score, seq FROM users WHERE seq > ?"
+INSERT_QUESTION = "INSERT INTO questions (qid, question, answers, correct) VALUES (?, ?, ?, ?)"
+
+
+def connect(db_name):
+    """
+    open a storage database in WAL mode (readers never block the single writer), creating its tables
+    :param db_name: database file name
+    :return: sqlite3 connection in autocommit mode (transactions are opened explicitly)
+    """
+    db = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+class HistorySet(set):
+    """
+    set of question ids that remembers the ids added since the last commit, so only those become new rows
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.added = []
+
+    def add(self, qid):
+        if qid not in self:
+            self.added.append(qid)
+            super().add(qid)
+
+
+def _import_users(db, users):
+    """
+    replace all users (and their history) with users, inside the caller's transaction
+    :param db: sqlite3 connection
+    :param users: users dictionary (stored or in-memory form)
+    :return:
+    """
+    db.execute("DELETE FROM sessions")
+    for table in HISTORY_TABLES.values():
+        db.execute("DELETE FROM " + table)
+    db.execute("DELETE FROM users")
+    db.executemany(INSERT_USER, [(username, record["password"], record["score"])
+                                 for username, record in users.items()])
+    for field in HISTORY_TABLES:
+        db.executemany(INSERT_HISTORY[field], [(username, qid) for username, record in users.items()
+                                               for qid in user_store.decode_history(record[field])])
+    return
+
+
+def import_users(db_name, users_json):
+    """
+    replace the users of the database with the users of users_json (and its journal)
+    :param db_name: database file name
+    :param users_json: users json file name
+    :return:
+    """
+    db = connect(db_name)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        _import_users(db, user_store.load_users(users_json))
+    db.close()
+    return
+
+
+def import_questions(db_name, questions_json):
+    """
+    replace the questions of the database with the questions of questions_json
+    :param db_name: database file name
+    :param questions_json: questions json file name
+    :return:
+    """
+    with open(questions_json, 'r', encoding='utf-8') as f:
+        questions = json.load(f)
+    db = connect(db_name)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("DELETE FROM questions")
+        db.executemany(INSERT_QUESTION, [(qid, value["question"], json.dumps(value["answers"], ensure_ascii=False),
+                                          value["correct"]) for qid, value in questions.items()])
+    db.close()
+    return
+
+
+def export_users(db_name, users_json):
+    """
+    write the users of the database to users_json (in the format user_store writes)
+    :param db_name: database file name
+    :param users_json: users json file name
+    :return:
+    """
+    store = SqliteStore(db_name)
+    users = store.load()
+    store.close()
+    user_store.write_users_atomic(users_json, {username: user_store.encode_user(record)
+                                               for username, record in users.items()})
+    user_store.remove_journal(users_json)
+    return
+
+
+def export_questions(db_name, questions_json):
+    """
+    write the questions of the database to questions_json
+    :param db_name: database file name
+    :param questions_json: questions json file name
+    :return:
+    """
+    questions = load_questions(db_name)
+    with open(questions_json, 'w', encoding='utf-8') as f:
+        json.dump(questions, f, ensure_ascii=False, indent=4)
+    return
+
+
+def load_questions(db_name):
+    """
+    :param db_name: database file name
+    :return: questions dictionary
+    """
+    db = connect(db_name)
+    questions = {qid: {"question": question, "answers": json.loads(answers), "correct": correct}
+                 for qid, question, answers, correct in
+                 db.execute("SELECT qid, question, answers, correct FROM questions ORDER BY rowid")}
+    db.close()
+    return questions
+
+
+def is_empty(db_name):
+    """
+    :return: True if the database has no users yet (it needs an import)
+    """
+    db = connect(db_name)
+    (count,) = db.execute("SELECT COUNT(*) FROM users").fetchone()
+    db.close()
+    return count == 0
+
+
+def reset(db_name, backup_json):
+    """
+    reset users to the ones in backup_json: the history tables are emptied and the users replaced
+    in a single transaction
+    :param db_name: database file name
+    :param backup_json: users json to reset to
+    :return:
+    """
+    db = connect(db_name)
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        _import_users(db, user_store.load_users(backup_json))
+    db.close()
+    return
+
+
+class SqliteStore:
+    """
+    Users storage backed by a SQLite database (see SCHEMA).
+    Users are loaded to the same in-memory form user_store.UserStore uses; question history sets are
+    HistorySets so commit() - called once per loop iteration - writes the changed users' scores and
+    only their new history rows, all in one transaction. Several processes may share one database:
+    every score update carries an increasing seq so sync_leaderboard() only reads the changed scores.
+    """
+
+    def __init__(self, db_name):
+        self.db = connect(db_name)
+        self.users = {}
+        self._dirty = set()
+        self._passwords = {}  # username -> changed stored password, written by the next commit()
+        self._seq = 0  # highest users.seq seen
+
+    def _record(self, password, score, seq):
+        self._seq = max(self._seq, seq)
+        return {"password": password, "score": score,
+                "questions_asked": HistorySet(), "questions_answered": HistorySet()}
+
+    def load(self):
+        """
+        :return: users dictionary of every user in the database
+        """
+        users = {username: self._record(password, score, seq)
+                 for username, password, score, seq in self.db.execute(SELECT_USERS)}
+        for field in HISTORY_TABLES:
+            for username, qid in self.db.execute(SELECT_HISTORY[field]):
+                set.add(users[username][field], qid)
+        self.users = users
+        return users
+
+    def refresh(self, username):
+        """
+        reload the record of username, which another process may have changed since it was loaded
+        :param username: username
+        :return:
+        """
+        row = self.db.execute(SELECT_USER, (username,)).fetchone()
+        if row is None:
+            return
+        record = self._record(*row[1:])
+        record["password"] = self._passwords.get(username, record["password"])  # a rehash not committed yet
+        for field in HISTORY_TABLES:
+            set.update(record[field], (qid for (qid,) in self.db.execute(SELECT_USER_HISTORY[field], (username,))))
+        self.users[username] = record
+        return
+
+    def mark_dirty(self, username):
+        self._dirty.add(username)
+
+    def update_password(self, username, password):
+        """
+        :param password: new stored form of the user's password (passwords.hash_password)
+        """
+        self.users[username]["password"] = password
+        self._passwords[username] = password
+
+    def commit(self):
+        """
+        write the dirty users (and changed passwords) in one transaction. Cheap when nothing changed.
+        :return:
+        """
+        if not self._dirty and not self._passwords:
+            return
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            if self._passwords:
+                self.db.executemany(UPDATE_PASSWORD, [(password, username)
+                                                      for username, password in self._passwords.items()])
+                self._passwords.clear()
+            (seq,) = self.db.execute(NEXT_SEQ).fetchone()
+            records = [(username, self.users[username]) for username in self._dirty if username in self.users]
+            self.db.executemany(UPDATE_SCORE, [(record["score"], seq, username) for username, record in records])
+            for field in HISTORY_TABLES:
+                rows = [(username, qid) for username, record in records for qid in record[field].added]
+                if rows:
+                    self.db.executemany(INSERT_HISTORY[field], rows)
+        for username, record in records:
+            for field in HISTORY_TABLES:
+                record[field].added.clear()
+        self._dirty.clear()
+        return
+
+    def sync_leaderboard(self, leaderboard):
+        """
+        apply the scores other processes changed since the last sync to leaderboard
+        :param leaderboard: leaderboard.Leaderboard
+        :return:
+        """
+        for username, score, seq in self.db.execute(SELECT_CHANGED_SCORES, (self._seq,)):
+            leaderboard.set_score(username, score)
+            self._seq = max(self._seq, seq)
+        return
+
+    def flush(self):
+        """
+        write every change, so another process may load the users (same as commit(), see UserStore.flush)
+        """
+        self.commit()
+        return
+
+    def close(self):
+        self.commit()
+        self.db.close()
+        return
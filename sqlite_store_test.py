@@ -0,0 +1,230 @@
+import json
+import os
+import tempfile
+import sqlite_store
+import user_store
+from leaderboard import Leaderboard
+
+USERS = {"user1": {"password": "pass1", "score": 0, "questions_asked": ["1"], "questions_answered": []},
+         "user2": {"password": "pass2", "score": 5, "questions_asked": [], "questions_answered": []}}
+
+
+def setup_db(tmp):
+	"""
+	:return: name of a database holding USERS, name of the users json it was imported from
+	"""
+	users_json = os.path.join(tmp, "users.json")
+	with open(users_json, 'w', encoding='utf-8') as f:
+		json.dump(USERS, f)
+	db_name = os.path.join(tmp, "trivia.db")
+	sqlite_store.import_users(db_name, users_json)
+	return db_name, users_json
+
+
+def user_state(record):
+	return record["score"], sorted(record["questions_asked"]), sorted(record["questions_answered"])
+
+
+def db_rows(db_name):
+	"""
+	:return: rows of the history tables, (username, qid) sorted
+	"""
+	db = sqlite_store.connect(db_name)
+	rows = {table: sorted(db.execute("SELECT username, qid FROM " + table).fetchall())
+	        for table in sqlite_store.HISTORY_TABLES.values()}
+	db.close()
+	return rows
+
+
+def check_commit(changes, expected_output):
+	"""
+	change user1 through a SqliteStore, one commit per change
+	:param changes: list of (score, asked qids, answered qids)
+	:param expected_output: user1 as another store loads it, history rows, pending history ids after the commits
+	"""
+	print("Input: ", changes, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name, users_json = setup_db(tmp)
+			store = sqlite_store.SqliteStore(db_name)
+			users = store.load()
+			for score, asked, answered in changes:
+				users["user1"]["score"] = score
+				for qid in asked:
+					users["user1"]["questions_asked"].add(qid)
+				for qid in answered:
+					users["user1"]["questions_answered"].add(qid)
+				store.mark_dirty("user1")
+				store.commit()
+			other = sqlite_store.SqliteStore(db_name)
+			output = (user_state(other.load()["user1"]), db_rows(db_name),
+			          [users["user1"][field].added for field in sqlite_store.HISTORY_TABLES])
+			other.close()
+			store.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_refresh(username, expected_output):
+	"""
+	refresh username in a store after another store changed user1
+	:param expected_output: the record of username after the refresh (None if the store has none)
+	"""
+	print("Input: ", username, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name, users_json = setup_db(tmp)
+			store = sqlite_store.SqliteStore(db_name)
+			store.load()
+			other = sqlite_store.SqliteStore(db_name)
+			other_users = other.load()
+			other_users["user1"]["score"] = 3
+			other_users["user1"]["questions_answered"].add("1")
+			other.mark_dirty("user1")
+			other.commit()
+			store.refresh(username)
+			output = user_state(store.users[username]) if username in store.users else None
+			other.close()
+			store.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_sync(commits, expected_output):
+	"""
+	commit scores through another store, syncing a leaderboard after each commit
+	:param commits: list of dicts of username -> score, committed at once
+	:param expected_output: list of the payloads of the leaderboard after each sync
+	"""
+	print("Input: ", commits, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name, users_json = setup_db(tmp)
+			store = sqlite_store.SqliteStore(db_name)
+			leaderboard = Leaderboard()
+			leaderboard.load(store.load())
+			other = sqlite_store.SqliteStore(db_name)
+			other_users = other.load()
+			output = []
+			for scores in commits:
+				for username, score in scores.items():
+					other_users[username]["score"] = score
+					other.mark_dirty(username)
+				other.commit()
+				leaderboard.set_score("user1", -1)  # a score only a sync of every changed score overwrites
+				store.sync_leaderboard(leaderboard)
+				output.append(leaderboard.payload())
+			other.close()
+			store.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_reset(expected_output):
+	"""
+	reset a database to its users json after changing user1
+	:param expected_output: user1 as loaded after the reset, history rows
+	"""
+	print("Expected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name, users_json = setup_db(tmp)
+			store = sqlite_store.SqliteStore(db_name)
+			users = store.load()
+			users["user1"]["score"] = 7
+			users["user1"]["questions_asked"].add("2")
+			store.mark_dirty("user1")
+			store.close()
+			sqlite_store.reset(db_name, users_json)
+			store = sqlite_store.SqliteStore(db_name)
+			output = (user_state(store.load()["user1"]), db_rows(db_name))
+			store.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_export(expected_output):
+	"""
+	import USERS to a database and export them back to a users json
+	:param expected_output: True if the exported users decode to the imported ones
+	"""
+	print("Expected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			db_name, users_json = setup_db(tmp)
+			exported_json = os.path.join(tmp, "exported.json")
+			sqlite_store.export_users(db_name, exported_json)
+			exported = {username: user_store.decode_user(record)
+			            for username, record in user_store.load_users(exported_json).items()}
+			imported = {username: user_store.decode_user(dict(record)) for username, record in USERS.items()}
+			output = exported == imported and not os.path.exists(user_store.journal_name(exported_json))
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	loaded_rows = {"questions_asked": [("user1", "1")], "questions_answered": []}
+
+	# COMMIT
+	# Only the ids added since the last commit become rows, a re-added id is ignored
+	check_commit([(1, ["2"], ["2"]), (2, ["3", "2"], [])],
+	             ((2, ["1", "2", "3"], ["2"]),
+	              {"questions_asked": [("user1", "1"), ("user1", "2"), ("user1", "3")],
+	               "questions_answered": [("user1", "2")]},
+	              [[], []]))
+	# Asked ids loaded from the database aren't written again
+	check_commit([(1, ["1"], [])], ((1, ["1"], []), loaded_rows, [[], []]))
+
+	# REFRESH
+	check_refresh("user1", (3, ["1"], ["1"]))
+	# Users changed by nobody else stay as they are, unknown users are ignored
+	check_refresh("user2", (5, [], []))
+	check_refresh("user3", None)
+
+	# SYNC LEADERBOARD
+	# Every sync applies the scores committed since the previous one, and only those
+	check_sync([{"user2": 9}, {"user1": 4}],
+	           ["user2: 9\nuser1: -1\n", "user2: 9\nuser1: 4\n"])
+	check_sync([{"user1": 4, "user2": 1}, {}],
+	           ["user1: 4\nuser2: 1\n", "user2: 1\nuser1: -1\n"])
+
+	# RESET
+	check_reset(((0, ["1"], []), loaded_rows))
+
+	# IMPORT / EXPORT
+	check_export(True)
+
+
+if __name__ == '__main__':
+	main()
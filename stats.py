@@ -0,0 +1,67 @@
+import bisect
+
+# upper bounds (seconds) of the latency histogram buckets, a last bucket counts everything slower
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class CommandStats:
+    """
+    call / error counters and a fixed-bucket latency histogram of one command
+    """
+    __slots__ = ("calls", "errors", "total", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0  # seconds spent in the handler
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def percentile(self, fraction):
+        """
+        :param fraction: 0..1
+        :return: upper bound (seconds) of the bucket holding the given percentile, None if it's the overflow bucket
+        """
+        rank = fraction * self.calls
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+        return None
+
+
+class Stats:
+    """
+    CommandStats of every dispatched command
+    """
+
+    def __init__(self):
+        self.commands = {}
+
+    def record(self, cmd, elapsed, failed=False):
+        command_stats = self.commands.get(cmd)
+        if command_stats is None:
+            command_stats = self.commands[cmd] = CommandStats()
+        command_stats.record(elapsed, failed)
+
+    def report(self):
+        """
+        :return: one line per command, busiest (total handler time) first:
+                 cmd calls errors total_ms avg_us p50_us p99_us (percentiles are bucket upper bounds)
+        """
+        def us(seconds):
+            return ">%d" % (LATENCY_BUCKETS[-1] * 1e6) if seconds is None else "%d" % (seconds * 1e6)
+
+        lines = ["%-16s %8s %7s %10s %8s %8s %8s" % ("cmd", "calls", "errors", "total_ms", "avg_us", "p50_us",
+                                                      "p99_us")]
+        for cmd, s in sorted(self.commands.items(), key=lambda item: item[1].total, reverse=True):
+            lines.append("%-16s %8d %7d %10.1f %8.1f %8s %8s" % (cmd, s.calls, s.errors, s.total * 1e3,
+                                                                 s.total * 1e6 / s.calls, us(s.percentile(0.5)),
+                                                                 us(s.percentile(0.99))))
+        return "\n".join(lines)
@@ -0,0 +1,47 @@
+import heapq
+import itertools
+
+
+class TimerHeap:
+    """
+    Deadlines (time.monotonic() seconds) of items in a heap, soonest first.
+    Entries are never updated nor removed: the owner of an expired item checks whether its deadline really
+    passed and pushes it again with the new deadline if not (e.g. a session that was active meanwhile).
+    So activity costs nothing and an item costs O(log n) once per timeout.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()  # ties are broken by push order, items are never compared
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, deadline, item):
+        heapq.heappush(self._heap, (deadline, next(self._counter), item))
+
+    def next_deadline(self):
+        """
+        :return: the soonest deadline, None if the heap is empty
+        """
+        return self._heap[0][0] if self._heap else None
+
+    def timeout(self, now):
+        """
+        :param now: current time.monotonic()
+        :return: seconds until the soonest deadline (0 if it passed), None if the heap is empty -
+                 ready to be used as a select / sleep timeout
+        """
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - now, 0)
+
+    def pop_expired(self, now):
+        """
+        :param now: current time.monotonic()
+        :return: list of the items whose deadline passed, removed from the heap
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expired.append(heapq.heappop(self._heap)[2])
+        return expired
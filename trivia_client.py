@@ -0,0 +1,620 @@
+import asyncio
+import collections
+import logging
+import socket
+import time
+import chatlib
+
+RETRIES = 5  # reconnect (and busy login) attempts before giving up
+BACKOFF = 0.1  # seconds before the first reconnect attempt, doubled after every failed attempt
+MAX_BACKOFF = 5.0  # max seconds between reconnect attempts
+BUSY_REPLY = (chatlib.error_msg, "server busy")  # reply to a login while the server verifies too many, retried
+
+logger = logging.getLogger(__name__)
+
+
+class TriviaError(Exception):
+    """
+    the server replied with an ERROR (or with an unexpected command) to a request
+    """
+
+
+def backoff_delays(retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+    """
+    :return: generator of the seconds to wait before every reconnect attempt (exponential backoff)
+    """
+    for attempt in range(retries):
+        yield min(backoff * 2 ** attempt, max_backoff)
+
+
+def text(data):
+    """
+    :param data: message data of any protocol version
+    :return: data as a string (the fields of a v2 message are joined)
+    """
+    return data if data.__class__ is str else chatlib.join_data(data)
+
+
+def expect(reply, *cmds):
+    """
+    check a reply is one of cmds
+    :param reply: cmd, data
+    :return: reply
+    :raise TriviaError: the reply is an error or another command
+    """
+    cmd, data = reply
+    if cmd == chatlib.error_msg:
+        raise TriviaError(text(data))
+    if cmd not in cmds:
+        raise TriviaError("unexpected reply: %s %s" % (cmd, text(data) if data is not None else ""))
+    return reply
+
+
+def parse_answer_result(reply):
+    """
+    :param reply: CORRECT_ANSWER / WRONG_ANSWER reply
+    :return: True, None if correct. False and the correct answer (int) if not
+    """
+    cmd, data = expect(reply, chatlib.correct_answer_msg, chatlib.wrong_answer_msg)
+    if cmd == chatlib.correct_answer_msg:
+        return True, None
+    return False, int(text(data))
+
+
+def highscore_data(count, offset):
+    """
+    :return: data of a HIGHSCORE request: "" for the whole ranking, "count" or "offset#count"
+    :raise ValueError: offset without count
+    """
+    if offset is None:
+        return "" if count is None else str(count)
+    if count is None:
+        raise ValueError("highscore offset requires a count")
+    return chatlib.join_data([str(offset), str(count)])
+
+
+class _Connection:
+    """
+    protocol state of one connection shared by the sync and async clients: the reader of received bytes,
+    the negotiated protocol and the FIFO of requests waiting for their reply
+    """
+
+    def __init__(self, protocol):
+        self.requested_protocol = protocol
+        self.protocol = chatlib.PROTOCOL_V1  # until a login negotiates v2
+        self.reader = chatlib.MessageReader()
+        self.pending = collections.deque()  # (cmd, data, ...) of the requests sent, oldest first
+
+    def encode(self, cmd, data):
+        if self.protocol == chatlib.PROTOCOL_V2:
+            return chatlib.encode_frame(cmd, chatlib.data_fields(data))
+        return chatlib.encode_message(cmd, data)
+
+    def login_data(self, username, password):
+        return chatlib.build_login_data(username, password, self.requested_protocol)
+
+    def falls_back(self, reply):
+        """
+        :param reply: reply to a login request
+        :return: True if the server doesn't speak the requested protocol (it rejects the login data as invalid
+                 input), the login is then repeated as v1
+        """
+        if self.requested_protocol == chatlib.PROTOCOL_V1 or reply != (chatlib.error_msg, "invalid input"):
+            return False
+        self.requested_protocol = chatlib.PROTOCOL_V1
+        return True
+
+    def on_reply(self, cmd, reply):
+        """
+        called with every reply, before the next one is parsed: switches to the protocol a login negotiated
+        :param cmd: command of the request the reply answers
+        """
+        if cmd == chatlib.login_msg and reply[0] == chatlib.login_ok_msg and reply[1] == str(chatlib.PROTOCOL_V2):
+            self.protocol = chatlib.PROTOCOL_V2
+            self.reader.protocol = chatlib.PROTOCOL_V2
+        return
+
+
+class TriviaClient:
+    """
+    Blocking client of a trivia server over one persistent connection.
+    Requests may be pipelined: send() queues requests without waiting and receive() returns their replies
+    in the same (FIFO) order. Messages the server pushes (the rounds of a room) are kept apart in pushes,
+    next_push() waits for them. When the connection is lost the client reconnects with exponential backoff,
+    logs in again (and joins its room again) and resends the requests that weren't answered, so callers only
+    see a ConnectionError once every attempt failed.
+    """
+
+    def __init__(self, server_ip="127.0.0.1", server_port=5678, protocol=chatlib.PROTOCOL_V2, timeout=None,
+                 retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+        """
+        :param protocol: highest protocol version to negotiate at login
+        :param timeout: seconds to wait for the server before treating the connection as lost, None to wait forever
+        """
+        self.address = (server_ip, server_port)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._protocol = protocol
+        self._credentials = None  # username, password to log in again with after a reconnect
+        self._room = None  # room to join again after a reconnect
+        self._sock = None
+        self._conn = None
+        self.pushes = collections.deque()  # cmd, data of the messages the server pushed, oldest first
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def protocol(self):
+        return self._conn.protocol if self._conn is not None else chatlib.PROTOCOL_V1
+
+    def connect(self):
+        self.close()
+        self._sock = socket.create_connection(self.address, self.timeout)
+        self._conn = _Connection(self._protocol)
+        return
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._conn = None
+        return
+
+    def _recover(self):
+        """
+        reconnect with backoff, log in again and resend the unanswered requests. An unanswered LOGIN isn't
+        resent (the server would refuse it as already logged in): it is answered with the reply of the new login
+        :raise ConnectionError: every attempt failed
+        """
+        pending = list(self._conn.pending) if self._conn is not None else []
+        login_reply = None
+        for delay in backoff_delays(self.retries, self.backoff, self.max_backoff):
+            time.sleep(delay)
+            try:
+                self.connect()
+                if self._credentials is not None:
+                    login_reply = self._login()
+                if self._room is not None:
+                    expect(self.request(chatlib.join_room_msg, self._room), chatlib.room_joined_msg)
+                break
+            except (OSError, TriviaError):  # server down, or the old session isn't closed yet
+                continue
+        else:
+            self.close()
+            raise ConnectionError("lost connection to %s:%d" % self.address)
+        for request in pending:
+            if request[0] == chatlib.login_msg and login_reply is not None:
+                self._conn.pending.append((request[0], request[1], login_reply))  # answered already, see receive()
+            else:
+                self.send(*request)
+        return
+
+    def send(self, cmd, data=""):
+        """
+        send a request without waiting for its reply (see receive())
+        """
+        if self._conn is None:
+            self.connect()
+        self._conn.pending.append((cmd, data))
+        try:
+            self._sock.sendall(self._conn.encode(cmd, data))
+        except OSError:  # the request stays pending and is resent
+            self._recover()
+        return
+
+    def _read(self):
+        """
+        :return: cmd, data of the next message from the server, None after a reconnect
+        """
+        while True:
+            message = self._conn.reader.read_message()
+            if message is not None:
+                return message
+            try:
+                if self._conn.reader.recv_from(self._sock) == 0:  # server closed the connection
+                    raise ConnectionResetError
+            except OSError:
+                self._recover()
+                return None
+
+    def receive(self):
+        """
+        :return: cmd, data of the reply to the oldest request waiting for one. data is a str for protocol v1
+                 and a list of fields for v2
+        """
+        while True:
+            if self._conn.pending and len(self._conn.pending[0]) == 3:  # a LOGIN answered by _recover()
+                return self._conn.pending.popleft()[2]
+            reply = self._read()
+            if reply is None:
+                continue
+            if reply[0] in chatlib.PUSH_COMMANDS:
+                self.pushes.append(reply)
+                continue
+            if not self._conn.pending:
+                logger.warning("dropping a reply to no request: %s", reply)
+                continue
+            cmd = self._conn.pending.popleft()[0]
+            self._conn.on_reply(cmd, reply)
+            return reply
+
+    def next_push(self):
+        """
+        wait for a message pushed by the server. Call it when no request is waiting for its reply
+        :return: cmd, data of the oldest pushed message (ROUND_QUESTION or ROUND_RESULT)
+        """
+        while not self.pushes:
+            message = self._read()
+            if message is None:
+                continue
+            if message[0] not in chatlib.PUSH_COMMANDS:
+                raise TriviaError("unexpected message: %s" % message[0])
+            self.pushes.append(message)
+        return self.pushes.popleft()
+
+    def request(self, cmd, data=""):
+        self.send(cmd, data)
+        return self.receive()
+
+    def pipeline(self, requests):
+        """
+        send several requests at once, then wait for all their replies
+        :param requests: list of (cmd, data)
+        :return: list of (cmd, data) replies, in order
+        """
+        for cmd, data in requests:
+            self.send(cmd, data)
+        return [self.receive() for _ in requests]
+
+    def _login_request(self):
+        reply = self.request(chatlib.login_msg, self._conn.login_data(*self._credentials))
+        if self._conn.falls_back(reply):
+            self._protocol = chatlib.PROTOCOL_V1
+            reply = self.request(chatlib.login_msg, self._conn.login_data(*self._credentials))
+        return reply
+
+    def _login(self):
+        reply = self._login_request()
+        for delay in backoff_delays(self.retries, self.backoff, self.max_backoff):
+            if reply != BUSY_REPLY:
+                break
+            time.sleep(delay)
+            reply = self._login_request()
+        return expect(reply, chatlib.login_ok_msg)
+
+    def login(self, username, password):
+        """
+        :raise TriviaError: the server refused the login
+        """
+        self._credentials = (username, password)
+        if self._conn is None:
+            self.connect()
+        try:
+            self._login()
+        except TriviaError:
+            self._credentials = None
+            raise
+        return
+
+    def logout(self):
+        if self._conn is not None:
+            try:
+                self._sock.sendall(self._conn.encode(chatlib.logout_msg, ""))
+            except OSError:
+                pass
+        self._credentials = None
+        self._room = None
+        self.close()
+        return
+
+    def join_room(self, name):
+        """
+        join a room (leaving the current one): its rounds are pushed from now on (see next_push()), the
+        rounds still kept of the previous room are dropped
+        :return: number of players in the room
+        """
+        cmd, data = expect(self.request(chatlib.join_room_msg, name), chatlib.room_joined_msg)
+        self._room = name
+        self.pushes.clear()  # rounds of the room left
+        return int(chatlib.data_fields(data)[1])
+
+    def leave_room(self):
+        expect(self.request(chatlib.leave_room_msg), chatlib.room_left_msg)
+        self._room = None
+        self.pushes.clear()
+        return
+
+    def round_answer(self, round_number, choice):
+        """
+        answer the question of an open round, the result is pushed when the round closes
+        :raise TriviaError: the round is closed or was answered already
+        """
+        expect(self.request(chatlib.round_answer_msg, chatlib.build_answer(round_number, choice)),
+               chatlib.answer_received_msg)
+        return
+
+    def get_question(self):
+        """
+        :return: question fields [qid, question, answer1, ..., answer4], None if no questions are left
+        """
+        cmd, data = expect(self.request(chatlib.get_question_msg), chatlib.your_question_msg,
+                           chatlib.no_questions_msg)
+        return None if cmd == chatlib.no_questions_msg else chatlib.parse_question(data)
+
+    def get_questions(self, count):
+        """
+        :return: list of up to count question fields lists, empty if no questions are left
+        """
+        cmd, data = expect(self.request(chatlib.get_questions_msg, str(count)), chatlib.your_questions_msg,
+                           chatlib.no_questions_msg)
+        return [] if cmd == chatlib.no_questions_msg else chatlib.parse_questions(data)
+
+    def send_answer(self, qid, choice):
+        """
+        :return: True, None if correct. False and the correct answer (int) if not
+        """
+        return parse_answer_result(self.request(chatlib.send_answer_msg, chatlib.build_answer(qid, choice)))
+
+    def send_answers(self, answers):
+        """
+        :param answers: list of (qid, choice)
+        :return: list of [result cmd, result data] in the order of answers
+        """
+        cmd, data = expect(self.request(chatlib.send_answers_msg, chatlib.build_answers(answers)),
+                           chatlib.answers_result_msg)
+        return chatlib.parse_answers_result(data)
+
+    def my_score(self):
+        return int(text(expect(self.request(chatlib.my_score_msg), chatlib.your_score_msg)[1]))
+
+    def highscore(self, count=None, offset=None):
+        """
+        :return: "user: score" lines of the ranking (count users from offset, or all)
+        :raise ValueError: offset without count (the server reads a single field as a count)
+        """
+        reply = self.request(chatlib.highscore_msg, highscore_data(count, offset))
+        return text(expect(reply, chatlib.all_score_msg)[1])
+
+    def logged_users(self):
+        users = text(expect(self.request(chatlib.logged_msg), chatlib.logged_answer_msg)[1])
+        return users.split(", ") if users else []
+
+
+class AsyncTriviaClient:
+    """
+    asyncio client of a trivia server, with the same API as TriviaClient (coroutines).
+    Concurrent requests are pipelined on the connection: each waits on a future the reader task resolves
+    with the reply of the oldest pending request. After a lost connection the reader task reconnects with
+    backoff, logs in again and resends the unanswered requests; new requests wait until it is done.
+    Pushed messages (the rounds of a room) are put in the pushes queue, next_push() waits for them.
+    Don't send requests concurrently with login(): they'd be encoded before the protocol is negotiated.
+    """
+
+    def __init__(self, server_ip="127.0.0.1", server_port=5678, protocol=chatlib.PROTOCOL_V2,
+                 retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+        self.address = (server_ip, server_port)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._protocol = protocol
+        self._credentials = None
+        self._room = None
+        self._writer = None
+        self._conn = None
+        self._reader_task = None
+        self._ready = asyncio.Event()  # set while requests may be sent (cleared while recovering)
+        self.pushes = asyncio.Queue()  # cmd, data of the messages the server pushed
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def protocol(self):
+        return self._conn.protocol if self._conn is not None else chatlib.PROTOCOL_V1
+
+    async def connect(self):
+        await self.close()
+        stream_reader, self._writer = await asyncio.open_connection(*self.address)
+        self._conn = _Connection(self._protocol)
+        self._reader_task = asyncio.create_task(self._read_replies(stream_reader, self._conn))
+        self._ready.set()
+        return
+
+    async def close(self):
+        if self._reader_task is not None and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._conn = None
+        return
+
+    async def _read_replies(self, stream_reader, conn):
+        """
+        reader task of one connection: resolve the futures of the pending requests with their replies
+        """
+        try:
+            while True:
+                received = await stream_reader.read(chatlib.READER_BUFFER_SIZE)
+                if not received:
+                    raise ConnectionResetError
+                conn.reader.feed(received)
+                for reply in conn.reader:
+                    if reply[0] in chatlib.PUSH_COMMANDS:
+                        self.pushes.put_nowait(reply)
+                        continue
+                    if not conn.pending:
+                        logger.warning("dropping a reply to no request: %s", reply)
+                        continue
+                    cmd, data, future = conn.pending.popleft()
+                    conn.on_reply(cmd, reply)
+                    if not future.done():
+                        future.set_result(reply)
+        except OSError:
+            if conn is self._conn:
+                await self._recover()
+
+    async def _recover(self):
+        """
+        reconnect with backoff, log in again and resend the unanswered requests (an unanswered LOGIN gets the reply
+        of the new login instead). If every attempt fails the unanswered requests raise ConnectionError
+        """
+        self._ready.clear()
+        pending = list(self._conn.pending)
+        login_reply = None
+        for delay in backoff_delays(self.retries, self.backoff, self.max_backoff):
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+                if self._credentials is not None:
+                    login_reply = await self._login()
+                if self._room is not None:
+                    expect(await self._request_now(chatlib.join_room_msg, self._room), chatlib.room_joined_msg)
+                break
+            except (OSError, TriviaError):
+                continue
+        else:
+            await self.close()
+            for cmd, data, future in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("lost connection to %s:%d" % self.address))
+            return
+        for cmd, data, future in pending:
+            if cmd == chatlib.login_msg and login_reply is not None:
+                if not future.done():
+                    future.set_result(login_reply)
+            else:
+                self._send(cmd, data, future)
+        return
+
+    def _send(self, cmd, data, future):
+        self._conn.pending.append((cmd, data, future))
+        self._writer.write(self._conn.encode(cmd, data))
+
+    async def request(self, cmd, data=""):
+        """
+        :return: cmd, data of the reply. data is a str for protocol v1 and a list of fields for v2
+        """
+        if self._conn is None:
+            await self.connect()
+        await self._ready.wait()
+        future = asyncio.get_running_loop().create_future()
+        self._send(cmd, data, future)
+        return await future
+
+    async def pipeline(self, requests):
+        """
+        :param requests: list of (cmd, data)
+        :return: list of (cmd, data) replies, in order
+        """
+        return list(await asyncio.gather(*(self.request(cmd, data) for cmd, data in requests)))
+
+    async def _request_now(self, cmd, data=""):
+        """
+        request() without waiting for a recovery to finish (used by the recovery)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._send(cmd, data, future)
+        return await future
+
+    async def next_push(self):
+        """
+        :return: cmd, data of the oldest message pushed by the server (ROUND_QUESTION or ROUND_RESULT), waiting
+                 for one
+        """
+        return await self.pushes.get()
+
+    def _drop_pushes(self):
+        while not self.pushes.empty():
+            self.pushes.get_nowait()
+
+    async def _login_request(self):
+        reply = await self._request_now(chatlib.login_msg, self._conn.login_data(*self._credentials))
+        if self._conn.falls_back(reply):
+            self._protocol = chatlib.PROTOCOL_V1
+            reply = await self._request_now(chatlib.login_msg, self._conn.login_data(*self._credentials))
+        return reply
+
+    async def _login(self):
+        reply = await self._login_request()
+        for delay in backoff_delays(self.retries, self.backoff, self.max_backoff):
+            if reply != BUSY_REPLY:
+                break
+            await asyncio.sleep(delay)
+            reply = await self._login_request()
+        return expect(reply, chatlib.login_ok_msg)
+
+    async def login(self, username, password):
+        self._credentials = (username, password)
+        if self._conn is None:
+            await self.connect()
+        try:
+            await self._login()
+        except TriviaError:
+            self._credentials = None
+            raise
+        return
+
+    async def logout(self):
+        if self._writer is not None:
+            self._writer.write(self._conn.encode(chatlib.logout_msg, ""))
+        self._credentials = None
+        self._room = None
+        await self.close()
+        return
+
+    async def join_room(self, name):
+        cmd, data = expect(await self.request(chatlib.join_room_msg, name), chatlib.room_joined_msg)
+        self._room = name
+        self._drop_pushes()
+        return int(chatlib.data_fields(data)[1])
+
+    async def leave_room(self):
+        expect(await self.request(chatlib.leave_room_msg), chatlib.room_left_msg)
+        self._room = None
+        self._drop_pushes()
+        return
+
+    async def round_answer(self, round_number, choice):
+        expect(await self.request(chatlib.round_answer_msg, chatlib.build_answer(round_number, choice)),
+               chatlib.answer_received_msg)
+        return
+
+    async def get_question(self):
+        cmd, data = expect(await self.request(chatlib.get_question_msg), chatlib.your_question_msg,
+                           chatlib.no_questions_msg)
+        return None if cmd == chatlib.no_questions_msg else chatlib.parse_question(data)
+
+    async def get_questions(self, count):
+        cmd, data = expect(await self.request(chatlib.get_questions_msg, str(count)), chatlib.your_questions_msg,
+                           chatlib.no_questions_msg)
+        return [] if cmd == chatlib.no_questions_msg else chatlib.parse_questions(data)
+
+    async def send_answer(self, qid, choice):
+        return parse_answer_result(await self.request(chatlib.send_answer_msg, chatlib.build_answer(qid, choice)))
+
+    async def send_answers(self, answers):
+        cmd, data = expect(await self.request(chatlib.send_answers_msg, chatlib.build_answers(answers)),
+                           chatlib.answers_result_msg)
+        return chatlib.parse_answers_result(data)
+
+    async def my_score(self):
+        return int(text(expect(await self.request(chatlib.my_score_msg), chatlib.your_score_msg)[1]))
+
+    async def highscore(self, count=None, offset=None):
+        reply = await self.request(chatlib.highscore_msg, highscore_data(count, offset))
+        return text(expect(reply, chatlib.all_score_msg)[1])
+
+    async def logged_users(self):
+        users = text(expect(await self.request(chatlib.logged_msg), chatlib.logged_answer_msg)[1])
+        return users.split(", ") if users else []
@@ -0,0 +1,181 @@
+import asyncio
+import socket
+import threading
+import chatlib
+import trivia_client
+
+LOGIN_OK = [(chatlib.login_ok_msg, "")]
+SCORE = [(chatlib.your_score_msg, "3")]
+
+
+class FakeServer(threading.Thread):
+	"""
+	protocol v1 server answering one scripted connection after the other
+	"""
+
+	def __init__(self, scripts):
+		"""
+		:param scripts: a script per connection: list of (cmd, replies), replies (list of cmd, data) are sent once
+		                a message is received, None closes the connection instead
+		"""
+		super().__init__(daemon=True)
+		self.scripts = scripts
+		self.received = []  # commands received, a list per connection
+		self.listener = socket.create_server(("127.0.0.1", 0))
+		self.listener.settimeout(5)
+		self.port = self.listener.getsockname()[1]
+
+	def run(self):
+		for script in self.scripts:
+			conn, address = self.listener.accept()
+			conn.settimeout(5)
+			reader = chatlib.MessageReader()
+			received = []
+			self.received.append(received)
+			for expected, replies in script:
+				message = reader.read_message()
+				while message is None and reader.recv_from(conn):
+					message = reader.read_message()
+				if message is None:
+					break
+				received.append(message[0])
+				if replies is None:
+					break
+				for cmd, data in replies:
+					conn.sendall(chatlib.encode_message(cmd, data))
+			else:
+				while conn.recv(4096):  # until the client closes
+					pass
+			conn.close()
+		self.listener.close()
+
+
+def run_client(scripts, calls):
+	"""
+	:param calls: function getting a connected TriviaClient, returning what to check
+	:return: what calls returned, the commands the server received on every connection
+	"""
+	server = FakeServer(scripts)
+	server.start()
+	with trivia_client.TriviaClient(server_port=server.port, protocol=chatlib.PROTOCOL_V1, timeout=5,
+	                                backoff=0.01) as client:
+		output = calls(client)
+	server.join(5)
+	return output, server.received
+
+
+def run_async_client(scripts, calls):
+	"""
+	run_client with an AsyncTriviaClient, calls is a coroutine function
+	"""
+	server = FakeServer(scripts)
+	server.start()
+
+	async def run():
+		async with trivia_client.AsyncTriviaClient(server_port=server.port, protocol=chatlib.PROTOCOL_V1,
+		                                           backoff=0.01) as client:
+			return await calls(client)
+
+	output = asyncio.run(run())
+	server.join(5)
+	return output, server.received
+
+
+def check_client(run, scripts, calls, expected_output):
+	print("Input: ", scripts, "\nExpected output: ", expected_output)
+
+	try:
+		output = run(scripts, calls)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def pipelined(client):
+	client.login("user1", "pass1")
+	replies = client.pipeline([(chatlib.my_score_msg, ""), (chatlib.logged_msg, "")])
+	return replies, list(client.pushes)
+
+
+async def async_pipelined(client):
+	await client.login("user1", "pass1")
+	replies = await client.pipeline([(chatlib.my_score_msg, ""), (chatlib.logged_msg, "")])
+	return replies, [client.pushes.get_nowait() for _ in range(client.pushes.qsize())]
+
+
+def score(client):
+	client.login("user1", "pass1")
+	return client.my_score()
+
+
+async def async_score(client):
+	await client.login("user1", "pass1")
+	return await client.my_score()
+
+
+def login(client):
+	client.login("user1", "pass1")
+	return client.logged_users()
+
+
+async def async_login(client):
+	await client.login("user1", "pass1")
+	return await client.logged_users()
+
+
+def check_highscore_data(count, offset, expected_output):
+	print("Input: ", count, offset, "\nExpected output: ", expected_output)
+
+	try:
+		output = trivia_client.highscore_data(count, offset)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	# HIGHSCORE
+	check_highscore_data(None, None, "")
+	check_highscore_data(5, None, "5")
+	check_highscore_data(5, 10, "10#5")
+	# An offset alone would be read as a count
+	check_highscore_data(None, 10, "Exception raised: highscore offset requires a count")
+
+
+	# FIFO
+	# Pipelined requests get their replies in order, a push in between is kept apart
+	pipeline_script = [[(chatlib.login_msg, LOGIN_OK),
+	                    (chatlib.my_score_msg, [(chatlib.round_result_msg, "1#2#1#1")] + SCORE),
+	                    (chatlib.logged_msg, [(chatlib.logged_answer_msg, "user1")])]]
+	pipeline_output = (([(chatlib.your_score_msg, "3"), (chatlib.logged_answer_msg, "user1")],
+	                    [(chatlib.round_result_msg, "1#2#1#1")]),
+	                   [[chatlib.login_msg, chatlib.my_score_msg, chatlib.logged_msg]])
+	check_client(run_client, pipeline_script, pipelined, pipeline_output)
+	check_client(run_async_client, pipeline_script, async_pipelined, pipeline_output)
+
+	# RECONNECT
+	# A request the server didn't answer is resent after logging in again
+	lost_request = [[(chatlib.login_msg, LOGIN_OK), (chatlib.my_score_msg, None)],
+	                [(chatlib.login_msg, LOGIN_OK), (chatlib.my_score_msg, SCORE)]]
+	lost_request_output = (3, [[chatlib.login_msg, chatlib.my_score_msg], [chatlib.login_msg, chatlib.my_score_msg]])
+	check_client(run_client, lost_request, score, lost_request_output)
+	check_client(run_async_client, lost_request, async_score, lost_request_output)
+	# A lost LOGIN is answered by the login of the reconnect, not sent twice
+	lost_login = [[(chatlib.login_msg, None)],
+	              [(chatlib.login_msg, LOGIN_OK), (chatlib.logged_msg, [(chatlib.logged_answer_msg, "user1")])]]
+	lost_login_output = (["user1"], [[chatlib.login_msg], [chatlib.login_msg, chatlib.logged_msg]])
+	check_client(run_client, lost_login, login, lost_login_output)
+	check_client(run_async_client, lost_login, async_login, lost_login_output)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,256 @@
+import base64
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+JOURNAL_SUFFIX = ".journal"  # journal file name = users json name + suffix
+FLUSH_INTERVAL = 1.0  # max seconds a change may wait in memory before it is written to the journal
+FLUSH_THRESHOLD = 100  # number of pending users that forces an early journal write
+COMPACT_THRESHOLD = 1000  # journal records (and at least one per user) after which the journal is folded back
+HISTORY_FIELDS = ("questions_asked", "questions_answered")  # user fields holding sets of question ids
+_STOP = object()  # sentinel telling the writer thread to finish
+
+
+def journal_name(json_name):
+    return json_name + JOURNAL_SUFFIX
+
+
+def remove_journal(json_name):
+    """
+    delete the journal of the given users json (used when the users json is replaced wholesale)
+    :param json_name: users json file name
+    :return:
+    """
+    try:
+        os.remove(journal_name(json_name))
+    except FileNotFoundError:
+        pass
+    return
+
+
+def encode_history(qids):
+    """
+    pack a set of question ids into a base64 bitmap, bit i marking question id str(i).
+    Question ids that aren't non-negative integers in canonical form (e.g. "01", which would come back as "1")
+    can't be packed, such sets are stored as a sorted list
+    :param qids: set of question ids (str)
+    :return: str bitmap or list of question ids
+    """
+    if not all(qid.isdigit() and str(int(qid)) == qid for qid in qids):
+        return sorted(qids)
+    indexes = [int(qid) for qid in qids]
+    bitmap = bytearray(max(indexes) // 8 + 1 if indexes else 0)
+    for i in indexes:
+        bitmap[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bitmap).decode()
+
+
+def decode_history(value):
+    """
+    unpack question ids stored by encode_history. Lists (the format of older users files) are accepted as is
+    :param value: str bitmap or list of question ids
+    :return: set of question ids (str)
+    """
+    if isinstance(value, list):
+        return set(str(qid) for qid in value)
+    qids = set()
+    for byte_index, byte in enumerate(base64.b64decode(value)):
+        if byte:
+            qids.update(str(byte_index * 8 + bit) for bit in range(8) if byte >> bit & 1)
+    return qids
+
+
+def decode_user(record):
+    """
+    convert a stored user record to its in-memory form (question history as sets), in place
+    :param record: user dictionary as loaded from json
+    :return: record
+    """
+    for field in HISTORY_FIELDS:
+        record[field] = decode_history(record.get(field, []))
+    return record
+
+
+def encode_user(record):
+    """
+    :param record: in-memory user dictionary
+    :return: copy of record ready to be dumped to json (question history packed with encode_history)
+    """
+    encoded = dict(record)
+    for field in HISTORY_FIELDS:
+        encoded[field] = encode_history(record[field])
+    return encoded
+
+
+def load_users(json_name):
+    """
+    load users json and replay its journal on top of it
+    :param json_name: users json file name
+    :return: users dictionary
+    """
+    with open(json_name, 'r', encoding='utf-8') as f:
+        users = json.load(f)
+    try:
+        with open(journal_name(json_name), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    username, record = json.loads(line)
+                except ValueError:  # torn last line of a crashed writer
+                    break
+                users[username] = record
+    except FileNotFoundError:
+        pass
+    return users
+
+
+def write_users_atomic(json_name, users):
+    """
+    write the whole users dictionary to a temp file and rename it over json_name
+    :param json_name: users json file name
+    :param users: users dictionary
+    :return:
+    """
+    tmp_name = json_name + ".tmp"
+    with open(tmp_name, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, json_name)
+    return
+
+
+def compact(json_name):
+    """
+    fold the journal of json_name back into it. Records are copied in their stored form, without decoding them
+    :param json_name: users json file name
+    :return:
+    """
+    if not os.path.exists(journal_name(json_name)):
+        return
+    write_users_atomic(json_name, load_users(json_name))
+    remove_journal(json_name)
+    return
+
+
+class UserStore:
+    """
+    Write-behind persistence for the users dictionary.
+    The server marks users dirty when it changes them and calls commit() once per loop iteration.
+    commit() serializes only the dirty users and hands them to a background writer thread, which
+    batches them and appends them to a journal file every flush_interval seconds (or as soon as
+    flush_threshold users are pending). The journal is folded back into the users json with an
+    atomic rename once it holds compact_threshold records and at least one per user, and on close().
+    While serving, the folding runs in a child process: parsing and rewriting the whole users json
+    on the writer thread would hold the GIL and stall the server loop.
+    """
+
+    def __init__(self, json_name, flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD,
+                 compact_threshold=COMPACT_THRESHOLD):
+        self.json_name = json_name
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.compact_threshold = compact_threshold
+        self.users = {}
+        self._dirty = set()
+        self._queue = queue.Queue()
+        self._journal_records = 0
+        self._thread = None
+
+    def load(self):
+        """
+        load users (json + journal) and start the writer thread
+        :return: users dictionary
+        """
+        self.users = {username: decode_user(record) for username, record in load_users(self.json_name).items()}
+        self._thread = threading.Thread(target=self._writer, name="user-store-writer", daemon=True)
+        self._thread.start()
+        return self.users
+
+    def mark_dirty(self, username):
+        self._dirty.add(username)
+
+    def update_password(self, username, password):
+        """
+        :param password: new stored form of the user's password (passwords.hash_password)
+        """
+        self.users[username]["password"] = password
+        self._dirty.add(username)
+
+    def commit(self):
+        """
+        serialize dirty users and pass them to the writer thread. Cheap when nothing changed.
+        :return:
+        """
+        if not self._dirty:
+            return
+        batch = {username: json.dumps([username, encode_user(self.users[username])], ensure_ascii=False)
+                 for username in self._dirty if username in self.users}
+        self._dirty.clear()
+        self._queue.put(batch)
+        return
+
+    def close(self):
+        """
+        commit remaining dirty users, wait for the writer to flush them and compact the journal
+        :return:
+        """
+        self.commit()
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        return
+
+    def flush(self):
+        """
+        write every change to the users json (compacting the journal) and stop the writer thread, so another
+        process may load the users. load() starts over
+        :return:
+        """
+        self.close()
+        return
+
+    def _writer(self):
+        pending = {}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                break
+            if item:
+                pending.update(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (len(pending) >= self.flush_threshold or time.monotonic() >= deadline):
+                self._append_journal(pending)
+                pending = {}
+                deadline = None
+            if self._journal_records >= max(self.compact_threshold, len(self.users)):
+                self._compact_in_child()
+        if pending:
+            self._append_journal(pending)
+        compact(self.json_name)
+        self._journal_records = 0
+
+    def _append_journal(self, pending):
+        with open(journal_name(self.json_name), 'a', encoding='utf-8') as f:
+            f.write("\n".join(pending.values()) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += len(pending)
+
+    def _compact_in_child(self):
+        # nothing is appended to the journal meanwhile: this thread is its only writer. A failed child
+        # leaves the journal as it was, it is folded on the next try
+        child = multiprocessing.get_context("spawn").Process(target=compact, args=(self.json_name,),
+                                                             name="user-store-compact")
+        child.start()
+        child.join()
+        self._journal_records = 0
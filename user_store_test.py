@@ -0,0 +1,173 @@
+import json
+import os
+import tempfile
+import time
+import user_store
+
+USERS = {"user1": {"password": "pass1", "score": 0, "questions_asked": [], "questions_answered": []},
+         "user2": {"password": "pass2", "score": 5, "questions_asked": [], "questions_answered": []}}
+
+
+def write_users(json_name, journal_lines=None):
+	"""
+	write USERS to json_name and, if given, the raw lines of its journal
+	"""
+	with open(json_name, 'w', encoding='utf-8') as f:
+		json.dump(USERS, f)
+	user_store.remove_journal(json_name)
+	if journal_lines is not None:
+		with open(user_store.journal_name(json_name), 'w', encoding='utf-8') as f:
+			f.write("".join(journal_lines))
+
+
+def journal_record(username, score):
+	record = dict(USERS[username], score=score)
+	return json.dumps([username, record]) + "\n"
+
+
+def scores(users):
+	return {username: record["score"] for username, record in users.items()}
+
+
+def disk_state(json_name):
+	"""
+	:return: scores in the users json alone, whether the journal exists, scores of users json + journal
+	"""
+	with open(json_name, 'r', encoding='utf-8') as f:
+		return (scores(json.load(f)), os.path.exists(user_store.journal_name(json_name)),
+		        scores(user_store.load_users(json_name)))
+
+
+def wait_for(condition, timeout=2.0):
+	deadline = time.monotonic() + timeout
+	while not condition() and time.monotonic() < deadline:
+		time.sleep(0.01)
+
+
+def check_history(qids, expected_encoded, expected_output):
+	"""
+	:param expected_encoded: type of the stored form (str bitmap or list)
+	:param expected_output: question ids decoded back
+	"""
+	print("Input: ", qids, "\nExpected output: ", expected_encoded, expected_output)
+
+	try:
+		encoded = user_store.encode_history(qids)
+		output = user_store.decode_history(json.loads(json.dumps(encoded)))
+		if encoded.__class__ is not expected_encoded:
+			output = "encoded as " + str(encoded)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_decode(value, expected_output):
+	print("Input: ", value, "\nExpected output: ", expected_output)
+
+	try:
+		output = user_store.decode_history(value)
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_load(journal_lines, expected_output):
+	print("Input: ", journal_lines, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			json_name = os.path.join(tmp, "users.json")
+			write_users(json_name, journal_lines)
+			output = scores(user_store.load_users(json_name))
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def check_store(changes, compact_threshold, close, expected_output):
+	"""
+	change scores through a UserStore and check what is on disk
+	:param changes: list of (username, score), committed one at a time
+	:param close: close the store before checking
+	:param expected_output: disk_state() once the writer is done
+	"""
+	print("Input: ", changes, compact_threshold, close, "\nExpected output: ", expected_output)
+
+	try:
+		with tempfile.TemporaryDirectory() as tmp:
+			json_name = os.path.join(tmp, "users.json")
+			write_users(json_name)
+			store = user_store.UserStore(json_name, flush_interval=60, flush_threshold=1,
+			                             compact_threshold=compact_threshold)
+			users = store.load()
+			for username, score in changes:
+				users[username]["score"] = score
+				store.mark_dirty(username)
+				store.commit()
+			if close:
+				store.close()
+			else:  # flush_threshold=1: the writer appends every commit right away
+				wait_for(lambda: disk_state(json_name) == expected_output)
+			output = disk_state(json_name)
+			store.close()
+	except Exception as e:
+		output = "Exception raised: " + str(e)
+
+	if output == expected_output:
+		print(".....\t SUCCESS")
+	else:
+		print(".....\t FAILED, output: ", output)
+
+
+def main():
+
+	# HISTORY
+	# Question ids round trip through the bitmap
+	check_history({"0", "3", "8", "17"}, str, {"0", "3", "8", "17"})
+	check_history({"2"}, str, {"2"})
+	# Empty set
+	check_history(set(), str, set())
+	# Ids that aren't integers are stored as a list
+	check_history({"a1", "7"}, list, {"a1", "7"})
+	# Ids with leading zeros would be renamed by the bitmap, stored as a list
+	check_history({"01", "2"}, list, {"01", "2"})
+	# Lists of older users files are decoded as is
+	check_decode(["3", "5"], {"3", "5"})
+	check_decode([3, 5], {"3", "5"})
+	check_decode([], set())
+
+	# LOAD
+	# No journal
+	check_load(None, {"user1": 0, "user2": 5})
+	# Journal records replayed on top of the json, the last record of a user wins
+	check_load([journal_record("user1", 3), journal_record("user2", 7), journal_record("user1", 4)],
+	           {"user1": 4, "user2": 7})
+	# Torn last line of a crashed writer is ignored
+	check_load([journal_record("user1", 3), journal_record("user2", 7)[:20]], {"user1": 3, "user2": 5})
+
+	# STORE
+	# Commits are appended to the journal, the json is left as is
+	check_store([("user1", 1), ("user2", 6)], 1000, False,
+	            ({"user1": 0, "user2": 5}, True, {"user1": 1, "user2": 6}))
+	# The journal is folded into the json once it reaches compact_threshold records
+	check_store([("user1", 1), ("user2", 6)], 2, False,
+	            ({"user1": 1, "user2": 6}, False, {"user1": 1, "user2": 6}))
+	# close() writes pending changes and compacts the journal
+	check_store([("user1", 1)], 1000, True,
+	            ({"user1": 1, "user2": 5}, False, {"user1": 1, "user2": 5}))
+
+
+if __name__ == '__main__':
+	main()
@@ -1,12 +1,115 @@
+import html
+import json
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import chatlib
+
+OPENTDB_URL = "https://opentdb.com/api.php"
+QUESTIONS_JSON = "questions.json"
+BATCH_SIZE = 50  # max questions opentdb returns for one request
+MAX_WORKERS = 4  # concurrent batch requests
+MAX_RETRIES = 5  # attempts per batch while opentdb answers "rate limited"
+RETRY_DELAY = 5  # seconds, opentdb allows one request per 5 seconds per ip
+RETRY_JITTER = 5  # up to this many random seconds added to every retry, so concurrent batches don't retry in lockstep
+MAX_IDLE_ROUNDS = 3  # rounds without any new question before giving up on reaching amount
+RATE_LIMIT_CODE = 5  # opentdb response_code for too many requests
+REQUEST_TIMEOUT = 10  # seconds
+
+
+def fetch_batch(session, url, amount):
+    """
+    request one batch of raw questions
+    :param session: requests.Session
+    :param url: opentdb compatible api url
+    :param amount: number of questions to request (up to BATCH_SIZE)
+    :return: list of raw questions (dicts in opentdb's format), empty if the source failed
+    """
+    params = {"type": "multiple", "amount": amount, "difficulty": "easy"}
+    for attempt in range(MAX_RETRIES):
+        try:
+            body = session.get(url, params=params, timeout=REQUEST_TIMEOUT).json()
+        except (requests.RequestException, ValueError):
+            return []
+        if body.get("response_code") == RATE_LIMIT_CODE:  # linear backoff with jitter
+            time.sleep(RETRY_DELAY * (attempt + 1) + random.uniform(0, RETRY_JITTER))
+            continue
+        return body.get("results", [])
+    return []
+
+
+def parse_raw_question(question_raw):
+    """
+    convert an opentdb question to the questions.json format. html entities are unescaped.
+    :param question_raw: dict in opentdb's format
+    :return: question (dict), or None if the text contains the protocol's data delimiter (#)
+    """
+    question = html.unescape(question_raw["question"])
+    correct_answer = html.unescape(question_raw["correct_answer"])
+    answers = [html.unescape(a) for a in question_raw["incorrect_answers"]] + [correct_answer]
+    if any(chatlib.DATA_DELIMITER in text for text in [question] + answers):
+        return None
+    random.shuffle(answers)
+    return {"question": question, "answers": answers, "correct": answers.index(correct_answer) + 1}
+
+
+def question_key(question):
+    """
+    :param question: question (dict)
+    :return: its text normalized (case and whitespace), questions with the same key are duplicates
+    """
+    return " ".join(question["question"].casefold().split())
+
+
+def fetch_questions(amount, url=OPENTDB_URL, workers=MAX_WORKERS):
+    """
+    load amount of unique questions from an opentdb compatible api, BATCH_SIZE questions per request,
+    up to workers requests at a time over one pooled session
+    :param amount: amount of questions to be loaded
+    :param url: api url (point it at a local stand-in server to run offline)
+    :param workers: number of concurrent requests
+    :return: list of questions (dicts), may be shorter than amount if the source ran dry
+    """
+    questions = {}  # question_key -> question, to drop duplicates
+    idle_rounds = 0
+    with requests.Session() as session, ThreadPoolExecutor(workers) as pool:
+        session.mount(url, HTTPAdapter(pool_maxsize=workers))
+        while len(questions) < amount and idle_rounds < MAX_IDLE_ROUNDS:
+            missing = amount - len(questions)
+            batches = [min(BATCH_SIZE, missing - i) for i in range(0, missing, BATCH_SIZE)]
+            found = len(questions)
+            for batch in pool.map(lambda size: fetch_batch(session, url, size), batches):
+                for question_raw in batch:
+                    question = parse_raw_question(question_raw)
+                    if question is not None and len(questions) < amount:
+                        questions.setdefault(question_key(question), question)
+            idle_rounds = idle_rounds + 1 if len(questions) == found else 0
+    return list(questions.values())
 
 
-def load(amount):
+def load_fixture(amount, fixture):
     """
-    load amount of random question from opentdb.com
+    load amount of unique questions from a recorded questions json (e.g. data.json) instead of the web
     :param amount: amount of questions to be loaded
+    :param fixture: path of a json in the questions.json format
+    :return: list of questions (dicts)
+    """
+    with open(fixture, 'r', encoding='utf-8') as f:
+        recorded = {}
+        for question in json.load(f).values():
+            recorded.setdefault(question_key(question), question)
+    return random.sample(list(recorded.values()), min(amount, len(recorded)))
+
+
+def load(amount, url=OPENTDB_URL, fixture=None, questions_json=QUESTIONS_JSON):
+    """
+    load amount of random question from opentdb.com (or a stand-in url / recorded fixture) into questions_json
+    :param amount: amount of questions to be loaded
+    :param url: opentdb compatible api url
+    :param fixture: path of a recorded questions json to load from instead of url
+    :param questions_json: file to write the questions to
     :return: question (dict)
     """
     if amount < 1:
@@ -14,29 +117,17 @@ def load(amount):
         print("using 10 as default value instead")
         amount = 10
 
-    questions = dict()
-    print("Loading questions from web... This might take a few seconds")
+    print("Loading questions from", fixture or url, "... This might take a few seconds")
     print("number of questions to load:", amount)
-    i = 0
-    while len(questions) < amount:
-        url = "https://opentdb.com/api.php?type=multiple&amount=1&difficulty=easy"
-        r = requests.get(url)
-        question_raw = r.json()["results"][0]
-        # first make sure there are no special character caused by mis-encoding of html in source
-        if "#" in question_raw["question"] or "&" in question_raw["question"]:
-            continue
-        elif any(["#" in a for a in question_raw["incorrect_answers"]] + ["&" in a for a in
-                                                                          question_raw["incorrect_answers"]]):
-            continue
-        else:
-            questions[i] = dict()
-            questions[i]["question"] = question_raw["question"]
-            questions[i]["answers"] = question_raw["incorrect_answers"]
-            questions[i]["answers"].append(question_raw["correct_answer"])
-            random.shuffle(questions[i]["answers"])
-            questions[i]["correct"] = questions[i]["answers"].index(question_raw["correct_answer"]) + 1
-            i = i + 1
+    if fixture is not None:
+        loaded = load_fixture(amount, fixture)
+    else:
+        loaded = fetch_questions(amount, url)
+    if len(loaded) < amount:
+        print("source ran out of questions, loaded:", len(loaded))
+    questions = {i: question for i, question in enumerate(loaded)}
 
     print("Loading questions complete")
-    with open('questions.json', 'w', encoding='utf-8') as f:
+    with open(questions_json, 'w', encoding='utf-8') as f:
         json.dump(questions, f, ensure_ascii=False, indent=4)
+    return questions